@@ -0,0 +1,76 @@
+"""Small helpers shared by the benchmark scripts.
+
+Every benchmark is runnable from the repository root, e.g.:
+
+    $ python -m benchmarks.loader --dataset=CelebA
+"""
+from __future__ import print_function
+
+import time
+import tempfile
+import numpy as np
+
+def get_bench_config(**kwargs):
+    """Default `config.py` values with a throwaway model_dir."""
+    from config import parser
+
+    config, _ = parser.parse_known_args([])
+    config.data_format = 'NHWC'
+    config.model_dir = tempfile.mkdtemp(prefix='began_bench_')
+    for key, value in kwargs.items():
+        setattr(config, key, value)
+    return config
+
+def synthetic_images(batch_size, scale_size, channel=3):
+    import tensorflow as tf
+    return tf.random_uniform([batch_size, scale_size, scale_size, channel], 0, 255)
+
+def time_fn(fn, iters=20, warmup=3):
+    """Call `fn` `warmup` + `iters` times and return per-call seconds."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(iters):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return np.array(times)
+
+def peak_memory(run_metadata):
+    """Largest per-allocator peak in bytes recorded by a FULL_TRACE run."""
+    peaks = {}
+    for dev_stats in run_metadata.step_stats.dev_stats:
+        for node_stats in dev_stats.node_stats:
+            for memory in node_stats.memory:
+                key = (dev_stats.device, memory.allocator_name)
+                peaks[key] = max(peaks.get(key, 0), memory.peak_bytes)
+    return max(peaks.values()) if peaks else 0
+
+def traced_run(sess, fetches, feed_dict=None):
+    """Runs `fetches` once with a full trace, returns (results, peak bytes)."""
+    import tensorflow as tf
+    options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+    run_metadata = tf.RunMetadata()
+    results = sess.run(fetches, feed_dict, options=options, run_metadata=run_metadata)
+    return results, peak_memory(run_metadata)
+
+def summarize(name, times, items_per_call=None):
+    result = {
+        'name': name,
+        'mean_s': float(np.mean(times)),
+        'p50_s': float(np.percentile(times, 50)),
+        'p99_s': float(np.percentile(times, 99)),
+    }
+    if items_per_call:
+        result['items_per_s'] = items_per_call / result['mean_s']
+    return result
+
+def print_results(results):
+    for r in results:
+        line = "{:<40} mean: {:.4f}s p50: {:.4f}s p99: {:.4f}s".format(
+                r['name'], r['mean_s'], r['p50_s'], r['p99_s'])
+        if 'items_per_s' in r:
+            line += " ({:.1f} items/s)".format(r['items_per_s'])
+        if 'peak_bytes' in r:
+            line += " peak: {:.1f}MB".format(r['peak_bytes'] / 2.**20)
+        print(line)
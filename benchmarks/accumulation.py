@@ -0,0 +1,56 @@
+"""Step time of --accum_steps K on batches of B against one batch of B * K.
+
+That both give the same update is checked by tests/test_accumulation.py.
+
+    $ python -m benchmarks.accumulation --batch_size=2 --accum_steps=4
+"""
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from trainer import Trainer
+from benchmarks import get_bench_config, time_fn, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=2)
+parser.add_argument('--accum_steps', type=int, default=4)
+parser.add_argument('--input_scale_size', type=int, default=16)
+parser.add_argument('--conv_hidden_num', type=int, default=8)
+parser.add_argument('--z_num', type=int, default=8)
+parser.add_argument('--iters', type=int, default=10)
+
+def build(args, batch_size, accum_steps):
+    graph = tf.Graph()
+    with graph.as_default():
+        config = get_bench_config(
+                batch_size=batch_size, input_scale_size=args.input_scale_size,
+                conv_hidden_num=args.conv_hidden_num, z_num=args.z_num,
+                use_gpu=False, accum_steps=accum_steps)
+        images = tf.placeholder(tf.float32, [batch_size, args.input_scale_size, args.input_scale_size, 3])
+        trainer = Trainer(config, images)
+    return trainer, images
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    rng = np.random.RandomState(123)
+    big_batch = args.batch_size * args.accum_steps
+
+    large, large_images = build(args, big_batch, 1)
+    small, small_images = build(args, args.batch_size, args.accum_steps)
+
+    x = rng.uniform(0, 255, [big_batch, args.input_scale_size, args.input_scale_size, 3])
+    z = rng.uniform(-1, 1, [big_batch, args.z_num])
+
+    def accumulated_step():
+        for _ in range(args.accum_steps - 1):
+            small.sess.run(small.accum_op, {small_images: x[:args.batch_size], small.z: z[:args.batch_size]})
+        small.sess.run(small.k_update, {small_images: x[:args.batch_size], small.z: z[:args.batch_size]})
+
+    print_results([
+        summarize('batch {}'.format(big_batch), time_fn(
+                lambda: large.sess.run(large.k_update, {large_images: x, large.z: z}), args.iters), big_batch),
+        summarize('batch {} x {} accumulated'.format(args.batch_size, args.accum_steps),
+                  time_fn(accumulated_step, args.iters), big_batch),
+    ])
@@ -0,0 +1,36 @@
+"""Scaling of distributed training over local worker processes.
+
+The cluster shares one global `step`, so every run does `max_step`
+updates in total. Throughput includes session start-up, so use a
+`max_step` large enough to dwarf it.
+
+    $ python -m benchmarks.distributed --workers=1,2,4 -- --dataset=CelebA --use_gpu=False
+"""
+from __future__ import print_function
+
+import argparse
+
+from distributed import launch
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', type=str, default='1,2,4')
+parser.add_argument('--num_ps', type=int, default=1)
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--max_step', type=int, default=500)
+parser.add_argument('--log_dir', type=str, default='logs/bench_distributed')
+
+if __name__ == "__main__":
+    args, main_args = parser.parse_known_args()
+    if main_args and main_args[0] == '--':
+        main_args = main_args[1:]
+    main_args = main_args + ['--batch_size={}'.format(args.batch_size),
+                             '--max_step={}'.format(args.max_step)]
+
+    base = None
+    for num_workers in [int(n) for n in args.workers.split(',')]:
+        elapsed = launch(args.num_ps, num_workers, main_args,
+                         '{}/{}_workers'.format(args.log_dir, num_workers))
+        images_per_s = args.max_step * args.batch_size / elapsed
+        base = base or images_per_s
+        print("{} worker(s): {:.1f}s {:.1f} images/s (x{:.2f})".format(
+                num_workers, elapsed, images_per_s, images_per_s / base))
@@ -0,0 +1,64 @@
+"""make_grid and image saving for grids up to 16x16 tiles of 128px."""
+from __future__ import print_function
+
+import os
+import argparse
+import tempfile
+import numpy as np
+
+from utils import make_grid, save_image, save_images
+from benchmarks import time_fn, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--scale_size', type=int, default=128)
+parser.add_argument('--grids', type=str, default='4,8,16')
+parser.add_argument('--num_files', type=int, default=16)
+parser.add_argument('--num_worker', type=int, default=4)
+parser.add_argument('--iters', type=int, default=10)
+
+def make_grid_loop(tensor, nrow=8, padding=2):
+    """The previous per-tile implementation, kept as the baseline."""
+    nmaps = tensor.shape[0]
+    xmaps = min(nrow, nmaps)
+    ymaps = int(np.ceil(float(nmaps) / xmaps))
+    height, width = int(tensor.shape[1] + padding), int(tensor.shape[2] + padding)
+    grid = np.zeros([height * ymaps + 1 + padding // 2, width * xmaps + 1 + padding // 2, 3], dtype=np.uint8)
+    k = 0
+    for y in range(ymaps):
+        for x in range(xmaps):
+            if k >= nmaps:
+                break
+            h, h_width = y * height + 1 + padding // 2, height - padding
+            w, w_width = x * width + 1 + padding // 2, width - padding
+
+            grid[h:h+h_width, w:w+w_width] = tensor[k]
+            k = k + 1
+    return grid
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    out_dir = tempfile.mkdtemp(prefix='began_grid_')
+
+    results = []
+    for n in [int(n) for n in args.grids.split(',')]:
+        images = np.random.uniform(0, 255, [n * n, args.scale_size, args.scale_size, 3]).astype(np.float32)
+        assert np.array_equal(make_grid_loop(images, nrow=n), make_grid(images, nrow=n))
+
+        name = '{0}x{0}'.format(n)
+        results.append(summarize('make_grid loop ' + name,
+                                 time_fn(lambda: make_grid_loop(images, nrow=n), args.iters)))
+        results.append(summarize('make_grid vectorized ' + name,
+                                 time_fn(lambda: make_grid(images, nrow=n), args.iters)))
+        for compress_level in [1, 6]:
+            path = os.path.join(out_dir, 'grid.png')
+            results.append(summarize('save png level {} {}'.format(compress_level, name), time_fn(
+                    lambda: save_image(images, path, nrow=n, compress_level=compress_level), args.iters)))
+        results.append(summarize('save jpg {}'.format(name), time_fn(
+                lambda: save_image(images, os.path.join(out_dir, 'grid.jpg'), nrow=n), args.iters)))
+
+        items = [(images, os.path.join(out_dir, 'grid_{}.png'.format(idx))) for idx in range(args.num_files)]
+        for num_worker in [1, args.num_worker]:
+            results.append(summarize('save_images {} x {} worker(s) {}'.format(args.num_files, num_worker, name),
+                                     time_fn(lambda: save_images(items, num_worker, nrow=n), max(1, args.iters // 5)),
+                                     args.num_files))
+    print_results(results)
@@ -0,0 +1,54 @@
+"""Wall time and reconstruction loss of the z_r loop against the InversionEngine.
+
+Both are scored with the same L1 loss between G(z) and the images in
+[-1, 1]. Without --load_path the weights are random, which still times
+the two fairly but makes the losses meaningless.
+"""
+from __future__ import print_function
+
+import time
+import argparse
+import numpy as np
+
+from trainer import Trainer
+from benchmarks import get_bench_config, synthetic_images
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--input_scale_size', type=int, default=64)
+parser.add_argument('--conv_hidden_num', type=int, default=64)
+parser.add_argument('--model_dir', type=str, default='')
+parser.add_argument('--loop_iters', type=int, default=500)
+parser.add_argument('--restarts', type=int, default=4)
+parser.add_argument('--iters', type=int, default=500)
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    options = dict(
+            batch_size=args.batch_size, input_scale_size=args.input_scale_size,
+            conv_hidden_num=args.conv_hidden_num, use_gpu=False, is_train=False,
+            inversion_mode='engine', inversion_restarts=args.restarts, inversion_iters=args.iters)
+    if args.model_dir:
+        options['model_dir'] = args.model_dir
+    config = get_bench_config(**options)
+
+    trainer = Trainer(config, synthetic_images(args.batch_size, args.input_scale_size))
+    images = trainer.get_image_from_loader()
+
+    start = time.time()
+    trainer.sess.run(trainer.z_r_update)
+    for _ in range(args.loop_iters):
+        trainer.sess.run(trainer.z_r_optim, {trainer.x: images})
+    loop_time = time.time() - start
+    loop_loss = trainer.inversion.reconstruction_loss(trainer.sess, trainer.sess.run(trainer.z_r), images)
+
+    start = time.time()
+    z, engine_loss, iterations = trainer.inversion.invert(trainer.sess, images)
+    engine_time = time.time() - start
+    check_loss = trainer.inversion.reconstruction_loss(trainer.sess, z, images)
+
+    print("{:<40} {:.2f}s loss: {:.4f}".format(
+            'z_r loop {} iters'.format(args.loop_iters), loop_time, np.mean(loop_loss)))
+    print("{:<40} {:.2f}s loss: {:.4f} ({} iters, {:.4f} recomputed)".format(
+            'engine {} restarts'.format(args.restarts), engine_time, np.mean(engine_loss),
+            iterations, np.mean(check_loss)))
@@ -0,0 +1,75 @@
+"""Throughput of the queue-runner loader against the tf.data loader.
+
+With --auto_tune the queue loader also runs with the reader auto-tuner,
+sampled by an InputMonitor every --metrics_every batches.
+"""
+from __future__ import print_function
+
+import os
+import argparse
+import tempfile
+import tensorflow as tf
+
+from data_loader import get_loader
+from profiling import StepProfiler
+from input_metrics import InputMonitor
+from benchmarks import time_fn, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_dir', type=str, default='data')
+parser.add_argument('--dataset', type=str, default='CelebA')
+parser.add_argument('--split', type=str, default='train')
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--input_scale_size', type=int, default=64)
+parser.add_argument('--num_worker', type=int, default=4)
+parser.add_argument('--shuffle_buffer', type=int, default=5000)
+parser.add_argument('--prefetch_size', type=int, default=2)
+parser.add_argument('--iters', type=int, default=200)
+parser.add_argument('--auto_tune', type=str, default='false')
+parser.add_argument('--max_num_worker', type=int, default=16)
+parser.add_argument('--metrics_every', type=int, default=10)
+
+def bench_loader(config, loader_type, auto_tune=False):
+    with tf.Graph().as_default():
+        x = get_loader(
+                os.path.join(config.data_dir, config.dataset), config.batch_size,
+                config.input_scale_size, 'NHWC', config.split,
+                loader_type=loader_type, num_worker=config.num_worker,
+                shuffle_buffer=config.shuffle_buffer, prefetch_size=config.prefetch_size,
+                auto_tune=auto_tune, max_num_worker=config.max_num_worker)
+        out_dir = tempfile.mkdtemp()
+        monitor = InputMonitor(config.batch_size, os.path.join(out_dir, 'input_metrics.jsonl'),
+                               config.metrics_every if auto_tune else 0)
+        profiler = StepProfiler(out_dir)
+        steps = [0]
+
+        with tf.Session() as sess:
+            coord = tf.train.Coordinator()
+            threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+
+            def run():
+                steps[0] += 1
+                return monitor.run(sess, {'x': x}, steps[0], profiler)
+
+            # the first batch includes filling the shuffle buffer
+            startup = time_fn(run, iters=1, warmup=0)
+            times = time_fn(run, iters=config.iters)
+
+            coord.request_stop()
+            coord.join(threads)
+
+    if auto_tune:
+        loader_type += ' autotune'
+    return [
+        summarize('{} first batch'.format(loader_type), startup),
+        summarize('{} steady state'.format(loader_type), times, config.batch_size),
+    ]
+
+if __name__ == "__main__":
+    config, _ = parser.parse_known_args()
+    results = []
+    for loader_type in ['queue', 'dataset']:
+        results.extend(bench_loader(config, loader_type))
+    if config.auto_tune.lower() in ('true', '1'):
+        results.extend(bench_loader(config, 'queue', auto_tune=True))
+    print_results(results)
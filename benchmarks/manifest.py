@@ -0,0 +1,64 @@
+"""Startup listing cost: glob + PIL probe against a cold and a warm manifest.
+
+Uses --data_path when given, otherwise writes --num_images small jpgs
+into a temporary directory.
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from glob import glob
+from PIL import Image
+
+import manifest
+from benchmarks import time_fn, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_path', type=str, default='')
+parser.add_argument('--num_images', type=int, default=2000)
+parser.add_argument('--iters', type=int, default=5)
+
+def make_images(out_dir, num_images):
+    image = Image.fromarray(np.random.randint(0, 255, size=(218, 178, 3), dtype=np.uint8))
+    for idx in range(num_images):
+        image.save(os.path.join(out_dir, '{:06d}.jpg'.format(idx)))
+
+def glob_and_probe(root):
+    paths = glob("{}/*.jpg".format(root))
+    with Image.open(paths[0]) as img:
+        return paths, img.size
+
+def remove_manifest(root):
+    path = manifest.Manifest(root).path
+    if os.path.exists(path):
+        os.remove(path)
+
+def load_manifest(root, cold):
+    manifest._MANIFESTS.clear()
+    if cold:
+        remove_manifest(root)
+    paths = manifest.find_images(root)
+    return paths, manifest.image_size(paths[0])
+
+if __name__ == "__main__":
+    config, _ = parser.parse_known_args()
+    root = config.data_path
+    if not root:
+        root = tempfile.mkdtemp(prefix='began_manifest_')
+        make_images(root, config.num_images)
+
+    try:
+        results = [
+            summarize('glob + probe', time_fn(lambda: glob_and_probe(root), iters=config.iters, warmup=1)),
+            summarize('manifest cold', time_fn(lambda: load_manifest(root, True), iters=config.iters, warmup=0)),
+            summarize('manifest warm', time_fn(lambda: load_manifest(root, False), iters=config.iters, warmup=1)),
+        ]
+        print_results(results)
+    finally:
+        if not config.data_path:
+            # the manifest is written next to the directory
+            remove_manifest(root)
+            shutil.rmtree(root)
@@ -0,0 +1,33 @@
+"""Post-train steps/sec with host-side parent encoding against the in-graph version."""
+from __future__ import print_function
+
+import argparse
+import tensorflow as tf
+
+from trainer import Trainer
+from benchmarks import get_bench_config, synthetic_images, time_fn, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=4)
+parser.add_argument('--input_scale_size', type=int, default=64)
+parser.add_argument('--conv_hidden_num', type=int, default=64)
+parser.add_argument('--iters', type=int, default=20)
+
+def bench_post_train(args, in_graph):
+    with tf.Graph().as_default():
+        config = get_bench_config(
+                batch_size=args.batch_size, input_scale_size=args.input_scale_size,
+                conv_hidden_num=args.conv_hidden_num, use_gpu=False,
+                is_posttrain=True, posttrain_in_graph=in_graph)
+        triplet = tuple(synthetic_images(args.batch_size, args.input_scale_size) for _ in range(3))
+        trainer = Trainer(config, triplet[0], triplet)
+
+        times = time_fn(trainer.post_train_step, iters=args.iters)
+        trainer.sess.close()
+
+    name = 'post_train {}'.format('in-graph' if in_graph else 'feed_dict')
+    return summarize(name, times, 1)
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    print_results([bench_post_train(args, in_graph) for in_graph in [False, True]])
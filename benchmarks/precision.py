@@ -0,0 +1,43 @@
+"""Train step time and peak memory of float32 against float16 / bfloat16.
+
+bfloat16 has no CPU kernels in the pinned TensorFlow and is rejected
+without --use_gpu, float16 runs on CPU but needs a GPU to be faster.
+"""
+from __future__ import print_function
+
+import argparse
+import tensorflow as tf
+
+from trainer import Trainer
+from config import str2bool
+from benchmarks import get_bench_config, synthetic_images, time_fn, traced_run, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=4)
+parser.add_argument('--sizes', type=str, default='64,128')
+parser.add_argument('--conv_hidden_num', type=int, default=128)
+parser.add_argument('--precisions', type=str, default='float32,float16')
+parser.add_argument('--use_gpu', type=str2bool, default=False)
+parser.add_argument('--iters', type=int, default=10)
+
+def bench_precision(args, scale_size, precision):
+    with tf.Graph().as_default():
+        config = get_bench_config(
+                batch_size=args.batch_size, input_scale_size=scale_size,
+                conv_hidden_num=args.conv_hidden_num, use_gpu=args.use_gpu, precision=precision)
+        trainer = Trainer(config, synthetic_images(args.batch_size, scale_size))
+
+        fetches = [trainer.k_update, trainer.measure]
+        times = time_fn(lambda: trainer.sess.run(fetches), iters=args.iters)
+        _, peak_bytes = traced_run(trainer.sess, fetches)
+        trainer.sess.close()
+
+    result = summarize('train {}px {}'.format(scale_size, precision), times, args.batch_size)
+    result['peak_bytes'] = peak_bytes
+    return result
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    print_results([bench_precision(args, int(size), precision)
+                   for size in args.sizes.split(',')
+                   for precision in args.precisions.split(',')])
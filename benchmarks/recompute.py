@@ -0,0 +1,39 @@
+"""Peak memory and step time of the training step with and without --recompute."""
+from __future__ import print_function
+
+import argparse
+import tensorflow as tf
+
+from trainer import Trainer
+from config import str2bool
+from benchmarks import get_bench_config, synthetic_images, time_fn, traced_run, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=4)
+parser.add_argument('--sizes', type=str, default='128,256')
+parser.add_argument('--conv_hidden_num', type=int, default=128)
+parser.add_argument('--use_gpu', type=str2bool, default=False)
+parser.add_argument('--iters', type=int, default=5)
+
+def bench_recompute(args, scale_size, recompute):
+    with tf.Graph().as_default():
+        config = get_bench_config(
+                batch_size=args.batch_size, input_scale_size=scale_size,
+                conv_hidden_num=args.conv_hidden_num, use_gpu=args.use_gpu, recompute=recompute)
+        trainer = Trainer(config, synthetic_images(args.batch_size, scale_size))
+
+        fetches = [trainer.k_update, trainer.measure]
+        times = time_fn(lambda: trainer.sess.run(fetches), iters=args.iters, warmup=1)
+        _, peak_bytes = traced_run(trainer.sess, fetches)
+        trainer.sess.close()
+
+    name = 'train {}px {}'.format(scale_size, 'recompute' if recompute else 'stored')
+    result = summarize(name, times, args.batch_size)
+    result['peak_bytes'] = peak_bytes
+    return result
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    print_results([bench_recompute(args, int(size), recompute)
+                   for size in args.sizes.split(',')
+                   for recompute in [False, True]])
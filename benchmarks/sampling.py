@@ -0,0 +1,61 @@
+"""Wall time of a sample step (training run + sampling) for every --sample_mode."""
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from trainer import Trainer
+from utils import BackgroundWriter
+from benchmarks import get_bench_config, synthetic_images, time_fn, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--input_scale_size', type=int, default=64)
+parser.add_argument('--conv_hidden_num', type=int, default=64)
+parser.add_argument('--iters', type=int, default=10)
+
+def bench_sampling(args, sample_mode):
+    with tf.Graph().as_default():
+        config = get_bench_config(
+                batch_size=args.batch_size, input_scale_size=args.input_scale_size,
+                conv_hidden_num=args.conv_hidden_num, use_gpu=False, sample_mode=sample_mode)
+        trainer = Trainer(config, synthetic_images(args.batch_size, args.input_scale_size))
+        trainer.writer = BackgroundWriter(config.writer_queue_size)
+
+        z_fixed = np.random.uniform(-1, 1, size=(args.batch_size, trainer.z_num))
+        x_fixed = trainer.get_image_from_loader()
+
+        fetches = [trainer.k_update, trainer.measure]
+        if sample_mode != 'separate':
+            fetches.append(trainer.image_summary_op)
+        if sample_mode == 'reuse':
+            fetches += [trainer.G, trainer.AE_G, trainer.AE_x]
+
+        def step():
+            result = dict(zip(['k_update', 'measure', 'image_summary', 'G', 'AE_G', 'AE_x'],
+                              trainer.sess.run(fetches)))
+            trainer.sample(0, z_fixed, x_fixed, result)
+
+        times = time_fn(step, iters=args.iters)
+        # includes the writes still pending in the queue
+        trainer.writer.close()
+        trainer.sess.close()
+
+    return summarize('sample step {}'.format(sample_mode), times, 1)
+
+def bench_train_step(args):
+    with tf.Graph().as_default():
+        config = get_bench_config(
+                batch_size=args.batch_size, input_scale_size=args.input_scale_size,
+                conv_hidden_num=args.conv_hidden_num, use_gpu=False)
+        trainer = Trainer(config, synthetic_images(args.batch_size, args.input_scale_size))
+        times = time_fn(lambda: trainer.sess.run([trainer.k_update, trainer.measure]), iters=args.iters)
+        trainer.sess.close()
+    return summarize('train step', times, 1)
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    results = [bench_train_step(args)]
+    results += [bench_sampling(args, mode) for mode in ['separate', 'fused', 'reuse']]
+    print_results(results)
@@ -0,0 +1,58 @@
+"""Local load test of server.py: concurrent clients against one micro-batching server."""
+from __future__ import print_function
+
+import json
+import time
+import argparse
+import threading
+import numpy as np
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--input_scale_size', type=int, default=64)
+parser.add_argument('--conv_hidden_num', type=int, default=64)
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--clients', type=int, default=16)
+parser.add_argument('--requests', type=int, default=20)
+parser.add_argument('--max_batch_size', type=int, default=64)
+parser.add_argument('--max_latency_ms', type=float, default=10)
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+
+    from inference import Inference
+    from server import serve, Client
+    from benchmarks import get_bench_config
+    from benchmarks.startup import make_checkpoint
+
+    model_dir = make_checkpoint(args)
+    config = get_bench_config(
+            input_scale_size=args.input_scale_size, conv_hidden_num=args.conv_hidden_num,
+            is_train=False, model_dir=model_dir)
+    model = Inference(config, batch_size=args.max_batch_size)
+
+    httpd = serve(model, port=0, max_batch_size=args.max_batch_size,
+                  max_latency_ms=args.max_latency_ms)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    client = Client(port=httpd.server_address[1])
+
+    def run_client():
+        for _ in range(args.requests):
+            result = client.generate(n=1)
+            images = np.array(result['images'])
+            codes = client.encode(images.tolist())['z']
+            client.interpolate(codes, codes, [0., 0.5, 1.])
+
+    start = time.time()
+    threads = [threading.Thread(target=run_client) for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    print("[*] {} clients x {} rounds in {:.2f}s".format(args.clients, args.requests, elapsed))
+    print(json.dumps(client.metrics(), indent=4, sort_keys=True))
+    httpd.shutdown()
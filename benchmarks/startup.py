@@ -0,0 +1,95 @@
+"""Cold start, peak resident memory and per-batch latency of every engine.
+
+Trainer restores the full training graph, Inference restores only G and
+D, and frozen runs the graphs written by export.py. Each engine is started
+in a fresh process so the memory numbers do not overlap. A throwaway
+checkpoint and its frozen export are created first.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--input_scale_size', type=int, default=64)
+parser.add_argument('--conv_hidden_num', type=int, default=128)
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--model_dir', type=str, default='')
+parser.add_argument('--engine', type=str, default='', choices=['', 'trainer', 'inference', 'frozen'])
+parser.add_argument('--iters', type=int, default=20)
+
+ENGINES = ['trainer', 'inference', 'frozen']
+
+def make_checkpoint(args):
+    import tensorflow as tf
+    from trainer import Trainer
+    from benchmarks import get_bench_config, synthetic_images
+
+    config = get_bench_config(
+            input_scale_size=args.input_scale_size, conv_hidden_num=args.conv_hidden_num,
+            batch_size=args.batch_size, use_gpu=False)
+    trainer = Trainer(config, synthetic_images(args.batch_size, args.input_scale_size))
+    trainer.saver.save(trainer.sess, os.path.join(config.model_dir, 'model.ckpt'), global_step=0)
+    trainer.sess.close()
+
+    with tf.Graph().as_default():
+        from export import export_frozen
+        export_frozen(config)
+    return config.model_dir
+
+def start_engine(args):
+    start = time.time()
+
+    import tensorflow as tf
+    from benchmarks import get_bench_config, synthetic_images
+
+    config = get_bench_config(
+            input_scale_size=args.input_scale_size, conv_hidden_num=args.conv_hidden_num,
+            batch_size=args.batch_size, use_gpu=False, is_train=False)
+    config.model_dir = args.model_dir
+
+    if args.engine == 'inference':
+        from inference import Inference
+        model = Inference(config)
+    elif args.engine == 'frozen':
+        from export import FrozenModel
+        model = FrozenModel(config)
+    else:
+        from trainer import Trainer
+        model = Trainer(config, synthetic_images(args.batch_size, args.input_scale_size))
+
+    elapsed = time.time() - start
+    # ru_maxrss is in kilobytes on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+    import numpy as np
+    from benchmarks import time_fn
+
+    z = np.random.uniform(-1, 1, size=(args.batch_size, config.z_num))
+    if args.engine == 'trainer':
+        generate = lambda: model.generate(z, save=False)
+    else:
+        generate = lambda: model.generate(z)
+    latency = np.mean(time_fn(generate, iters=args.iters))
+
+    print(json.dumps({'engine': args.engine, 'startup_s': elapsed,
+                      'max_rss_mb': max_rss, 'generate_batch_s': latency}))
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    if args.engine:
+        start_engine(args)
+    else:
+        model_dir = make_checkpoint(args)
+        for engine in ENGINES:
+            output = subprocess.check_output(
+                    [sys.executable, '-m', 'benchmarks.startup', '--engine', engine,
+                     '--model_dir', model_dir] + sys.argv[1:])
+            result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+            print("{engine:<10} startup: {startup_s:.2f}s max rss: {max_rss_mb:.0f}MB "
+                  "generate: {generate_batch_s:.4f}s/batch".format(**result))
@@ -0,0 +1,186 @@
+"""CPU benchmark suite with JSON output and regression checks.
+
+Times the BEGAN train step (both optimizers and `k_update`), encode,
+decode, generate, make_grid / save_image and the input loaders on
+synthetic data, for every combination of --sizes, --hidden_nums and
+--batch_sizes. Nothing but a CPU is needed.
+
+    $ python -m benchmarks.suite --output=bench.json
+    $ python -m benchmarks.suite --baseline=bench.json --threshold=0.1
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import shutil
+import socket
+import platform
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+
+from benchmarks import get_bench_config, synthetic_images, time_fn, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', type=str, default='32,64,128')
+parser.add_argument('--hidden_nums', type=str, default='64,128')
+parser.add_argument('--batch_sizes', type=str, default='4,16')
+parser.add_argument('--ops', type=str, default='train,encode,decode,generate,grid,loader')
+parser.add_argument('--iters', type=int, default=10)
+parser.add_argument('--num_worker', type=int, default=4)
+parser.add_argument('--seed', type=int, default=123)
+parser.add_argument('--output', type=str, default='',
+                    help='write the results as json to this path')
+parser.add_argument('--baseline', type=str, default='',
+                    help='json written by an earlier run to compare against')
+parser.add_argument('--threshold', type=float, default=0.1,
+                    help='relative slowdown of the mean time reported as a regression')
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def bench_model(args, scale_size, hidden_num, batch_size, ops):
+    import tensorflow as tf
+    from trainer import Trainer
+
+    tag = '{}px/h{}/b{}'.format(scale_size, hidden_num, batch_size)
+    results = []
+    with tf.Graph().as_default():
+        tf.set_random_seed(args.seed)
+        config = get_bench_config(
+                batch_size=batch_size, input_scale_size=scale_size,
+                conv_hidden_num=hidden_num, use_gpu=False)
+        trainer = Trainer(config, synthetic_images(batch_size, scale_size))
+
+        rng = np.random.RandomState(args.seed)
+        images = rng.uniform(0, 255, [batch_size, scale_size, scale_size, 3]).astype(np.float32)
+        z = rng.uniform(-1, 1, [batch_size, trainer.z_num]).astype(np.float32)
+
+        fns = {
+            'train': lambda: trainer.sess.run([trainer.k_update, trainer.measure]),
+            'encode': lambda: trainer.encode_codes(images),
+            'decode': lambda: trainer.decode_codes(z),
+            'generate': lambda: trainer.generate(z, save=False),
+        }
+        for op in ['train', 'encode', 'decode', 'generate']:
+            if op in ops:
+                results.append(summarize('{}/{}'.format(op, tag), time_fn(fns[op], args.iters), batch_size))
+        trainer.sess.close()
+        shutil.rmtree(config.model_dir, ignore_errors=True)
+    return results
+
+def bench_grid(args, scale_size, batch_size):
+    from utils import make_grid, save_image
+
+    tag = '{}px/b{}'.format(scale_size, batch_size)
+    images = np.random.RandomState(args.seed).uniform(
+            0, 255, [batch_size, scale_size, scale_size, 3]).astype(np.float32)
+    out_dir = tempfile.mkdtemp(prefix='began_bench_grid_')
+    try:
+        return [
+            summarize('make_grid/' + tag, time_fn(lambda: make_grid(images), args.iters)),
+            summarize('save_image/' + tag, time_fn(
+                    lambda: save_image(images, os.path.join(out_dir, 'grid.png')), args.iters)),
+        ]
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+def make_dataset(root, num_images, size, seed):
+    from PIL import Image
+
+    if not os.path.exists(root):
+        os.makedirs(root)
+    rng = np.random.RandomState(seed)
+    for idx in range(num_images):
+        image = rng.randint(0, 256, [size, size, 3]).astype(np.uint8)
+        Image.fromarray(image).save(os.path.join(root, '{:05d}.jpg'.format(idx)))
+
+def bench_loader(args, scale_size, batch_size):
+    import tensorflow as tf
+    from data_loader import get_loader
+
+    tag = '{}px/b{}'.format(scale_size, batch_size)
+    data_dir = tempfile.mkdtemp(prefix='began_bench_data_')
+    root = os.path.join(data_dir, 'synthetic')
+    make_dataset(root, max(256, batch_size * 4), scale_size, args.seed)
+
+    results = []
+    try:
+        for loader_type in ['queue', 'dataset']:
+            with tf.Graph().as_default():
+                x = get_loader(root, batch_size, scale_size, 'NHWC', seed=args.seed,
+                               loader_type=loader_type, num_worker=args.num_worker,
+                               shuffle_buffer=128)
+                with tf.Session() as sess:
+                    coord = tf.train.Coordinator()
+                    threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+                    times = time_fn(lambda: sess.run(x), args.iters)
+                    coord.request_stop()
+                    coord.join(threads)
+            results.append(summarize('loader_{}/{}'.format(loader_type, tag), times, batch_size))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+def get_meta():
+    import tensorflow as tf
+    return {
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'tensorflow': tf.__version__,
+        'numpy': np.__version__,
+        'cpu_count': multiprocessing.cpu_count(),
+        'argv': sys.argv[1:],
+    }
+
+def run_suite(args):
+    ops = args.ops.split(',')
+    results = []
+    for scale_size in int_list(args.sizes):
+        for batch_size in int_list(args.batch_sizes):
+            for hidden_num in int_list(args.hidden_nums):
+                results += bench_model(args, scale_size, hidden_num, batch_size, ops)
+            if 'grid' in ops:
+                results += bench_grid(args, scale_size, batch_size)
+            if 'loader' in ops:
+                results += bench_loader(args, scale_size, batch_size)
+    return results
+
+def compare(results, baseline, threshold):
+    """Returns the names of the results slower than `baseline` by more than `threshold`."""
+    base = {r['name']: r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        if r['name'] not in base:
+            continue
+        ratio = r['mean_s'] / base[r['name']]['mean_s']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(r['name'])
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        print("{:<40} {:.4f}s -> {:.4f}s x{:.2f} {}".format(
+                r['name'], base[r['name']]['mean_s'], r['mean_s'], ratio, flag))
+    return regressions
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    results = run_suite(args)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'meta': get_meta(), 'results': results}, fp, indent=4, sort_keys=True)
+        print("[*] Results saved: {}".format(args.output))
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("[!] {} regression(s) over {:.0f}%".format(len(regressions), args.threshold * 100))
+            sys.exit(1)
@@ -0,0 +1,40 @@
+"""Training images/sec with the batch split across 1, 2 and 4 towers.
+
+Without GPUs every tower gets its own CPU device, so this mostly shows the
+overhead of the split / gradient averaging. On a multi-GPU host run it
+with --use_gpu=True.
+"""
+from __future__ import print_function
+
+import argparse
+import tensorflow as tf
+
+from trainer import Trainer
+from config import str2bool
+from benchmarks import get_bench_config, synthetic_images, time_fn, summarize, print_results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--input_scale_size', type=int, default=64)
+parser.add_argument('--conv_hidden_num', type=int, default=64)
+parser.add_argument('--towers', type=str, default='1,2,4')
+parser.add_argument('--use_gpu', type=str2bool, default=False)
+parser.add_argument('--iters', type=int, default=20)
+
+def bench_towers(args, num_towers):
+    with tf.Graph().as_default():
+        config = get_bench_config(
+                batch_size=args.batch_size, input_scale_size=args.input_scale_size,
+                conv_hidden_num=args.conv_hidden_num, use_gpu=args.use_gpu,
+                num_towers=num_towers)
+        trainer = Trainer(config, synthetic_images(args.batch_size, args.input_scale_size))
+
+        times = time_fn(lambda: trainer.sess.run([trainer.k_update, trainer.measure]),
+                        iters=args.iters)
+        trainer.sess.close()
+
+    return summarize('train {} tower(s)'.format(num_towers), times, args.batch_size)
+
+if __name__ == "__main__":
+    args, _ = parser.parse_known_args()
+    print_results([bench_towers(args, int(n)) for n in args.towers.split(',')])
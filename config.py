@@ -29,11 +29,26 @@ data_arg.add_argument('--split', type=str, default='train')
 data_arg.add_argument('--batch_size', type=int, default=16)
 data_arg.add_argument('--grayscale', type=str2bool, default=False)
 data_arg.add_argument('--num_worker', type=int, default=4)
+data_arg.add_argument('--loader_type', type=str, default='queue', choices=['queue', 'dataset', 'cache'])
+data_arg.add_argument('--shuffle_buffer', type=int, default=5000,
+                      help='# of examples kept in the shuffle buffer of the loader')
+data_arg.add_argument('--prefetch_size', type=int, default=2,
+                      help='# of batches prefetched by the dataset loader')
+data_arg.add_argument('--input_autotune', type=str2bool, default=False,
+                      help='tune the active reader threads and queue fill of the queue loader at runtime')
+data_arg.add_argument('--max_num_worker', type=int, default=16,
+                      help='upper bound of reader threads when input_autotune is on')
+data_arg.add_argument('--verify_manifest', type=str2bool, default=False,
+                      help='stat every image against the dataset manifest, not only the directories')
+data_arg.add_argument('--cache_dir', type=str, default='',
+                      help='directory of pre-decoded image caches (default: <data_dir>/cache)')
 
 # Training / test parameters
 train_arg = add_argument_group('Training')
 train_arg.add_argument('--is_train', type=str2bool, default=True)
 train_arg.add_argument('--is_posttrain', type=str2bool, default=False)
+train_arg.add_argument('--posttrain_in_graph', type=str2bool, default=False,
+                       help='encode the parents and slerp inside the post-train graph')
 train_arg.add_argument('--optimizer', type=str, default='adam')
 train_arg.add_argument('--max_step', type=int, default=500000)
 train_arg.add_argument('--lr_update_step', type=int, default=100000, choices=[100000, 75000])
@@ -45,12 +60,39 @@ train_arg.add_argument('--beta2', type=float, default=0.999)
 train_arg.add_argument('--gamma', type=float, default=0.5)
 train_arg.add_argument('--lambda_k', type=float, default=0.001)
 train_arg.add_argument('--use_gpu', type=str2bool, default=True)
+train_arg.add_argument('--precision', type=str, default='float32', choices=['float32', 'float16', 'bfloat16'],
+                       help='dtype of G and D activations, variables are always float32, bfloat16 needs use_gpu')
+train_arg.add_argument('--loss_scale', type=float, default=0,
+                       help='static loss scale, 0 picks 128 for float16 and 1 otherwise')
+train_arg.add_argument('--recompute', type=str2bool, default=False,
+                       help='recompute G and D block activations in backprop to save memory')
+train_arg.add_argument('--accum_steps', type=int, default=1,
+                       help='# of micro-batches whose gradients are summed before every update')
+train_arg.add_argument('--num_towers', type=int, default=1,
+                       help='# of devices the batch is split across (data parallel)')
+train_arg.add_argument('--job_name', type=str, default='', choices=['', 'ps', 'worker'],
+                       help='role in a distributed run, empty for single process training')
+train_arg.add_argument('--task_index', type=int, default=0)
+train_arg.add_argument('--ps_hosts', type=str, default='',
+                       help='comma separated host:port list of the parameter servers')
+train_arg.add_argument('--worker_hosts', type=str, default='',
+                       help='comma separated host:port list of the workers, task 0 is the chief')
 
 # Misc
 misc_arg = add_argument_group('Misc')
 misc_arg.add_argument('--load_path', type=str, default='')
 misc_arg.add_argument('--log_step', type=int, default=50)
-misc_arg.add_argument('--save_step', type=int, default=5000)
+misc_arg.add_argument('--sample_mode', type=str, default='separate', choices=['separate', 'fused', 'reuse'],
+                      help='separate: generate + autoencode calls, fused: one G/D pass on the fixed samples, '
+                           'reuse: save the G/D outputs of the training step')
+misc_arg.add_argument('--save_step', type=int, default=5000,
+                      help='steps between checkpoints')
+misc_arg.add_argument('--profile_steps', type=str, default='',
+                      help='comma separated steps to trace, e.g. 100,1000')
+misc_arg.add_argument('--profile_every', type=int, default=0,
+                      help='also trace every N steps, 0 to disable')
+misc_arg.add_argument('--input_metrics_every', type=int, default=0,
+                      help='log input wait, queue fill and images/sec every N steps, 0 to disable')
 misc_arg.add_argument('--num_log_samples', type=int, default=3)
 misc_arg.add_argument('--log_level', type=str, default='INFO', choices=['INFO', 'DEBUG', 'WARN'])
 misc_arg.add_argument('--log_dir', type=str, default='logs')
@@ -59,10 +101,64 @@ misc_arg.add_argument('--test_data_path', type=str, default=None,
                       help='directory with images which will be used in test sample generation')
 misc_arg.add_argument('--posttrain_data_path', type=str, default=None,
                       help='directory with images which will be used in post-training')
+misc_arg.add_argument('--posttrain_records', type=str, default='',
+                      help='directory with sharded dad/kid/mom TFRecords used in post-training')
+misc_arg.add_argument('--num_shards', type=int, default=16,
+                      help='# of TFRecord shards written by triplet_records.py')
 misc_arg.add_argument('--sample_per_image', type=int, default=64,
                       help='# of sample per image during test sample generation')
+misc_arg.add_argument('--server_host', type=str, default='127.0.0.1')
+misc_arg.add_argument('--server_port', type=int, default=8000)
+misc_arg.add_argument('--max_batch_size', type=int, default=64,
+                      help='max # of rows the server coalesces into one batch')
+misc_arg.add_argument('--max_latency_ms', type=float, default=10,
+                      help='max time a request waits for its batch to fill')
+misc_arg.add_argument('--max_queue', type=int, default=256,
+                      help='# of pending requests per op before the server answers 503')
 misc_arg.add_argument('--random_seed', type=int, default=123)
 misc_arg.add_argument('--test_type', type=str, default='encode', choices=['encode', 'interpolate'])
+misc_arg.add_argument('--inversion_mode', type=str, default='loop', choices=['loop', 'engine'],
+                      help='loop: z_r fitted with one sess.run per step, engine: batched in-graph inversion')
+misc_arg.add_argument('--inversion_restarts', type=int, default=4,
+                      help='# of random starting codes per image, the best one is kept')
+misc_arg.add_argument('--inversion_iters', type=int, default=500)
+misc_arg.add_argument('--inversion_lr', type=float, default=0.01)
+misc_arg.add_argument('--inversion_patience', type=int, default=20,
+                      help='iterations without improvement before a row stops')
+misc_arg.add_argument('--engine', type=str, default='trainer', choices=['trainer', 'inference', 'frozen'],
+                      help='inference: restore only G and D into a forward-only graph, '
+                           'frozen: run the graphs written by export.py')
+misc_arg.add_argument('--frozen_dir', type=str, default='',
+                      help='directory of the exported frozen graphs (default: <model_dir>/frozen)')
+misc_arg.add_argument('--encode_mode', type=str, default='serial', choices=['serial', 'pipelined'],
+                      help='pipelined: crop faces in worker processes and encode in batches')
+misc_arg.add_argument('--encode_batch_size', type=int, default=32,
+                      help='batch size of the pipelined encode mode')
+misc_arg.add_argument('--interp_ratios', type=str, default='',
+                      help='comma separated slerp ratios for interpolate, e.g. 0.25,0.5,0.75')
+misc_arg.add_argument('--use_latent_store', type=str2bool, default=False,
+                      help='reuse D_z codes stored for the dataset and the current checkpoint')
+misc_arg.add_argument('--latent_dir', type=str, default='',
+                      help='directory of latent stores (default: <model_dir>/latents)')
+misc_arg.add_argument('--query_path', type=str, default='',
+                      help='query image of search.py')
+misc_arg.add_argument('--query_z', type=str, default='',
+                      help='.npy file with query z vectors of search.py')
+misc_arg.add_argument('--top_k', type=int, default=10)
+misc_arg.add_argument('--search_approximate', type=str2bool, default=False,
+                      help='search only the closest k-means partitions of the codes')
+misc_arg.add_argument('--search_lists', type=int, default=0,
+                      help='# of k-means partitions (default: sqrt of # of codes)')
+misc_arg.add_argument('--search_probes', type=int, default=8,
+                      help='# of partitions scanned per query')
+misc_arg.add_argument('--writer_queue_size', type=int, default=64,
+                      help='# of pending writes kept by background writers')
+misc_arg.add_argument('--writer_policy', type=str, default='block', choices=['block', 'drop'],
+                      help='when the writer queue is full, block: wait, drop: skip samples and summaries')
+misc_arg.add_argument('--image_format', type=str, default='', choices=['', 'png', 'jpg', 'bmp'],
+                      help='format of saved grids and samples, empty keeps the file extension')
+misc_arg.add_argument('--compress_level', type=int, default=6,
+                      help='png zlib level, lower is faster and bigger')
 
 
 def get_config():
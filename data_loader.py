@@ -1,28 +1,77 @@
+from __future__ import print_function
+
 import os
-from PIL import Image
-from glob import glob
 import tensorflow as tf
 
-def get_loader(root, batch_size, scale_size, data_format, split=None, is_grayscale=False, seed=None):
+from manifest import find_images, load_manifest
+from input_metrics import INPUT_TUNERS, GatedQueueRunner, InputTuner, register_input
+
+def get_paths(root, split=None, verify=False):
     dataset_name = os.path.basename(root)
-    
+
     if dataset_name in ['CelebA'] and split:
         root = os.path.join(root, 'splits', split)
 
-    for ext in ["jpg", "png"]:
-        paths = glob("{}/*.{}".format(root, ext))
-        if ext == "jpg":
-            tf_decode = tf.image.decode_jpeg
-        elif ext == "png":
-            tf_decode = tf.image.decode_png
-        if len(paths) != 0:
-            break
+    # listed from the manifest of `root`, not globbed on every launch
+    paths = find_images(root, ["jpg", "png"], verify)
+
+    return dataset_name, paths
+
+def get_loader(root, batch_size, scale_size, data_format, split=None, is_grayscale=False, seed=None,
+               loader_type='queue', num_worker=4, shuffle_buffer=5000, prefetch_size=2,
+               cache_dir=None, shard_index=0, num_shards=1, auto_tune=False, max_num_worker=16,
+               verify_manifest=False):
+    if loader_type == 'cache':
+        from dataset_cache import get_cache_batch
+        queue = get_cache_batch(
+                root, cache_dir, batch_size, scale_size, split,
+                is_grayscale, seed, num_worker, prefetch_size,
+                shard_index, num_shards, verify_manifest)
+        return finalize_batch(queue, data_format)
+
+    dataset_name, paths = get_paths(root, split, verify_manifest)
+    if num_shards > 1:
+        # sorted so that every worker agrees on the split
+        paths = sorted(paths)[shard_index::num_shards]
+        if len(paths) == 0:
+            raise Exception("[!] Shard {} of {} has no images".format(shard_index, num_shards))
+
+    if paths[0].endswith(".png"):
+        tf_decode = tf.image.decode_png
+    else:
+        tf_decode = tf.image.decode_jpeg
+
+    w, h = load_manifest(os.path.dirname(paths[0])).image_size(paths[0])
+    shape = [h, w, 3]
+    print('Loader Shape', shape)
+
+    if loader_type == 'queue':
+        queue = get_queue_batch(
+                paths, tf_decode, shape, batch_size, dataset_name, scale_size,
+                is_grayscale, seed, num_worker, shuffle_buffer,
+                auto_tune, max_num_worker)
+    elif loader_type == 'dataset':
+        queue = get_dataset_batch(
+                paths, tf_decode, shape, batch_size, dataset_name, scale_size,
+                is_grayscale, seed, num_worker, shuffle_buffer, prefetch_size)
+    else:
+        raise Exception("[!] Unknown loader_type: {}".format(loader_type))
+
+    return finalize_batch(queue, data_format)
+
+def finalize_batch(queue, data_format):
+    if data_format == 'NCHW':
+        queue = tf.transpose(queue, [0, 3, 1, 2])
+    elif data_format == 'NHWC':
+        pass
+    else:
+        raise Exception("[!] Unknown data_format: {}".format(data_format))
 
-    with Image.open(paths[0]) as img:
-        w, h = img.size
-        shape = [h, w, 3]
-        print 'Loader Shape', shape
+    return tf.to_float(queue)
 
+def get_queue_batch(paths, tf_decode, shape, batch_size, dataset_name, scale_size,
+                    is_grayscale, seed, num_worker, shuffle_buffer,
+                    auto_tune=False, max_num_worker=16):
     filename_queue = tf.train.string_input_producer(list(paths), shuffle=False, seed=seed)
     reader = tf.WholeFileReader()
     filename, data = reader.read(filename_queue)
@@ -32,13 +81,26 @@ def get_loader(root, batch_size, scale_size, data_format, split=None, is_graysca
         image = tf.image.rgb_to_grayscale(image)
     image.set_shape(shape)
 
-    min_after_dequeue = 5000
+    min_after_dequeue = shuffle_buffer
     capacity = min_after_dequeue + 3 * batch_size
 
-    queue = tf.train.shuffle_batch(
-        [image], batch_size=batch_size,
-        num_threads=4, capacity=capacity,
-        min_after_dequeue=min_after_dequeue, name='synthetic_inputs')
+    if auto_tune:
+        # `max_num_worker` reader threads of which only `num_worker` start
+        # active, the InputTuner changes that and the filled share at runtime
+        shuffle_queue = tf.RandomShuffleQueue(
+            capacity, min_after_dequeue, [tf.uint8], shapes=[shape], seed=seed)
+        enqueue_ops = [shuffle_queue.enqueue([image]) for _ in range(max(num_worker, max_num_worker))]
+        runner = GatedQueueRunner(shuffle_queue, enqueue_ops, num_worker, capacity)
+        tf.train.add_queue_runner(runner)
+        tf.add_to_collection(INPUT_TUNERS, InputTuner(runner, min_buffer=min_after_dequeue // 4 or 1))
+        queue = shuffle_queue.dequeue_many(batch_size, name='synthetic_inputs')
+    else:
+        queue = tf.train.shuffle_batch(
+            [image], batch_size=batch_size,
+            num_threads=num_worker, capacity=capacity,
+            min_after_dequeue=min_after_dequeue, name='synthetic_inputs')
+        shuffle_queue = tf.get_collection(tf.GraphKeys.QUEUE_RUNNERS)[-1].queue
+    register_input(queue, shuffle_queue, capacity)
 
     if dataset_name in ['CelebA']:
         queue = tf.image.crop_to_bounding_box(queue, 50, 25, 128, 128)
@@ -48,11 +110,33 @@ def get_loader(root, batch_size, scale_size, data_format, split=None, is_graysca
         #queue = tf.image.resize_nearest_neighbor(queue, [scale_size, scale_size])
         pass
 
-    if data_format == 'NCHW':
-        queue = tf.transpose(queue, [0, 3, 1, 2])
-    elif data_format == 'NHWC':
-        pass
-    else:
-        raise Exception("[!] Unknown data_format: {}".format(data_format))
+    return queue
 
-    return tf.to_float(queue)
+def get_dataset_batch(paths, tf_decode, shape, batch_size, dataset_name, scale_size,
+                      is_grayscale, seed, num_worker, shuffle_buffer, prefetch_size):
+    def parse(path):
+        image = tf_decode(tf.read_file(path), channels=3)
+        image.set_shape(shape)
+
+        # crop and resize per image inside the parallel map so that
+        # the work is spread over `num_worker` threads
+        if dataset_name in ['CelebA']:
+            image = tf.image.crop_to_bounding_box(image, 50, 25, 128, 128)
+            image = tf.image.resize_nearest_neighbor(
+                    tf.expand_dims(image, 0), [scale_size, scale_size])[0]
+
+        if is_grayscale:
+            image = tf.image.rgb_to_grayscale(image)
+        return image
+
+    dataset = tf.data.Dataset.from_tensor_slices(tf.constant(list(paths)))
+    dataset = dataset.shuffle(shuffle_buffer, seed=seed).repeat()
+    dataset = dataset.map(parse, num_parallel_calls=num_worker)
+    # drop the remainder so the batch dimension stays static,
+    # same as tf.train.shuffle_batch
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.prefetch(prefetch_size)
+
+    queue = dataset.make_one_shot_iterator().get_next(name='synthetic_inputs')
+    register_input(queue)
+    return queue
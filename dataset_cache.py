@@ -0,0 +1,174 @@
+"""
+Pre-decoded, memory-mapped image cache.
+
+Images are decoded, cropped and resized once and stored as a single
+uint8 array (`<key>.npy`) next to a json index (`<key>.json`), where the
+key is built from the dataset, split, scale size and grayscale setting.
+
+    $ python dataset_cache.py --dataset=CelebA --split=train --input_scale_size=64
+    $ python main.py --dataset=CelebA --loader_type=cache
+"""
+from __future__ import print_function
+
+import os
+import json
+import hashlib
+import numpy as np
+from PIL import Image
+from multiprocessing import Pool
+
+from data_loader import get_paths
+from manifest import load_manifest
+
+CACHE_VERSION = 2
+
+def get_cache_key(dataset_name, split, scale_size, is_grayscale):
+    return "{}_{}_{}_{}".format(
+            dataset_name, split or 'all', scale_size, 'gray' if is_grayscale else 'rgb')
+
+def get_fingerprint(paths):
+    # any added, removed or rewritten file changes the fingerprint. size and
+    # mtime come from the manifest the paths were listed with, not another stat
+    sha = hashlib.sha1()
+    for path in sorted(paths):
+        size, mtime = load_manifest(os.path.dirname(path)).stat(path)
+        sha.update("{}:{}:{!r}\n".format(os.path.basename(path), size, mtime).encode('utf-8'))
+    return sha.hexdigest()
+
+def resize_nearest_neighbor(image, size):
+    # same sampling as tf.image.resize_nearest_neighbor with align_corners=False
+    h, w = image.shape[:2]
+    rows = np.minimum(np.floor(np.arange(size) * (float(h) / size)).astype(np.int64), h - 1)
+    cols = np.minimum(np.floor(np.arange(size) * (float(w) / size)).astype(np.int64), w - 1)
+    return image[rows][:, cols]
+
+def preprocess(image, dataset_name, scale_size, is_grayscale):
+    """Mirror of the per-image work done in `data_loader.get_loader`."""
+    if dataset_name in ['CelebA']:
+        image = image[50:50+128, 25:25+128]
+        image = resize_nearest_neighbor(image, scale_size)
+
+    if is_grayscale:
+        gray = np.dot(image / 255., [0.2989, 0.5870, 0.1140])
+        image = (gray * 255.5).astype(np.uint8)[:, :, None]
+    return image
+
+def _load_image(args):
+    path, dataset_name, scale_size, is_grayscale = args
+    with Image.open(path) as img:
+        image = np.array(img.convert('RGB'), dtype=np.uint8)
+    return preprocess(image, dataset_name, scale_size, is_grayscale)
+
+def get_cache_paths(cache_dir, key):
+    return os.path.join(cache_dir, key + '.npy'), os.path.join(cache_dir, key + '.json')
+
+def load_index(index_path):
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as fp:
+        return json.load(fp)
+
+def build_cache(root, cache_dir, scale_size, split=None, is_grayscale=False,
+                num_worker=4, force=False, verify=False):
+    dataset_name, paths = get_paths(root, split, verify)
+    if len(paths) == 0:
+        raise Exception("[!] No images found in {}".format(root))
+    paths.sort()
+
+    key = get_cache_key(dataset_name, split, scale_size, is_grayscale)
+    data_path, index_path = get_cache_paths(cache_dir, key)
+    fingerprint = get_fingerprint(paths)
+
+    index = load_index(index_path)
+    if not force and index is not None and os.path.exists(data_path) \
+            and index['version'] == CACHE_VERSION and index['fingerprint'] == fingerprint:
+        print("[*] Cache is up to date: {}".format(data_path))
+        return data_path, index_path
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    first = _load_image((paths[0], dataset_name, scale_size, is_grayscale))
+    shape = [len(paths)] + list(first.shape)
+    print("[*] Building cache {} with shape {}".format(data_path, shape))
+
+    # write to a temporary file first so a killed build never looks valid
+    tmp_path = data_path + '.tmp'
+    images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=tuple(shape))
+
+    pool = Pool(num_worker)
+    try:
+        args = [(path, dataset_name, scale_size, is_grayscale) for path in paths]
+        for idx, image in enumerate(pool.imap(_load_image, args, chunksize=64)):
+            images[idx] = image
+    finally:
+        pool.close()
+        pool.join()
+
+    images.flush()
+    del images
+    os.rename(tmp_path, data_path)
+
+    index = {
+        'version': CACHE_VERSION,
+        'dataset': dataset_name,
+        'split': split,
+        'scale_size': scale_size,
+        'grayscale': is_grayscale,
+        'shape': shape,
+        'fingerprint': fingerprint,
+        'paths': paths,
+    }
+    with open(index_path, 'w') as fp:
+        json.dump(index, fp)
+
+    return data_path, index_path
+
+def load_cache(root, cache_dir, scale_size, split=None, is_grayscale=False, num_worker=4,
+               verify=False):
+    """Returns (images, paths), rebuilding the cache when the source folder changed."""
+    data_path, index_path = build_cache(
+            root, cache_dir, scale_size, split, is_grayscale, num_worker, verify=verify)
+    index = load_index(index_path)
+    images = np.load(data_path, mmap_mode='r')
+    return images, index['paths']
+
+def get_cache_batch(root, cache_dir, batch_size, scale_size, split=None, is_grayscale=False,
+                    seed=None, num_worker=4, prefetch_size=2, shard_index=0, num_shards=1,
+                    verify=False):
+    import tensorflow as tf
+    from input_metrics import register_input
+
+    images, _ = load_cache(root, cache_dir, scale_size, split, is_grayscale, num_worker, verify)
+    # rows of this worker, every row when not sharded
+    rows = np.arange(shard_index, len(images), num_shards)
+    num_images = len(rows)
+    if num_images < batch_size:
+        raise Exception("[!] Cache has {} images, less than batch_size {}".format(
+                num_images, batch_size))
+
+    def generator():
+        rng = np.random.RandomState(seed)
+        while True:
+            perm = rng.permutation(num_images)
+            for start in range(0, num_images - batch_size + 1, batch_size):
+                # sorted indices keep the memmap reads mostly sequential
+                yield images[rows[np.sort(perm[start:start + batch_size])]]
+
+    shape = [batch_size] + list(images.shape[1:])
+    dataset = tf.data.Dataset.from_generator(generator, tf.uint8, tf.TensorShape(shape))
+    dataset = dataset.prefetch(prefetch_size)
+
+    queue = dataset.make_one_shot_iterator().get_next(name='synthetic_inputs')
+    register_input(queue)
+    return queue
+
+
+if __name__ == "__main__":
+    from config import get_config
+
+    config, unparsed = get_config()
+    cache_dir = config.cache_dir or os.path.join(config.data_dir, 'cache')
+    build_cache(os.path.join(config.data_dir, config.dataset), cache_dir,
+                config.input_scale_size, config.split, config.grayscale,
+                config.num_worker, verify=config.verify_manifest)
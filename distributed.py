@@ -0,0 +1,122 @@
+"""
+distributed.py
+Between-graph replicated BEGAN training over parameter servers.
+
+Every worker builds the whole training graph. `replica_device_setter`
+places the variables, including `step`, `k_t` and the learning rates, on
+the ps tasks, so all workers read and update the same values. Worker 0
+is the chief: it initializes the variables, writes checkpoints and
+summaries and decays the learning rates. Each worker reads its own shard
+of the input files.
+
+Run one ps and two workers as local processes:
+
+    $ python distributed.py --num_ps=1 --num_workers=2 -- --dataset=CelebA --use_gpu=False
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import tensorflow as tf
+
+VARIABLE_OPS = ['Variable', 'VariableV2', 'VarHandleOp']
+
+def get_hosts(hosts):
+    return [host for host in hosts.split(',') if host]
+
+def get_cluster(config):
+    if not config.job_name:
+        return None
+    return tf.train.ClusterSpec({
+        'ps': get_hosts(config.ps_hosts),
+        'worker': get_hosts(config.worker_hosts),
+    })
+
+def is_chief(config):
+    return not config.job_name or (config.job_name == 'worker' and config.task_index == 0)
+
+def get_shard(config):
+    """(shard_index, num_shards) of the input files this task reads."""
+    if config.job_name != 'worker':
+        return 0, 1
+    return config.task_index, len(get_hosts(config.worker_hosts))
+
+def get_worker_device(config):
+    if config.job_name != 'worker':
+        return ''
+    return '/job:worker/task:{}'.format(config.task_index)
+
+def get_device_setter(config, cluster):
+    if cluster is None:
+        return None
+    return tf.train.replica_device_setter(
+            worker_device=get_worker_device(config), cluster=cluster)
+
+def start_server(config, cluster):
+    server = tf.train.Server(cluster, job_name=config.job_name, task_index=config.task_index)
+    if config.job_name == 'ps':
+        print("[*] ps {} listening on {}".format(config.task_index, server.target))
+    return server
+
+def free_ports(num):
+    sockets = []
+    for _ in range(num):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sockets.append(sock)
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+def launch(num_ps, num_workers, main_args, log_dir):
+    """Runs a local cluster until every worker exits, returns the seconds it took."""
+    ports = free_ports(num_ps + num_workers)
+    ps_hosts = ','.join('127.0.0.1:{}'.format(port) for port in ports[:num_ps])
+    worker_hosts = ','.join('127.0.0.1:{}'.format(port) for port in ports[num_ps:])
+    # every task has to agree on the model_dir the chief writes to
+    load_path = 'dist_{}'.format(int(time.time()))
+
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    def start(job_name, task_index):
+        args = [sys.executable, 'main.py',
+                '--job_name={}'.format(job_name), '--task_index={}'.format(task_index),
+                '--ps_hosts={}'.format(ps_hosts), '--worker_hosts={}'.format(worker_hosts),
+                '--load_path={}'.format(load_path)] + main_args
+        env = dict(os.environ)
+        if job_name == 'ps':
+            env['CUDA_VISIBLE_DEVICES'] = ''
+        log = open(os.path.join(log_dir, '{}_{}.log'.format(job_name, task_index)), 'w')
+        return subprocess.Popen(args, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    ps = [start('ps', idx) for idx in range(num_ps)]
+    start_time = time.time()
+    workers = [start('worker', idx) for idx in range(num_workers)]
+    codes = [worker.wait() for worker in workers]
+    elapsed = time.time() - start_time
+
+    for proc in ps:
+        proc.terminate()
+        proc.wait()
+    if any(codes):
+        raise Exception("[!] Worker exit codes {}, see the logs in {}".format(codes, log_dir))
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_ps', type=int, default=1)
+    parser.add_argument('--num_workers', type=int, default=2)
+    parser.add_argument('--log_dir', type=str, default='logs/distributed')
+    args, main_args = parser.parse_known_args()
+    if main_args and main_args[0] == '--':
+        main_args = main_args[1:]
+
+    elapsed = launch(args.num_ps, args.num_workers, main_args, args.log_dir)
+    print("[*] {} workers finished in {:.1f}s".format(args.num_workers, elapsed))
@@ -6,6 +6,8 @@ import os
 import tensorflow as tf
 
 from trainer import Trainer
+from inference import Inference
+from export import FrozenModel
 from config import get_config
 from data_loader import get_loader
 from utils import prepare_dirs_and_logger
@@ -18,15 +20,25 @@ def test(config):
         raise Exception("[!] Training is not supported for this method.")
 
     size = config.input_scale_size
-    setattr(config, 'batch_size', 1)
+    if config.encode_mode == 'pipelined' or config.use_latent_store:
+        setattr(config, 'batch_size', config.encode_batch_size)
+    else:
+        setattr(config, 'batch_size', 1)
+
+    def get_model(dataset_path):
+        if config.engine == 'inference':
+            return Inference(config)                                # forward-only graph, no loader
+        if config.engine == 'frozen':
+            return FrozenModel(config)                              # graphs written by export.py
+        data_loader = get_loader(                                   # get a fake loader
+            dataset_path, config.batch_size, config.input_scale_size,
+            config.data_format, config.split)
+        return Trainer(config, data_loader)                         # initialize Trainer
 
     if config.test_type == 'encode':
         dataset = config.test_data_path or config.dataset            # e.g. 'CelebA'
         dataset_path = os.path.join(config.data_dir, dataset)        # get path for dataset
-        data_loader = get_loader(                                    # get a fake loader
-            dataset_path, config.batch_size, config.input_scale_size,
-            config.data_format, config.split)
-        trainer = Trainer(config, data_loader)                      # initialize Trainer
+        trainer = get_model(dataset_path)
 
         dataset_path = os.path.join(config.data_dir, dataset)       # get path for dataset
 
@@ -39,10 +51,7 @@ def test(config):
         dataset1_path = os.path.join(config.data_dir, dataset1)     # get path for dataset 1
         dataset2_path = os.path.join(config.data_dir, dataset2)     # get path for dataset 2
 
-        data_loader = get_loader(                                   # get a fake loader
-            dataset1_path, config.batch_size, config.input_scale_size,   
-            config.data_format, config.split)
-        trainer = Trainer(config, data_loader)                      # initialize Trainer
+        trainer = get_model(dataset1_path)
 
         trainer.interpolate_encode_save(dataset1_path, dataset2_path, size)           # call encode interpolate save
         
@@ -0,0 +1,132 @@
+"""
+export.py
+Frozen, constant-folded G / encode / decode graphs for CPU serving.
+
+    $ python export.py --load_path=CelebA_0422_215559 --is_train=False --input_scale_size=128
+    $ python encode_interpolate.py ... --engine=frozen
+"""
+from __future__ import print_function
+
+import os
+import json
+import tensorflow as tf
+
+from pipeline import FolderEncoder
+
+# subgraph -> (input, output) node names of the Inference graph
+SUBGRAPHS = {
+    'G': ('z', 'G_out'),
+    'encode': ('x', 'encode_out'),
+    'decode': ('code', 'decode_out'),
+}
+META_NAME = 'frozen.json'
+
+def get_frozen_dir(config):
+    return config.frozen_dir or os.path.join(config.model_dir, 'frozen')
+
+def optimize_graph_def(graph_def, input_name, output_name):
+    try:
+        from tensorflow.tools.graph_transforms import TransformGraph
+    except ImportError:
+        return graph_def
+    return TransformGraph(graph_def, [input_name], [output_name], [
+        'strip_unused_nodes',
+        'remove_nodes(op=CheckNumerics)',
+        'fold_constants(ignore_errors=true)',
+        'sort_by_execution_order',
+    ])
+
+def export_frozen(config):
+    from inference import Inference
+
+    model = Inference(config)
+    frozen_dir = get_frozen_dir(config)
+    if not os.path.exists(frozen_dir):
+        os.makedirs(frozen_dir)
+
+    graph_def = model.graph.as_graph_def()
+    for name, (input_name, output_name) in SUBGRAPHS.items():
+        # folds the restored variables into constants and drops every
+        # node `output_name` does not depend on
+        frozen = tf.graph_util.convert_variables_to_constants(
+                model.sess, graph_def, [output_name])
+        frozen = optimize_graph_def(frozen, input_name, output_name)
+        tf.train.write_graph(frozen, frozen_dir, name + '.pb', as_text=False)
+        print("[*] Wrote {} ({} nodes)".format(os.path.join(frozen_dir, name + '.pb'), len(frozen.node)))
+
+    meta = {
+        'checkpoint': tf.train.latest_checkpoint(config.model_dir),
+        'z_num': config.z_num,
+        'input_scale_size': config.input_scale_size,
+        'data_format': config.data_format,
+        'precision': config.precision,
+        'subgraphs': SUBGRAPHS,
+    }
+    with open(os.path.join(frozen_dir, META_NAME), 'w') as fp:
+        json.dump(meta, fp, indent=4)
+    model.close()
+    return frozen_dir
+
+class FrozenModel(FolderEncoder):
+    """Runs the exported graphs, no checkpoint or model code needed."""
+
+    def __init__(self, config, batch_size=None):
+        self.config = config
+        self.model_dir = config.model_dir
+        self.batch_size = batch_size or config.batch_size
+        frozen_dir = get_frozen_dir(config)
+
+        with open(os.path.join(frozen_dir, META_NAME)) as fp:
+            meta = json.load(fp)
+        self.z_num = meta['z_num']
+
+        self.graph = tf.Graph()
+        self.tensors = {}
+        with self.graph.as_default():
+            for name, (input_name, output_name) in meta['subgraphs'].items():
+                graph_def = tf.GraphDef()
+                with open(os.path.join(frozen_dir, name + '.pb'), 'rb') as fp:
+                    graph_def.ParseFromString(fp.read())
+                tf.import_graph_def(graph_def, name=name)
+                self.tensors[name] = (
+                        self.graph.get_tensor_by_name('{}/{}:0'.format(name, input_name)),
+                        self.graph.get_tensor_by_name('{}/{}:0'.format(name, output_name)))
+        self.graph.finalize()
+        self.image_shape = self.tensors['encode'][0].get_shape().as_list()[1:]
+
+        self.sess = tf.Session(graph=self.graph)
+
+    def _run(self, name, inputs):
+        input_tensor, output_tensor = self.tensors[name]
+        return self.sess.run(output_tensor, {input_tensor: inputs})
+
+    def generate(self, z):
+        return self._run('G', z)
+
+    def encode(self, inputs):
+        return self._run('encode', inputs)
+
+    def decode(self, z):
+        return self._run('decode', z)
+
+    encode_codes = encode
+    decode_codes = decode
+
+    def autoencode_codes(self, inputs):
+        z = self.encode(inputs)
+        return z, self.decode(z)
+
+    def autoencode_nosave(self, inputs):
+        return self.autoencode_codes(inputs)[1]
+
+    def close(self):
+        self.sess.close()
+
+
+if __name__ == "__main__":
+    from config import get_config
+    from utils import prepare_dirs_and_logger
+
+    config, unparsed = get_config()
+    prepare_dirs_and_logger(config)
+    export_frozen(config)
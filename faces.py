@@ -0,0 +1,62 @@
+"""
+Face detection and cropping shared by the encode and interpolate paths.
+
+The detector is created lazily once per process, so the same functions
+can run in the main process or in a `multiprocessing.Pool` worker.
+"""
+import cv2
+import dlib
+import numpy as np
+from PIL import Image
+from imutils.face_utils import rect_to_bb
+
+DETECTOR = None
+
+def init_detector():
+    global DETECTOR
+    if DETECTOR is None:
+        DETECTOR = dlib.get_frontal_face_detector()
+    return DETECTOR
+
+def load_face(path, scale_size, upsample=2):
+    """Returns the face crop of `path` resized to `scale_size` and whether a face was found.
+
+    When no face is detected the whole image is resized instead.
+    """
+    detector = init_detector()
+    im_bgr = cv2.imread(path)
+    if im_bgr is None:
+        raise IOError("[!] Could not read {}".format(path))
+    im = cv2.cvtColor(im_bgr, cv2.COLOR_BGR2RGB)
+
+    try:
+        gray = cv2.cvtColor(im_bgr, cv2.COLOR_BGR2GRAY)
+        face_rect = detector(gray, upsample)[0]
+        (x, y, w, h) = rect_to_bb(face_rect)
+        face = Image.fromarray(im[max(y-50, 0):(y+h-10), max(x-25, 0):(x+w+25)])
+        detected = True
+    except Exception:
+        face = Image.fromarray(im)
+        detected = False
+
+    face = face.resize((scale_size, scale_size), Image.NEAREST)
+    return np.array(face, dtype=np.float32), detected
+
+def load_face_worker(args):
+    """`load_face` for `Pool.imap`, returns (path, image, detected, error)."""
+    path, scale_size = args
+    try:
+        image, detected = load_face(path, scale_size)
+        return path, image, detected, None
+    except Exception as e:
+        return path, None, False, str(e)
+
+def load_pair_worker(args):
+    """Loads both sides of a pair, returns (path1, path2, images, detected, error)."""
+    path1, path2, scale_size = args
+    try:
+        im1, detected1 = load_face(path1, scale_size)
+        im2, detected2 = load_face(path2, scale_size)
+        return path1, path2, (im1, im2), (detected1, detected2), None
+    except Exception as e:
+        return path1, path2, None, (False, False), str(e)
@@ -4,6 +4,8 @@ from PIL import Image
 import os
 import os.path
 
+from manifest import load_manifest
+
 IMG_EXTENSIONS = [
     '.jpg', '.JPG', '.jpeg', '.JPEG',
     '.png', '.PNG', '.ppm', '.PPM', '.bmp', '.BMP',
@@ -14,12 +16,11 @@ def is_image_file(filename):
 
 def make_dataset(dir):
     images = []
-    for root, _, fnames in sorted(os.walk(dir)):
-        for fname in sorted(fnames):
-            if is_image_file(fname):
-                path = os.path.join(root, fname)
-                item = (path, 0)
-                images.append(item)
+    # walked once into a recursive manifest, later only the changed directories
+    for path in load_manifest(dir, recursive=True).paths():
+        if is_image_file(path):
+            item = (path, 0)
+            images.append(item)
 
     return images
 
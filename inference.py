@@ -0,0 +1,106 @@
+"""
+Forward-only generate / encode / decode without the training graph.
+
+Only the G and D variables are restored from the latest checkpoint of
+`model_dir`, no optimizer, Supervisor or data loader is created, and
+the batch dimension of every input is left open.
+"""
+from __future__ import print_function
+
+import os
+import numpy as np
+import tensorflow as tf
+
+from models import *
+from pipeline import FolderEncoder
+from trainer import norm_img, denorm_img
+
+class Inference(FolderEncoder):
+    def __init__(self, config, batch_size=None):
+        self.config = config
+        self.z_num = config.z_num
+        self.conv_hidden_num = config.conv_hidden_num
+        self.input_scale_size = config.input_scale_size
+        self.data_format = config.data_format
+        self.dtype = get_dtype(config.precision, config.use_gpu)
+        self.model_dir = config.model_dir
+        # only used to chunk work, every placeholder takes any batch size
+        self.batch_size = batch_size or config.batch_size
+
+        self.channel = 1 if config.grayscale else 3
+        self.repeat_num = int(np.log2(self.input_scale_size)) - 2
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.build_model()
+            self.saver = tf.train.Saver(self.G_var + self.D_var)
+
+            gpu_options = tf.GPUOptions(allow_growth=True)
+            sess_config = tf.ConfigProto(allow_soft_placement=True,
+                                         gpu_options=gpu_options)
+            self.sess = tf.Session(config=sess_config)
+            self.restore()
+        self.graph.finalize()
+
+    def build_model(self):
+        size = self.input_scale_size
+        if self.data_format == 'NCHW':
+            x_shape = [None, self.channel, size, size]
+        else:
+            x_shape = [None, size, size, self.channel]
+
+        # rows fed to encode / autoencode must have this shape
+        self.image_shape = x_shape[1:]
+
+        self.z = tf.placeholder(tf.float32, [None, self.z_num], name='z')
+        self.x = tf.placeholder(tf.float32, x_shape, name='x')
+        self.code = tf.placeholder(tf.float32, [None, self.z_num], name='code')
+
+        G, self.G_var = GeneratorCNN(
+                self.z, self.conv_hidden_num, self.channel,
+                self.repeat_num, self.data_format, reuse=False, dtype=self.dtype)
+
+        x = norm_img(self.x)
+        AE_x, D_z, self.D_var = DiscriminatorCNN(
+                x, self.channel, self.z_num, self.repeat_num,
+                self.conv_hidden_num, self.data_format, reuse=False, dtype=self.dtype)
+
+        # same encoder variables, decoder fed with `code`
+        AE_code, _, _ = DiscriminatorCNN(
+                x, self.channel, self.z_num, self.repeat_num,
+                self.conv_hidden_num, self.data_format, reuse=True, decode_z=self.code,
+                dtype=self.dtype)
+
+        self.G = tf.identity(denorm_img(G, self.data_format), name='G_out')
+        self.D_z = tf.identity(D_z, name='encode_out')
+        self.AE_x = tf.identity(denorm_img(AE_x, self.data_format), name='autoencode_out')
+        self.AE_code = tf.identity(denorm_img(AE_code, self.data_format), name='decode_out')
+
+    def restore(self):
+        checkpoint = tf.train.latest_checkpoint(self.model_dir)
+        if checkpoint is None:
+            raise Exception("[!] No checkpoint found in {}".format(self.model_dir))
+        self.saver.restore(self.sess, checkpoint)
+        print("[*] Restored G and D from {}".format(checkpoint))
+
+    def generate(self, z):
+        return self.sess.run(self.G, {self.z: z})
+
+    def encode(self, inputs):
+        return self.sess.run(self.D_z, {self.x: inputs})
+
+    def decode(self, z):
+        return self.sess.run(self.AE_code, {self.code: z})
+
+    # unlike Trainer, codes here never carry a G half
+    encode_codes = encode
+    decode_codes = decode
+
+    def autoencode_nosave(self, inputs):
+        return self.sess.run(self.AE_x, {self.x: inputs})
+
+    def autoencode_codes(self, inputs):
+        return self.sess.run([self.D_z, self.AE_x], {self.x: inputs})
+
+    def close(self):
+        self.sess.close()
@@ -0,0 +1,215 @@
+"""
+Input pipeline instrumentation and reader auto-tuning.
+
+Loaders register their dequeue op, and for queue based loaders the queue
+size and capacity, in graph collections. `InputMonitor` traces a sampled
+step every `every` steps and splits its wall time into time blocked on
+the dequeue and compute, together with the queue fill level, consumed
+and decoded images/sec. The numbers go to the summary writer and to a
+jsonl file. When the queue loader is built with `auto_tune`, an
+`InputTuner` reacts to the samples by changing the number of active
+reader threads and the share of the queue they keep filled.
+"""
+from __future__ import print_function
+
+import json
+import time
+import threading
+import tensorflow as tf
+
+INPUT_OPS = 'input_ops'
+INPUT_QUEUES = 'input_queues'
+INPUT_TUNERS = 'input_tuners'
+
+def register_input(tensor, queue=None, capacity=None):
+    """Marks `tensor` as the batch of an input pipeline."""
+    tf.add_to_collection(INPUT_OPS, tensor.op)
+    if queue is not None:
+        tf.add_to_collection(INPUT_QUEUES, (queue.size(), capacity))
+
+class GatedQueueRunner(tf.train.QueueRunner):
+    """QueueRunner whose threads can be paused at runtime.
+
+    Thread `i` only enqueues while `i < num_threads` and the queue holds
+    fewer than `buffer_size` elements, so both act like they were set when
+    the graph was built. Paused threads sleep until the tuner changes
+    either value.
+    """
+
+    def __init__(self, queue, enqueue_ops, num_threads, buffer_size, poll_secs=0.1):
+        super(GatedQueueRunner, self).__init__(queue, enqueue_ops)
+        self._num_threads = num_threads
+        self._buffer_size = buffer_size
+        self.capacity = buffer_size
+        self.poll_secs = poll_secs
+        self.size_op = queue.size()
+        self.changed = threading.Condition()
+        self.exhausted = False
+
+    def _set(self, name, value):
+        with self.changed:
+            setattr(self, name, value)
+            self.changed.notify_all()
+
+    @property
+    def num_threads(self):
+        return self._num_threads
+
+    @num_threads.setter
+    def num_threads(self, value):
+        self._set('_num_threads', value)
+
+    @property
+    def buffer_size(self):
+        return self._buffer_size
+
+    @buffer_size.setter
+    def buffer_size(self, value):
+        self._set('_buffer_size', value)
+
+    def _gate(self, sess, idx, coord):
+        """Waits while thread `idx` is paused, returns False once it should stop."""
+        while not (coord and coord.should_stop()):
+            with self.changed:
+                # once the input ran out every thread enqueues to see it end
+                if idx >= self._num_threads and not self.exhausted:
+                    # woken by the tuner, the timeout only catches a stop request
+                    self.changed.wait(1.)
+                    continue
+                limited = self._buffer_size < self.capacity and not self.exhausted
+            if not limited or sess.run(self.size_op) < self._buffer_size:
+                return True
+            time.sleep(self.poll_secs)
+        return False
+
+    def _run(self, sess, enqueue_op, coord=None):
+        # QueueRunner._run with a gate before every enqueue, keeping its
+        # accounting so the queue is closed after the last thread is done
+        idx = self._enqueue_ops.index(enqueue_op)
+        decremented = False
+        try:
+            enqueue_callable = sess.make_callable(enqueue_op)
+            while self._gate(sess, idx, coord):
+                try:
+                    enqueue_callable()
+                except self._queue_closed_exception_types:
+                    self._set('exhausted', True)
+                    with self._lock:
+                        self._runs_per_session[sess] -= 1
+                        decremented = True
+                        if self._runs_per_session[sess] == 0:
+                            try:
+                                sess.run(self._close_op)
+                            except Exception:
+                                pass
+                    return
+        except Exception as e:
+            if coord:
+                coord.request_stop(e)
+            else:
+                with self._lock:
+                    self._exceptions_raised.append(e)
+                raise
+        finally:
+            if not decremented:
+                with self._lock:
+                    self._runs_per_session[sess] -= 1
+
+class InputTuner(object):
+    """Adds readers and buffer while steps wait on input, removes them when idle."""
+
+    def __init__(self, runner, min_threads=1, min_buffer=None,
+                 starved=0.05, saturated=0.01, patience=3):
+        self.runner = runner
+        self.min_threads = min_threads
+        self.max_threads = len(runner.enqueue_ops)
+        self.min_buffer = min_buffer or max(1, runner.capacity // 4)
+        self.starved = starved
+        self.saturated = saturated
+        self.patience = patience
+        self.idle = 0
+
+    def update(self, wait_fraction, fill):
+        runner = self.runner
+        if wait_fraction > self.starved:
+            self.idle = 0
+            runner.num_threads = min(self.max_threads, runner.num_threads + 1)
+            runner.buffer_size = min(runner.capacity, runner.buffer_size * 2)
+        elif wait_fraction < self.saturated and (fill is None or fill > 0.9):
+            self.idle += 1
+            if self.idle >= self.patience:
+                # compute is the bottleneck, give the cpu back
+                self.idle = 0
+                runner.num_threads = max(self.min_threads, runner.num_threads - 1)
+                runner.buffer_size = max(self.min_buffer, int(runner.buffer_size * 0.75))
+        return {'threads': runner.num_threads, 'buffer': runner.buffer_size}
+
+class InputMonitor(object):
+    def __init__(self, images_per_step, metrics_path, every=100, summary_fn=None):
+        self.images_per_step = images_per_step
+        self.metrics_path = metrics_path
+        self.every = every
+        self.summary_fn = summary_fn
+
+        graph = tf.get_default_graph()
+        self.input_ops = set(op.name for op in graph.get_collection(INPUT_OPS))
+        queues = graph.get_collection(INPUT_QUEUES)
+        self.sizes = [size for size, _ in queues]
+        self.capacity = sum(capacity for _, capacity in queues)
+        self.tuners = graph.get_collection(INPUT_TUNERS)
+
+        self.last = None
+
+    def is_sampled(self, step):
+        return self.every > 0 and step % self.every == 0
+
+    def run(self, sess, fetches, step, profiler, feed_dict=None):
+        # profiled steps keep their own full trace
+        if step is None or not self.is_sampled(step) or profiler.is_scheduled(step):
+            return profiler.run(sess, fetches, step, feed_dict)
+
+        fetches = dict(fetches, _input_sizes=self.sizes)
+        options = tf.RunOptions(trace_level=tf.RunOptions.SOFTWARE_TRACE)
+        run_metadata = tf.RunMetadata()
+        start = time.time()
+        result = sess.run(fetches, feed_dict, options=options, run_metadata=run_metadata)
+        wall = time.time() - start
+
+        self.record(step, wall, run_metadata.step_stats, sum(result.pop('_input_sizes')))
+        return result
+
+    def record(self, step, wall, step_stats, queue_size):
+        wait = 0.
+        for dev_stats in step_stats.dev_stats:
+            for node_stats in dev_stats.node_stats:
+                if node_stats.node_name in self.input_ops:
+                    wait = max(wait, node_stats.all_end_rel_micros / 1e6)
+
+        metrics = {
+            'step': step,
+            'wait_ms': wait * 1000.,
+            'compute_ms': max(wall - wait, 0.) * 1000.,
+            'wait_fraction': wait / wall if wall > 0 else 0.,
+        }
+        if self.capacity:
+            metrics['queue_fill'] = float(queue_size) / self.capacity
+
+        now = time.time()
+        if self.last is not None:
+            last_step, last_time, last_size = self.last
+            consumed = (step - last_step) * self.images_per_step
+            metrics['images_per_sec'] = consumed / (now - last_time)
+            # whatever the readers added to the queue was decoded as well
+            metrics['decoded_per_sec'] = (consumed + queue_size - last_size) / (now - last_time)
+        self.last = (step, now, queue_size)
+
+        for tuner in self.tuners:
+            metrics.update(tuner.update(metrics['wait_fraction'], metrics.get('queue_fill')))
+
+        with open(self.metrics_path, 'a') as fp:
+            fp.write(json.dumps(metrics) + '\n')
+        if self.summary_fn is not None:
+            self.summary_fn(tf.Summary(value=[
+                tf.Summary.Value(tag='input/{}'.format(key), simple_value=value)
+                for key, value in metrics.items() if key != 'step']), step)
+        return metrics
@@ -0,0 +1,89 @@
+"""
+Batched GAN inversion: find z with G(z) close to given images.
+
+Every image gets `num_restarts` random starting codes, all rows are
+optimized together with Adam inside a `tf.while_loop`, so a whole
+inversion is a single `sess.run`. A row stops once its L1 loss did not
+improve by `min_delta` for `patience` iterations, and the best restart
+of every image is kept.
+"""
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from models import nhwc_to_nchw
+
+class InversionEngine(object):
+    def __init__(self, generator_fn, z_num, image_shape, data_format,
+                 num_restarts=4, max_iters=500, lr=0.01, beta1=0.9, beta2=0.999,
+                 patience=20, min_delta=1e-4, eps=1e-8, seed=None):
+        """`generator_fn(z)` maps [N, z_num] codes to [-1, 1] images in `data_format`,
+        `image_shape` is the [H, W, C] shape of the images to invert."""
+        self.z_num = z_num
+        self.num_restarts = num_restarts
+
+        self.images = tf.placeholder(tf.float32, [None] + list(image_shape), name='inversion_images')
+        # same space as the G output
+        target = self.images / 127.5 - 1.
+        if data_format == 'NCHW':
+            target = nhwc_to_nchw(target)
+
+        num_images = tf.shape(target)[0]
+        num_rows = num_images * num_restarts
+        # row r * num_restarts + k is restart k of image r
+        targets = tf.reshape(tf.tile(tf.expand_dims(target, 1), [1, num_restarts, 1, 1, 1]),
+                             tf.concat([[num_rows], tf.shape(target)[1:]], 0))
+
+        def row_loss(z):
+            return tf.reduce_mean(tf.abs(generator_fn(z) - targets), [1, 2, 3])
+
+        def cond(i, z, m, v, best_z, best_loss, stall, active):
+            return tf.logical_and(i < max_iters, tf.reduce_any(active))
+
+        def body(i, z, m, v, best_z, best_loss, stall, active):
+            loss = row_loss(z)
+            # rows do not interact in G, so this is the gradient of every row's own loss
+            grad = tf.gradients(tf.reduce_sum(loss), z)[0]
+
+            improved = tf.logical_and(active, loss < best_loss - min_delta)
+            best_loss = tf.where(improved, loss, best_loss)
+            best_z = tf.where(improved, z, best_z)
+            stall = tf.where(improved, tf.zeros_like(stall), stall + 1)
+            active = tf.logical_and(active, stall < patience)
+
+            # Adam, only the rows still running move
+            t = tf.cast(i + 1, tf.float32)
+            m = beta1 * m + (1 - beta1) * grad
+            v = beta2 * v + (1 - beta2) * tf.square(grad)
+            step = lr * (m / (1 - beta1 ** t)) / (tf.sqrt(v / (1 - beta2 ** t)) + eps)
+            # keep z in the support of the uniform prior
+            z = tf.where(active, tf.clip_by_value(z - step, -1., 1.), z)
+            return i + 1, z, m, v, best_z, best_loss, stall, active
+
+        z0 = tf.random_uniform([num_rows, z_num], -1., 1., seed=seed)
+        zeros = tf.zeros_like(z0)
+        loop_vars = [
+            tf.constant(0), z0, zeros, zeros, z0,
+            tf.fill([num_rows], np.inf), tf.zeros([num_rows], tf.int32), tf.fill([num_rows], True),
+        ]
+        self.iterations, _, _, _, best_z, best_loss, _, _ = tf.while_loop(
+                cond, body, loop_vars, back_prop=False)
+
+        # best restart of every image
+        best_loss = tf.reshape(best_loss, [num_images, num_restarts])
+        best_idx = tf.argmin(best_loss, 1, output_type=tf.int32)
+        rows = tf.range(num_images) * num_restarts + best_idx
+        self.z = tf.gather(best_z, rows)
+        self.loss = tf.reduce_min(best_loss, 1)
+
+        # reconstruction loss of given codes, to compare against other inversions
+        self.eval_z = tf.placeholder(tf.float32, [None, z_num], name='inversion_eval_z')
+        self.eval_loss = tf.reduce_mean(tf.abs(generator_fn(self.eval_z) - target), [1, 2, 3])
+
+    def invert(self, sess, images):
+        """Returns ([N, z_num] codes, [N] L1 losses in [-1, 1] space, # of iterations)."""
+        return sess.run([self.z, self.loss, self.iterations], {self.images: images})
+
+    def reconstruction_loss(self, sess, z, images):
+        return sess.run(self.eval_loss, {self.eval_z: z, self.images: images})
@@ -0,0 +1,148 @@
+"""
+Nearest-neighbour search over encoded datasets.
+
+Exact search is a blocked brute force over squared L2 distances, so
+memory stays bounded by `block_size` rows at a time. The approximate
+mode partitions the codes with k-means (IVF) and only scans the
+`n_probe` partitions closest to each query.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+def squared_distances(queries, codes, codes_sq=None):
+    if codes_sq is None:
+        codes_sq = np.sum(codes ** 2, 1)
+    queries_sq = np.sum(queries ** 2, 1)
+    dist = queries_sq[:, None] - 2 * np.dot(queries, codes.T) + codes_sq[None, :]
+    return np.maximum(dist, 0)
+
+def merge_top_k(dist, idx, k):
+    """Keep the k smallest of every row of `dist`, sorted."""
+    if dist.shape[1] > k:
+        part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(dist))[:, None]
+        dist, idx = dist[rows, part], idx[rows, part]
+    order = np.argsort(dist, axis=1)
+    rows = np.arange(len(dist))[:, None]
+    return dist[rows, order], idx[rows, order]
+
+class LatentIndex(object):
+    def __init__(self, paths, codes, block_size=8192):
+        self.paths = list(paths)
+        self.codes = np.asarray(codes, dtype=np.float32)
+        self.codes_sq = np.sum(self.codes ** 2, 1)
+        self.block_size = block_size
+
+        self.centroids = None
+        self.lists = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def exact_search(self, queries, k=10):
+        """Returns (distances, indices), both [Q, k]."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self.codes))
+
+        best_dist = np.zeros([len(queries), 0], dtype=np.float32)
+        best_idx = np.zeros([len(queries), 0], dtype=np.int64)
+        for start in range(0, len(self.codes), self.block_size):
+            end = min(start + self.block_size, len(self.codes))
+            dist = squared_distances(queries, self.codes[start:end], self.codes_sq[start:end])
+            idx = np.tile(np.arange(start, end), [len(queries), 1])
+
+            best_dist, best_idx = merge_top_k(
+                    np.concatenate([best_dist, dist], 1), np.concatenate([best_idx, idx], 1), k)
+        return best_dist, best_idx
+
+    def _assign(self, codes, centroids):
+        assignment = np.zeros([len(codes)], dtype=np.int64)
+        for start in range(0, len(codes), self.block_size):
+            block = codes[start:start + self.block_size]
+            assignment[start:start + len(block)] = np.argmin(squared_distances(block, centroids), 1)
+        return assignment
+
+    def build_partitions(self, n_lists=None, n_iter=10, seed=123):
+        """k-means partitioning of the codes for approximate search."""
+        n_lists = n_lists or max(1, int(np.sqrt(len(self.codes))))
+        n_lists = min(n_lists, len(self.codes))
+        rng = np.random.RandomState(seed)
+
+        centroids = self.codes[rng.choice(len(self.codes), n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignment = self._assign(self.codes, centroids)
+            for idx in range(n_lists):
+                members = self.codes[assignment == idx]
+                if len(members) > 0:
+                    centroids[idx] = members.mean(0)
+                else:
+                    # re-seed empty lists with a random code
+                    centroids[idx] = self.codes[rng.randint(len(self.codes))]
+
+        assignment = self._assign(self.codes, centroids)
+        self.centroids = centroids
+        self.lists = [np.where(assignment == idx)[0] for idx in range(n_lists)]
+
+    def approximate_search(self, queries, k=10, n_probe=8):
+        if self.centroids is None:
+            self.build_partitions()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n_probe = min(n_probe, len(self.centroids))
+
+        probes = np.argsort(squared_distances(queries, self.centroids), 1)[:, :n_probe]
+
+        all_dist = np.full([len(queries), k], np.inf, dtype=np.float32)
+        all_idx = np.full([len(queries), k], -1, dtype=np.int64)
+        for row, (query, probe) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([self.lists[p] for p in probe])
+            if len(candidates) == 0:
+                continue
+            dist = squared_distances(query[None], self.codes[candidates], self.codes_sq[candidates])
+            dist, idx = merge_top_k(dist, candidates[None], min(k, len(candidates)))
+            all_dist[row, :dist.shape[1]], all_idx[row, :idx.shape[1]] = dist[0], idx[0]
+        return all_dist, all_idx
+
+    def search(self, queries, k=10, approximate=False, n_probe=8):
+        if approximate:
+            return self.approximate_search(queries, k, n_probe)
+        return self.exact_search(queries, k)
+
+    def search_paths(self, queries, k=10, approximate=False, n_probe=8):
+        dist, idx = self.search(queries, k, approximate, n_probe)
+        return [[(self.paths[i], float(d)) for d, i in zip(row_dist, row_idx) if i >= 0]
+                for row_dist, row_idx in zip(dist, idx)]
+
+    def sample_queries(self, num=100, noise=0.1, seed=None):
+        """Perturbed copies of `num` random codes and the rows they came from.
+
+        Queries equal to indexed codes always find themselves in a probed
+        partition, which makes recall look better than it is on new images.
+        """
+        rng = np.random.RandomState(seed)
+        rows = rng.choice(len(self.codes), min(num, len(self.codes)), replace=False)
+        scale = noise * np.std(self.codes, 0, keepdims=True)
+        queries = self.codes[rows] + scale * rng.standard_normal([len(rows), self.codes.shape[1]])
+        return queries.astype(np.float32), rows
+
+    def recall(self, queries, k=10, n_probe=8, exclude=None):
+        """Fraction of the exact top-k found by the approximate search.
+
+        `exclude` holds, for every query, an index row left out of both
+        results, such as the code a query was sampled from.
+        """
+        if exclude is None:
+            exclude = [None] * len(queries)
+            _, exact = self.exact_search(queries, k)
+            _, approx = self.approximate_search(queries, k, n_probe)
+        else:
+            _, exact = self.exact_search(queries, k + 1)
+            _, approx = self.approximate_search(queries, k + 1, n_probe)
+
+        hits, total = 0, 0
+        for e, a, row_exclude in zip(exact, approx, exclude):
+            e = [i for i in e if i >= 0 and i != row_exclude][:k]
+            a = [i for i in a if i >= 0 and i != row_exclude][:k]
+            hits += len(set(e) & set(a))
+            total += len(e)
+        return float(hits) / max(total, 1)
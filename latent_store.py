@@ -0,0 +1,161 @@
+"""
+Persistent store of encoded `D_z` vectors.
+
+Codes live in a float32 memory-mapped array (`codes.npy`) next to a json
+index mapping each image path to its row and content hash. The store is
+tied to one checkpoint, image size and z size and starts empty whenever
+any of them changes.
+"""
+from __future__ import print_function
+
+import os
+import json
+import hashlib
+import numpy as np
+
+INDEX_NAME = 'index.json'
+CODES_NAME = 'codes.npy'
+STORE_VERSION = 1
+
+def file_digest(path, chunk_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def get_checkpoint_id(model_dir):
+    import tensorflow as tf
+    checkpoint = tf.train.latest_checkpoint(model_dir)
+    return os.path.basename(checkpoint) if checkpoint else None
+
+class LatentStore(object):
+    def __init__(self, store_dir, checkpoint, z_num, scale_size, capacity=1024):
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, INDEX_NAME)
+        self.codes_path = os.path.join(store_dir, CODES_NAME)
+        self.meta = {
+            'version': STORE_VERSION,
+            'checkpoint': checkpoint,
+            'z_num': z_num,
+            'scale_size': scale_size,
+        }
+
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+
+        index = None
+        if os.path.exists(self.index_path) and os.path.exists(self.codes_path):
+            with open(self.index_path) as fp:
+                index = json.load(fp)
+            if any(index.get(key) != value for key, value in self.meta.items()):
+                print("[!] Latent store {} was built for {}, starting over".format(
+                        store_dir, index.get('checkpoint')))
+                index = None
+
+        if index is None:
+            # path -> [row, sha1, size, mtime]
+            self.entries = {}
+            self.size = 0
+            self.codes = np.lib.format.open_memmap(
+                    self.codes_path, mode='w+', dtype=np.float32, shape=(capacity, z_num))
+        else:
+            self.entries = index['entries']
+            self.size = index['size']
+            self.codes = np.load(self.codes_path, mmap_mode='r+')
+
+    def __len__(self):
+        return self.size
+
+    def _stat(self, path):
+        stat = os.stat(path)
+        return stat.st_size, int(stat.st_mtime)
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+
+        row, digest, size, mtime = entry
+        if (size, mtime) != self._stat(path):
+            # only hash the file when its stat changed
+            if file_digest(path) != digest:
+                return None
+            entry[2:] = self._stat(path)
+        return np.array(self.codes[row])
+
+    def lookup(self, paths):
+        """Returns a list with a code or None for every path."""
+        return [self.get(path) for path in paths]
+
+    def _grow(self, capacity):
+        tmp_path = self.codes_path + '.tmp'
+        codes = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=np.float32, shape=(capacity, self.codes.shape[1]))
+        codes[:self.size] = self.codes[:self.size]
+        codes.flush()
+        del codes, self.codes
+        os.rename(tmp_path, self.codes_path)
+        self.codes = np.load(self.codes_path, mmap_mode='r+')
+
+    def put(self, path, code):
+        path = os.path.abspath(path)
+        entry = self.entries.get(path)
+        if entry is None:
+            if self.size == len(self.codes):
+                self._grow(2 * len(self.codes))
+            row = self.size
+            self.size += 1
+        else:
+            row = entry[0]
+
+        self.codes[row] = code
+        self.entries[path] = [row, file_digest(path)] + list(self._stat(path))
+
+    def add(self, paths, codes):
+        for path, code in zip(paths, codes):
+            self.put(path, code)
+
+    def items(self):
+        """Returns (paths, codes) of every stored row."""
+        paths = [None] * self.size
+        for path, entry in self.entries.items():
+            paths[entry[0]] = path
+        return paths, self.codes[:self.size]
+
+    def save(self):
+        self.codes.flush()
+        index = dict(self.meta, size=self.size, entries=self.entries)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(index, fp)
+        os.rename(tmp_path, self.index_path)
+
+
+class MultiLatentStore(object):
+    """Routes every path to the store of the folder it lives in."""
+
+    def __init__(self, stores):
+        # {data_dir: LatentStore}
+        self.stores = {os.path.abspath(data_dir): store for data_dir, store in stores.items()}
+
+    def _store(self, path):
+        return self.stores[os.path.dirname(os.path.abspath(path))]
+
+    def get(self, path):
+        return self._store(path).get(path)
+
+    def lookup(self, paths):
+        return [self.get(path) for path in paths]
+
+    def put(self, path, code):
+        self._store(path).put(path, code)
+
+    def add(self, paths, codes):
+        for path, code in zip(paths, codes):
+            self.put(path, code)
+
+    def save(self):
+        for store in self.stores.values():
+            store.save()
@@ -1,9 +1,12 @@
+import os
 import numpy as np
 import tensorflow as tf
 
 from trainer import Trainer
 from config import get_config
 from data_loader import get_loader
+from triplet_records import get_triplet_loader
+from distributed import get_cluster, get_shard, start_server
 from utils import prepare_dirs_and_logger, save_config
 
 def main(config):
@@ -11,6 +14,17 @@ def main(config):
 
     tf.set_random_seed(config.random_seed)
 
+    cluster = get_cluster(config)
+    if cluster is not None:
+        if not config.is_train or config.is_posttrain:
+            raise Exception("[!] Distributed mode only supports training")
+        server = start_server(config, cluster)
+        if config.job_name == 'ps':
+            server.join()
+            return
+        setattr(config, 'master', server.target)
+    shard_index, num_shards = get_shard(config)
+
     if config.is_train:
         if config.is_posttrain and config.posttrain_data_path:
             data_path = config.posttrain_data_path
@@ -24,13 +38,30 @@ def main(config):
         else:
             data_path = config.test_data_path
 
-    data_loader = get_loader(
-            data_path, config.batch_size, config.input_scale_size,
-            config.data_format, config.split)
-    trainer = Trainer(config, data_loader)
+    triplet_loader = None
+    if config.is_train and config.is_posttrain and config.posttrain_records:
+        triplet_loader = get_triplet_loader(
+                config.posttrain_records, config.batch_size, config.data_format,
+                seed=config.random_seed, num_worker=config.num_worker,
+                shuffle_buffer=config.shuffle_buffer, prefetch_size=config.prefetch_size,
+                shard_index=shard_index, num_shards=num_shards)
+        # dad faces stand in for the stitched batch used to infer shapes
+        data_loader = triplet_loader[0]
+    else:
+        cache_dir = config.cache_dir or os.path.join(config.data_dir, 'cache')
+        data_loader = get_loader(
+                data_path, config.batch_size, config.input_scale_size,
+                config.data_format, config.split,
+                loader_type=config.loader_type, num_worker=config.num_worker,
+                shuffle_buffer=config.shuffle_buffer, prefetch_size=config.prefetch_size,
+                cache_dir=cache_dir, shard_index=shard_index, num_shards=num_shards,
+                auto_tune=config.input_autotune, max_num_worker=config.max_num_worker,
+                verify_manifest=config.verify_manifest)
+    trainer = Trainer(config, data_loader, triplet_loader)
 
     if config.is_train:
-        save_config(config)
+        if trainer.is_chief:
+            save_config(config)
         if config.is_posttrain:
             if not config.load_path:
                 raise Exception("[!] You should specify `load_path` to load a pretrained model")
@@ -0,0 +1,230 @@
+"""
+Persisted manifest of the images in a dataset directory.
+
+The manifest of `<dir>` (`.<dir>.manifest.json`, or
+`.<dir>_recursive.manifest.json` for whole trees) sits next to the
+directory, so writing it never changes the directory itself. It keeps the
+size, mtime, width / height and probe time of every image, plus the
+mtime of every directory it listed and when that listing was taken. A
+load only stats the directories. A directory whose mtime changed is
+listed again: new files are stat-ed and probed, removed ones dropped. A
+directory or file whose mtime lies within RACY_SECS of when it was
+looked at is checked again on the next load, since a change in the same
+mtime tick would go unnoticed otherwise (git treats racy index entries
+the same way). `verify` also stats every other file and re-probes the
+ones whose size or mtime changed, for files rewritten in place long
+after they were listed.
+
+    $ python manifest.py data/CelebA/splits/train
+    $ python manifest.py data/CelebA --recursive --verify
+"""
+from __future__ import print_function
+
+import os
+import json
+import time
+import argparse
+from PIL import Image
+from multiprocessing.pool import ThreadPool
+
+MANIFEST_VERSION = 3
+# mtime granularity (and clock skew) of network file systems
+RACY_SECS = 2
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.ppm', '.bmp']
+
+# manifests already loaded by this process, by (root, recursive)
+_MANIFESTS = {}
+
+def is_image_name(name):
+    # hidden files are skipped like glob does
+    return not name.startswith('.') and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+def probe(path):
+    """[size, mtime, width, height, probed at], the dims are None for unreadable images."""
+    probed_at = time.time()
+    stat = os.stat(path)
+    try:
+        # only reads the header
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception:
+        width = height = None
+    return [stat.st_size, stat.st_mtime, width, height, probed_at]
+
+def is_racy(mtime, checked_at):
+    return checked_at - mtime <= RACY_SECS
+
+class Manifest(object):
+    def __init__(self, root, recursive=False):
+        self.root = os.path.abspath(root)
+        self.recursive = recursive
+        parent, name = os.path.split(self.root)
+        self.path = os.path.join(parent, '.{}{}.manifest.json'.format(
+                name, '_recursive' if recursive else ''))
+
+        # relative dir -> [mtime, listed at], relative path -> [size, mtime, width, height, probed at]
+        self.dirs = {}
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as fp:
+                    index = json.load(fp)
+                if index.get('version') == MANIFEST_VERSION:
+                    self.dirs, self.entries = index['dirs'], index['entries']
+            except ValueError:
+                print("[!] Corrupt manifest {}, rebuilding".format(self.path))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _list(self, rel_dir):
+        """Image paths and sub directories of `rel_dir`, relative to the root."""
+        path = os.path.join(self.root, rel_dir)
+        files, dirs = [], []
+        for name in os.listdir(path):
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            if self.recursive and os.path.isdir(os.path.join(path, name)):
+                dirs.append(rel_path)
+            elif is_image_name(name):
+                files.append(rel_path)
+        return files, dirs
+
+    def update(self, verify=False, num_worker=8):
+        """Brings the manifest up to date, returns True if anything changed."""
+        changed_dirs = []
+        pending = [rel_dir for rel_dir in self.dirs] or ['']
+        seen = set()
+        while pending:
+            rel_dir = pending.pop()
+            if rel_dir in seen:
+                continue
+            seen.add(rel_dir)
+            listed_at = time.time()
+            try:
+                mtime = os.stat(os.path.join(self.root, rel_dir)).st_mtime
+            except OSError:
+                continue
+            stored = self.dirs.get(rel_dir)
+            if stored is not None and stored[0] == mtime and not is_racy(mtime, stored[1]):
+                continue
+            files, sub_dirs = self._list(rel_dir)
+            changed_dirs.append((rel_dir, [mtime, listed_at], files))
+            pending.extend(sub_dirs)
+
+        # directories that are gone take their files with them
+        removed_dirs = [rel_dir for rel_dir in self.dirs if rel_dir not in seen or not
+                        os.path.isdir(os.path.join(self.root, rel_dir))]
+
+        listed = {}
+        for rel_dir, state, files in changed_dirs:
+            self.dirs[rel_dir] = state
+            listed[rel_dir] = set(files)
+        for rel_dir in removed_dirs:
+            self.dirs.pop(rel_dir, None)
+            listed[rel_dir] = set()
+
+        removed = [rel_path for rel_path in self.entries
+                   if os.path.dirname(rel_path) in listed and rel_path not in listed[os.path.dirname(rel_path)]]
+        for rel_path in removed:
+            del self.entries[rel_path]
+
+        to_probe = [rel_path for files in listed.values() for rel_path in files
+                    if rel_path not in self.entries]
+        for rel_path, entry in self.entries.items():
+            # racy entries are few, they are checked even without `verify`
+            if not (verify or is_racy(entry[1], entry[4])):
+                continue
+            stat = os.stat(os.path.join(self.root, rel_path))
+            if [stat.st_size, stat.st_mtime] != entry[:2] or is_racy(entry[1], entry[4]):
+                to_probe.append(rel_path)
+
+        if to_probe:
+            # mostly waiting on the file system, threads are enough
+            pool = ThreadPool(num_worker)
+            try:
+                probed = pool.map(probe, [os.path.join(self.root, p) for p in to_probe])
+            finally:
+                pool.close()
+            self.entries.update(zip(to_probe, probed))
+
+        return bool(changed_dirs or removed_dirs or removed or to_probe)
+
+    def save(self):
+        # tasks started together may save at once, readers only ever see a whole file
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as fp:
+                json.dump({
+                    'version': MANIFEST_VERSION,
+                    'dirs': self.dirs,
+                    'entries': self.entries,
+                }, fp)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            # read-only datasets still work, they are just listed every time
+            print("[!] Could not write manifest {}: {}".format(self.path, e))
+
+    def paths(self, ext=None):
+        """Absolute paths in os.walk order, optionally only those ending with `.ext`."""
+        rel_paths = self.entries.keys()
+        if ext is not None:
+            suffix = '.' + ext.lower()
+            rel_paths = [p for p in rel_paths if p.lower().endswith(suffix)]
+        rel_paths = sorted(rel_paths, key=lambda p: os.path.split(p))
+        return [os.path.join(self.root, p) for p in rel_paths]
+
+    def stat(self, path):
+        """(size, mtime) of `path` as of the last update."""
+        entry = self.entries.get(os.path.relpath(os.path.abspath(path), self.root))
+        if entry is None:
+            stat = os.stat(path)
+            return stat.st_size, stat.st_mtime
+        return entry[0], entry[1]
+
+    def image_size(self, path):
+        """(width, height) of `path` without opening it again."""
+        entry = self.entries.get(os.path.relpath(os.path.abspath(path), self.root))
+        if entry is None or entry[2] is None:
+            with Image.open(path) as img:
+                return img.size
+        return entry[2], entry[3]
+
+def load_manifest(root, recursive=False, verify=False, num_worker=8):
+    key = (os.path.abspath(root), recursive)
+    manifest = _MANIFESTS.get(key)
+    if manifest is not None and not verify:
+        return manifest
+
+    if manifest is None:
+        manifest = Manifest(root, recursive)
+    if manifest.update(verify, num_worker):
+        manifest.save()
+    _MANIFESTS[key] = manifest
+    return manifest
+
+def find_images(root, exts=('jpg', 'png'), verify=False):
+    """Sorted paths of the first extension of `exts` with any images in `root`."""
+    if not os.path.isdir(root):
+        return []
+    manifest = load_manifest(root, verify=verify)
+    for ext in exts:
+        paths = manifest.paths(ext)
+        if len(paths) != 0:
+            break
+    return paths
+
+def image_size(path):
+    return load_manifest(os.path.dirname(path) or '.').image_size(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root', type=str)
+    parser.add_argument('--recursive', action='store_true')
+    parser.add_argument('--verify', action='store_true',
+                        help='stat every file, not only the directories')
+    parser.add_argument('--num_worker', type=int, default=8)
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.root, args.recursive, args.verify, args.num_worker)
+    print("[*] {} images in {}".format(len(manifest), manifest.path))
@@ -2,56 +2,148 @@ import numpy as np
 import tensorflow as tf
 slim = tf.contrib.slim
 
-def GeneratorCNN(z, hidden_num, output_num, repeat_num, data_format, reuse):
-    with tf.variable_scope("G", reuse=reuse) as vs:
+PRECISIONS = {
+    'float32': tf.float32,
+    'float16': tf.float16,
+    'bfloat16': tf.bfloat16,
+}
+
+def get_dtype(precision, use_gpu=True):
+    if precision not in PRECISIONS:
+        raise Exception("[!] Unknown precision: {}".format(precision))
+    if precision == 'bfloat16' and not use_gpu:
+        # the CPU kernels of Conv2D, Elu and BiasAdd are half / float / double only
+        raise Exception("[!] bfloat16 has no CPU kernels in this TensorFlow, "
+                        "use --precision=float32 or float16 with --use_gpu=False")
+    return PRECISIONS[precision]
+
+def get_custom_getter(dtype):
+    """Keeps float32 master weights, layers of another dtype get a cast copy."""
+    if dtype == tf.float32:
+        return None
+
+    def getter(getter, name, shape=None, dtype=None, trainable=True, *args, **kwargs):
+        variable = getter(name, shape, tf.float32 if trainable else dtype,
+                          trainable=trainable, *args, **kwargs)
+        if trainable and dtype != tf.float32:
+            variable = tf.cast(variable, dtype)
+        return variable
+    return getter
+
+class LayerNames(object):
+    """Hands out slim's default layer names ('Conv', 'Conv_1', ...) explicitly.
+
+    slim numbers unnamed layers by counting the scopes already created,
+    which restarts when `recompute_grad` rebuilds a block for the backward
+    pass. Naming every layer keeps the variables (and checkpoints) the same
+    with and without recomputation.
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def __call__(self, name):
+        idx = self.counts.get(name, 0)
+        self.counts[name] = idx + 1
+        return name if idx == 0 else '{}_{}'.format(name, idx)
+
+def run_block(block, x, recompute):
+    if recompute:
+        # keep only the block input, its activations are recomputed in backprop
+        return tf.contrib.layers.recompute_grad(block)(x)
+    return block(x)
+
+def GeneratorCNN(z, hidden_num, output_num, repeat_num, data_format, reuse, dtype=tf.float32,
+                 recompute=False):
+    """Runs in `dtype` with float32 variables, the output is always float32.
+
+    With `recompute` the activations of every block are recomputed during
+    backprop instead of being kept in memory.
+    """
+    names = LayerNames()
+    with tf.variable_scope("G", reuse=reuse, custom_getter=get_custom_getter(dtype),
+                           use_resource=True if recompute else None) as vs:
+        z = tf.cast(z, dtype)
         num_output = int(np.prod([8, 8, hidden_num]))
-        x = slim.fully_connected(z, num_output, activation_fn=None)
+        x = slim.fully_connected(z, num_output, activation_fn=None, scope=names('fully_connected'))
         x = reshape(x, 8, 8, hidden_num, data_format)
         
         for idx in range(repeat_num):
-            x = slim.conv2d(x, hidden_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format)
-            x = slim.conv2d(x, hidden_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format)
-            if idx < repeat_num - 1:
-                x = upscale(x, 2, data_format)
+            x = run_block(decoder_block(hidden_num, data_format, names, idx < repeat_num - 1), x, recompute)
 
-        out = slim.conv2d(x, 3, 3, 1, activation_fn=None, data_format=data_format)
+        out = slim.conv2d(x, 3, 3, 1, activation_fn=None, data_format=data_format, scope=names('Conv'))
+        out = tf.cast(out, tf.float32)
 
     variables = tf.contrib.framework.get_variables(vs)
     return out, variables
 
-def DiscriminatorCNN(x, input_channel, z_num, repeat_num, hidden_num, data_format, reuse):
-    with tf.variable_scope("D", reuse=reuse) as vs:
+def DiscriminatorCNN(x, input_channel, z_num, repeat_num, hidden_num, data_format, reuse, decode_z=None,
+                     dtype=tf.float32, recompute=False):
+    """Returns the autoencoded `x`, its code and the D variables.
+
+    When `decode_z` is given the decoder runs on those codes instead. The
+    encoder is still built so that the variable names match checkpoints.
+    Like `GeneratorCNN` it computes in `dtype`, returns float32 and can
+    recompute block activations.
+    """
+    names = LayerNames()
+    with tf.variable_scope("D", reuse=reuse, custom_getter=get_custom_getter(dtype),
+                           use_resource=True if recompute else None) as vs:
+        x = tf.cast(x, dtype)
         # Encoder
-        x = slim.conv2d(x, hidden_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format)
+        x = slim.conv2d(x, hidden_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format,
+                        scope=names('Conv'))
 
         prev_channel_num = hidden_num
         for idx in range(repeat_num):
             channel_num = hidden_num * (idx + 1)
-            x = slim.conv2d(x, channel_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format)
-            x = slim.conv2d(x, channel_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format)
-            if idx < repeat_num - 1:
-                x = slim.conv2d(x, channel_num, 3, 2, activation_fn=tf.nn.elu, data_format=data_format)
-                #x = tf.contrib.layers.max_pool2d(x, [2, 2], [2, 2], padding='VALID')
+            x = run_block(encoder_block(channel_num, data_format, names, idx < repeat_num - 1), x, recompute)
 
         x = tf.reshape(x, [-1, np.prod([8, 8, channel_num])])
-        z = x = slim.fully_connected(x, z_num, activation_fn=None)
+        z = x = slim.fully_connected(x, z_num, activation_fn=None, scope=names('fully_connected'))
+        if decode_z is not None:
+            x = tf.cast(decode_z, dtype)
 
         # Decoder
         num_output = int(np.prod([8, 8, hidden_num]))
-        x = slim.fully_connected(x, num_output, activation_fn=None)
+        x = slim.fully_connected(x, num_output, activation_fn=None, scope=names('fully_connected'))
         x = reshape(x, 8, 8, hidden_num, data_format)
         
         for idx in range(repeat_num):
-            x = slim.conv2d(x, hidden_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format)
-            x = slim.conv2d(x, hidden_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format)
-            if idx < repeat_num - 1:
-                x = upscale(x, 2, data_format)
+            x = run_block(decoder_block(hidden_num, data_format, names, idx < repeat_num - 1), x, recompute)
 
-        out = slim.conv2d(x, input_channel, 3, 1, activation_fn=None, data_format=data_format)
+        out = slim.conv2d(x, input_channel, 3, 1, activation_fn=None, data_format=data_format,
+                          scope=names('Conv'))
+        out, z = tf.cast(out, tf.float32), tf.cast(z, tf.float32)
 
     variables = tf.contrib.framework.get_variables(vs)
     return out, z, variables
 
+def encoder_block(channel_num, data_format, names, downscale):
+    scopes = [names('Conv'), names('Conv')]
+    if downscale:
+        scopes.append(names('Conv'))
+
+    def block(x):
+        x = slim.conv2d(x, channel_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format, scope=scopes[0])
+        x = slim.conv2d(x, channel_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format, scope=scopes[1])
+        if downscale:
+            x = slim.conv2d(x, channel_num, 3, 2, activation_fn=tf.nn.elu, data_format=data_format, scope=scopes[2])
+            #x = tf.contrib.layers.max_pool2d(x, [2, 2], [2, 2], padding='VALID')
+        return x
+    return block
+
+def decoder_block(hidden_num, data_format, names, upscale_output):
+    scopes = [names('Conv'), names('Conv')]
+
+    def block(x):
+        x = slim.conv2d(x, hidden_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format, scope=scopes[0])
+        x = slim.conv2d(x, hidden_num, 3, 1, activation_fn=tf.nn.elu, data_format=data_format, scope=scopes[1])
+        if upscale_output:
+            x = upscale(x, 2, data_format)
+        return x
+    return block
+
 def int_shape(tensor):
     shape = tensor.get_shape().as_list()
     return [num if num is not None else -1 for num in shape]
@@ -86,6 +178,20 @@ def resize_nearest_neighbor(x, new_size, data_format):
         x = tf.image.resize_nearest_neighbor(x, new_size)
     return x
 
+def repeat_upscale(x, scale, data_format):
+    # nearest neighbor by an integer factor is repeating every pixel,
+    # works for dtypes the resize kernels lack (bfloat16)
+    if data_format == 'NCHW':
+        x = nchw_to_nhwc(x)
+    _, h, w, c = int_shape(x)
+    x = tf.tile(tf.reshape(x, [-1, h, 1, w, 1, c]), [1, 1, scale, 1, scale, 1])
+    x = tf.reshape(x, [-1, h*scale, w*scale, c])
+    if data_format == 'NCHW':
+        x = nhwc_to_nchw(x)
+    return x
+
 def upscale(x, scale, data_format):
+    if x.dtype.base_dtype != tf.float32:
+        return repeat_upscale(x, scale, data_format)
     _, h, w, _ = get_conv_shape(x, data_format)
     return resize_nearest_neighbor(x, (h*scale, w*scale), data_format)
@@ -0,0 +1,280 @@
+"""
+Throughput-oriented encode pipeline.
+
+Faces are detected and cropped in a process pool, grouped into batches
+for a single autoencode call and written to disk by a background thread.
+"""
+from __future__ import print_function
+
+import os
+import numpy as np
+from multiprocessing import Pool
+
+from faces import init_detector, load_face, load_face_worker, load_pair_worker
+from manifest import find_images
+from latent_store import LatentStore, MultiLatentStore, get_checkpoint_id
+from utils import BackgroundWriter, save_image_simple, slerp_batch
+
+def iter_batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def pad_batch(images, batch_size):
+    """Pad `images` with zeros up to the static batch size of the model."""
+    images = np.stack(images)
+    if len(images) < batch_size:
+        padding = np.zeros([batch_size - len(images)] + list(images.shape[1:]), dtype=images.dtype)
+        images = np.concatenate([images, padding])
+    return images
+
+def basename_of(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def encode_images(model, paths, images, store=None):
+    """Codes of `images`, running the encoder only for paths missing from `store`."""
+    codes = store.lookup(paths) if store is not None else [None] * len(paths)
+    missing = [idx for idx, code in enumerate(codes) if code is None]
+    for chunk in iter_batches(missing, model.batch_size):
+        new_codes = model.encode_codes(pad_batch([images[idx] for idx in chunk], model.batch_size))
+        for idx, code in zip(chunk, new_codes):
+            codes[idx] = code
+            if store is not None:
+                store.put(paths[idx], code)
+    return np.stack(codes)
+
+def encode_folder(model, paths, scale_size, out_dir, num_worker=4, writer_queue_size=64,
+                  store=None):
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    def output_path(path):
+        return os.path.join(out_dir, '{}_encode.jpg'.format(basename_of(path)))
+
+    pool = Pool(num_worker, initializer=init_detector)
+    writer = BackgroundWriter(writer_queue_size)
+    failed, undetected = [], []
+    try:
+        to_load = paths
+        if store is not None:
+            # stored codes skip detection and the encoder entirely
+            found = store.lookup(paths)
+            cached = [(path, code) for path, code in zip(paths, found) if code is not None]
+            to_load = [path for path, code in zip(paths, found) if code is None]
+            print("[*] {} of {} codes found in the latent store".format(len(cached), len(paths)))
+
+            for batch in iter_batches(cached, model.batch_size):
+                codes = pad_batch([code for _, code in batch], model.batch_size)
+                decodes = model.decode_codes(codes)[:len(batch)].astype(np.uint8)
+                for (path, _), decode in zip(batch, decodes):
+                    writer.put(save_image_simple, decode, output_path(path))
+
+        jobs = [(path, scale_size) for path in to_load]
+        results = pool.imap(load_face_worker, jobs, chunksize=4)
+        for batch in iter_batches(results, model.batch_size):
+            loaded = []
+            for path, image, detected, error in batch:
+                if image is None:
+                    failed.append((path, error))
+                    continue
+                if not detected:
+                    undetected.append(path)
+                loaded.append((path, image))
+            if not loaded:
+                continue
+
+            images = pad_batch([image for _, image in loaded], model.batch_size)
+            codes, decodes = model.autoencode_codes(images)
+            decodes = decodes[:len(loaded)].astype(np.uint8)
+            if store is not None:
+                store.add([path for path, _ in loaded], codes[:len(loaded)])
+
+            for (path, _), decode in zip(loaded, decodes):
+                writer.put(save_image_simple, decode, output_path(path))
+    finally:
+        pool.close()
+        pool.join()
+        writer.close()
+        if store is not None:
+            store.save()
+
+    print("[*] Encoded {} images, {} without a detected face, {} failed".format(
+            len(paths) - len(failed), len(undetected), len(failed)))
+    for path, error in failed:
+        print("[!] Encoding failed on {}: {}".format(path, error))
+    return failed, undetected
+
+def save_interpolation(out_dir, basename, im1, decodes, im2):
+    """Writes each decoded ratio and a [im1 | decodes | im2] strip."""
+    im1, im2, decodes = im1.astype(np.uint8), im2.astype(np.uint8), decodes.astype(np.uint8)
+    if len(decodes) == 1:
+        save_image_simple(decodes[0], os.path.join(out_dir, '{}.jpg'.format(basename)))
+    else:
+        for idx, decode in enumerate(decodes):
+            save_image_simple(decode, os.path.join(out_dir, '{}_{}.jpg'.format(basename, idx)))
+    concat = np.concatenate([im1] + list(decodes) + [im2], axis=1)
+    save_image_simple(concat, os.path.join(out_dir, '{}_interp.jpg'.format(basename)))
+
+def write_failure_report(out_dir, undetected, failed):
+    report_path = os.path.join(out_dir, 'failed_pairs.txt')
+    with open(report_path, 'w') as fp:
+        for path1, path2, sides in undetected:
+            fp.write("no_face\t{}\t{}\t{}\n".format(sides, path1, path2))
+        for path1, path2, error in failed:
+            fp.write("error\t{}\t{}\t{}\n".format(error, path1, path2))
+    return report_path
+
+def interpolate_folders(model, paths1, paths2, scale_size, out_dir, ratios=(0.5,),
+                        num_worker=4, writer_queue_size=64, store=None):
+    if model.batch_size < 2:
+        raise Exception("[!] batch_size should be at least 2 to encode both sides of a pair")
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    # both sides of a pair share one encode batch
+    pairs_per_batch = model.batch_size // 2
+
+    pool = Pool(num_worker, initializer=init_detector)
+    writer = BackgroundWriter(writer_queue_size)
+    failed, undetected = [], []
+    num_done = 0
+    try:
+        jobs = [(path1, path2, scale_size) for path1, path2 in zip(paths1, paths2)]
+        results = pool.imap(load_pair_worker, jobs, chunksize=4)
+        for batch in iter_batches(results, pairs_per_batch):
+            loaded = []
+            for path1, path2, images, detected, error in batch:
+                if images is None:
+                    failed.append((path1, path2, error))
+                    continue
+                if not all(detected):
+                    sides = [name for name, found in zip(['first', 'second'], detected) if not found]
+                    undetected.append((path1, path2, ','.join(sides)))
+                loaded.append((path1, path2, images))
+            if not loaded:
+                continue
+
+            num = len(loaded)
+            images = [images[0] for _, _, images in loaded] + [images[1] for _, _, images in loaded]
+            pair_paths = [path1 for path1, _, _ in loaded] + [path2 for _, path2, _ in loaded]
+            codes = encode_images(model, pair_paths, images, store)
+            decodes = model.decode_interpolations(codes[:num], codes[num:2*num], ratios)
+
+            for (path1, _, (im1, im2)), decode in zip(loaded, decodes):
+                writer.put(save_interpolation, out_dir, basename_of(path1), im1, decode, im2)
+            num_done += num
+    finally:
+        pool.close()
+        pool.join()
+        writer.close()
+        if store is not None:
+            store.save()
+
+    print("[*] Interpolated {} pairs, {} with an undetected face, {} failed".format(
+            num_done, len(undetected), len(failed)))
+    if undetected or failed:
+        print("[!] See {} for the pairs that failed detection".format(
+                write_failure_report(out_dir, undetected, failed)))
+    return failed, undetected
+
+
+class FolderEncoder(object):
+    """encode_save / interpolate_encode_save on top of a model's encode and decode.
+
+    Subclasses provide `config`, `model_dir`, `z_num`, `batch_size` and the
+    `encode`, `decode`, `encode_codes`, `decode_codes` and `autoencode_*` calls.
+    """
+
+    def get_latent_store(self, data_path, scale_size):
+        if not self.config.use_latent_store:
+            return None
+        latent_dir = self.config.latent_dir or os.path.join(self.model_dir, 'latents')
+        store_dir = os.path.join(latent_dir, os.path.basename(os.path.normpath(data_path)))
+        return LatentStore(store_dir, get_checkpoint_id(self.model_dir), self.z_num, scale_size)
+
+    def decode_interpolations(self, z1, z2, ratios):
+        """Decode every ratio of every pair in one call, returns [N, R, H, W, C]."""
+        z = slerp_batch(z1, z2, ratios)
+        decodes = self.decode_codes(z.reshape([-1, self.z_num]))
+        return decodes.reshape(list(z.shape[:2]) + list(decodes.shape[1:]))
+
+    def encode_save(self, data_path, scale_size):
+        paths = find_images(data_path, verify=self.config.verify_manifest)      # paths is a list of pictures
+        store = self.get_latent_store(data_path, scale_size)
+        if self.config.encode_mode == 'pipelined' or store is not None:
+            return encode_folder(self, paths, scale_size, './encode',
+                                 self.config.num_worker, self.config.writer_queue_size, store)
+
+        if not os.path.isdir("./encode"):
+            os.mkdir('encode')
+
+        for i, pic_path in enumerate(paths):
+            basename = os.path.basename(pic_path)[:-4]
+            try:
+                im, detected = load_face(pic_path, scale_size)
+                if not detected:
+                    print('[!] Warning: face detection and cropping failed.')
+                im = np.expand_dims(im, axis=0)
+                print(pic_path)
+                print('Type:', type(im))
+                print('Shape:', im.shape)
+                print('Max:', np.max(im), 'Min:', np.min(im))
+                encode = self.encode(im)
+
+                decode = self.decode(encode)
+                # save_image(decode, './encode/' + os.path.basename(pic_path)[:-4] + '_encode.jpg')
+                decode = decode.astype(dtype=np.uint8)
+                save_image_simple(decode[0, :, :, :], './encode/{}_encode.jpg'.format(basename))
+            except Exception as e:
+                print('[!] Encoding failed on {}.'.format(basename))
+                print(e)
+
+
+    def interpolate_encode_save(self, data_path1, data_path2, scale_size, ratio=0.5):
+        # paths2 takes the extension that matched for paths1
+        for ext in ["jpg", "png"]:
+            paths1 = find_images(data_path1, [ext], self.config.verify_manifest)      # paths is a list of pictures
+            paths2 = find_images(data_path2, [ext], self.config.verify_manifest)      # paths is a list of pictures
+            if len(paths1) != 0:
+                break
+
+        ratios = [float(r) for r in self.config.interp_ratios.split(',')] \
+                if self.config.interp_ratios else [ratio]
+
+        if self.config.encode_mode == 'pipelined' or self.config.use_latent_store:
+            # dads and moms usually come from different folders, keep a store for each
+            store = None
+            if self.config.use_latent_store:
+                store = MultiLatentStore({
+                    data_path: self.get_latent_store(data_path, scale_size)
+                    for data_path in set([data_path1, data_path2])})
+            return interpolate_folders(self, paths1, paths2, scale_size, './interpolate', ratios,
+                                       self.config.num_worker, self.config.writer_queue_size, store)
+
+        if not os.path.isdir("./interpolate"):
+            os.mkdir('interpolate')
+
+        for i, pic_path in enumerate(paths1):
+            basename = os.path.basename(pic_path)[:-4]
+            try:
+                im1, detected1 = load_face(pic_path, scale_size)
+                im2, detected2 = load_face(paths2[i], scale_size)
+                if not (detected1 and detected2):
+                    print('[!] Warning: face detection and cropping failed.')
+                im1 = np.expand_dims(im1, axis=0)
+                im2 = np.expand_dims(im2, axis=0)
+                encode1 = self.encode_codes(im1)
+                encode2 = self.encode_codes(im2)
+
+                decodes = self.decode_interpolations(encode1, encode2, ratios)
+                save_interpolation('./interpolate', basename, im1[0], decodes[0], im2[0])
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                print('[!] Encoding failed on {}.'.format(basename))
+                print(e)
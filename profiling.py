@@ -0,0 +1,109 @@
+"""
+Full-trace profiling of scheduled training steps.
+
+On the steps picked by `profile_steps` / `profile_every` the run is
+traced with FULL_TRACE and written to `out_dir` as a Chrome timeline
+(chrome://tracing) plus a table of time and memory per op and per scope
+(G/, D/, gradients/G/, Adam, ...). Every other step is a plain
+`sess.run`.
+"""
+from __future__ import print_function
+
+import os
+import re
+import json
+import tensorflow as tf
+from collections import defaultdict
+
+TOWER_PREFIX = re.compile(r'^tower_\d+/')
+NUMBERED = re.compile(r'_\d+$')
+# every compute_gradients call gets its own gradients, gradients_1, ... scope
+GRADIENTS = re.compile(r'^gradients(_\d+)?$')
+
+def get_scope(node_name):
+    """Coarse scope of a traced node: 'G', 'D', 'gradients/G', 'Adam', ..."""
+    name = TOWER_PREFIX.sub('', node_name.split(':')[0])
+    parts = name.split('/')
+    if GRADIENTS.match(parts[0]):
+        return 'gradients/' + NUMBERED.sub('', parts[1]) if len(parts) > 2 else 'gradients'
+    # Adam_1, Adam_2, ... are the apply ops of the other optimizers
+    return NUMBERED.sub('', parts[0])
+
+def parse_steps(steps):
+    return set(int(step) for step in str(steps).split(',') if step.strip())
+
+class StepProfiler(object):
+    def __init__(self, out_dir, steps='', every=0, name='train', top_k=30):
+        self.out_dir = out_dir
+        self.steps = parse_steps(steps)
+        self.every = every
+        self.name = name
+        self.top_k = top_k
+
+    @property
+    def enabled(self):
+        return bool(self.steps) or self.every > 0
+
+    def is_scheduled(self, step):
+        return step in self.steps or (self.every > 0 and step > 0 and step % self.every == 0)
+
+    def run(self, sess, fetches, step, feed_dict=None):
+        if step is None or not self.is_scheduled(step):
+            return sess.run(fetches, feed_dict)
+
+        options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+        run_metadata = tf.RunMetadata()
+        result = sess.run(fetches, feed_dict, options=options, run_metadata=run_metadata)
+        self.write(step, run_metadata)
+        return result
+
+    def write(self, step, run_metadata):
+        from tensorflow.python.client import timeline
+
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        prefix = os.path.join(self.out_dir, '{}_step{}'.format(self.name, step))
+
+        trace = timeline.Timeline(run_metadata.step_stats)
+        with open(prefix + '_timeline.json', 'w') as fp:
+            fp.write(trace.generate_chrome_trace_format(show_memory=True))
+
+        ops, scopes = self.aggregate(run_metadata.step_stats)
+        with open(prefix + '_ops.json', 'w') as fp:
+            json.dump({'ops': ops, 'scopes': scopes}, fp, indent=4, sort_keys=True)
+        with open(prefix + '_ops.txt', 'w') as fp:
+            fp.write(format_table('scope', scopes))
+            fp.write('\n')
+            fp.write(format_table('op', ops, self.top_k))
+        print("[*] Profile saved: {}_*".format(prefix))
+
+    def aggregate(self, step_stats):
+        ops = defaultdict(lambda: {'micros': 0, 'bytes': 0, 'count': 0})
+        for dev_stats in step_stats.dev_stats:
+            for node_stats in dev_stats.node_stats:
+                micros = node_stats.all_end_rel_micros
+                memory = sum(m.total_bytes for m in node_stats.memory)
+                op = ops[node_stats.node_name]
+                op['micros'] += micros
+                op['bytes'] += memory
+                op['count'] += 1
+
+        scopes = defaultdict(lambda: {'micros': 0, 'bytes': 0, 'count': 0})
+        for name, op in ops.items():
+            scope = scopes[get_scope(name)]
+            for key in op:
+                scope[key] += op[key]
+        return dict(ops), dict(scopes)
+
+def format_table(title, rows, top_k=None):
+    total = float(sum(row['micros'] for row in rows.values())) or 1.
+    items = sorted(rows.items(), key=lambda item: -item[1]['micros'])
+    if top_k:
+        items = items[:top_k]
+
+    lines = ["{:<60} {:>10} {:>7} {:>10} {:>6}".format(title, 'ms', '%', 'MB', 'count')]
+    for name, row in items:
+        lines.append("{:<60} {:>10.3f} {:>6.1f}% {:>10.2f} {:>6}".format(
+                name[-60:], row['micros'] / 1000., 100. * row['micros'] / total,
+                row['bytes'] / 2.**20, row['count']))
+    return '\n'.join(lines) + '\n'
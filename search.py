@@ -0,0 +1,72 @@
+"""
+search.py
+Top-k training faces closest to a query image or z vector.
+
+    $ python encode_interpolate.py --dataset=dads --load_path=... --is_train=False --use_latent_store=True
+    $ python search.py --dataset=dads --load_path=... --is_train=False --query_path=face.jpg --top_k=10
+"""
+from __future__ import print_function
+
+import os
+import numpy as np
+import tensorflow as tf
+
+from trainer import Trainer
+from inference import Inference
+from export import FrozenModel
+from config import get_config
+from faces import load_face
+from pipeline import pad_batch
+from data_loader import get_loader
+from latent_index import LatentIndex
+from utils import prepare_dirs_and_logger
+
+def search(config):
+    prepare_dirs_and_logger(config)
+    tf.set_random_seed(config.random_seed)
+
+    if not config.query_path and not config.query_z:
+        raise Exception("[!] Specify `query_path` (image) or `query_z` (.npy of z vectors)")
+
+    setattr(config, 'use_latent_store', True)
+    dataset_path = os.path.join(config.data_dir, config.dataset)
+    if config.engine == 'inference':
+        trainer = Inference(config)
+    elif config.engine == 'frozen':
+        trainer = FrozenModel(config)
+    else:
+        data_loader = get_loader(                               # get a fake loader
+            dataset_path, config.batch_size, config.input_scale_size,
+            config.data_format, config.split)
+        trainer = Trainer(config, data_loader)
+
+    store = trainer.get_latent_store(dataset_path, config.input_scale_size)
+    if len(store) == 0:
+        raise Exception("[!] Latent store of {} is empty, run encode_interpolate.py "
+                        "with --use_latent_store=True first".format(dataset_path))
+    paths, codes = store.items()
+    index = LatentIndex(paths, codes)
+
+    if config.query_z:
+        queries = np.atleast_2d(np.load(config.query_z))
+    else:
+        image, _ = load_face(config.query_path, config.input_scale_size)
+        queries = trainer.encode_codes(pad_batch([image], trainer.batch_size))[:1]
+
+    if config.search_approximate:
+        index.build_partitions(config.search_lists or None)
+        # held-out style queries: perturbed codes, without the code they came from
+        recall_queries, rows = index.sample_queries(100, seed=config.random_seed)
+        print("[*] recall@{} of the approximate search: {:.4f}".format(
+                config.top_k, index.recall(recall_queries, config.top_k, config.search_probes, exclude=rows)))
+
+    results = index.search_paths(queries, config.top_k, config.search_approximate, config.search_probes)
+    for query_idx, neighbours in enumerate(results):
+        print("[*] Query {}".format(query_idx))
+        for rank, (path, dist) in enumerate(neighbours):
+            print("{:>3} {:.4f} {}".format(rank, dist, path))
+    return results
+
+if __name__ == "__main__":
+    config, unparsed = get_config()
+    search(config)
@@ -0,0 +1,334 @@
+"""
+server.py
+Local HTTP server for generate / encode / decode / interpolate.
+
+Concurrent requests are coalesced into one batch per op until either
+`max_batch_size` rows are waiting or the oldest request waited
+`max_latency_ms`. Every batch runs on the same session.
+
+    $ python server.py --load_path=CelebA_0422_215559 --is_train=False --engine=inference
+    $ curl -d '{"n": 4}' localhost:8000/generate
+    $ curl localhost:8000/metrics
+"""
+from __future__ import print_function
+
+import json
+import time
+import threading
+import numpy as np
+from collections import deque
+
+try:
+    from queue import Queue, Empty, Full
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.request import Request, urlopen
+except ImportError:
+    from Queue import Queue, Empty, Full
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib2 import Request, urlopen
+
+from utils import slerp_batch
+
+class Overloaded(Exception):
+    pass
+
+class BadRequest(Exception):
+    code = 400
+
+class TooLarge(BadRequest):
+    code = 413
+
+class TimedOut(Exception):
+    pass
+
+class PendingRequest(object):
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.created = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimedOut("[!] Request timed out")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class MicroBatcher(object):
+    """Runs `fn` on batches made of the rows of concurrent requests."""
+
+    def __init__(self, name, fn, max_batch_size=64, max_latency_ms=10, max_queue=256,
+                 history=1000):
+        self.name = name
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.
+        self.queue = Queue(max_queue)
+
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=history)
+        self.fill_ratios = deque(maxlen=history)
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_rejected = 0
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, inputs):
+        request = PendingRequest(np.asarray(inputs))
+        try:
+            # never block the handler, reject instead so clients can back off
+            self.queue.put_nowait(request)
+        except Full:
+            with self.lock:
+                self.num_rejected += 1
+            raise Overloaded("[!] {} queue is full".format(self.name))
+        return request
+
+    def __call__(self, inputs, timeout=60):
+        return self.submit(inputs).wait(timeout)
+
+    def _collect(self):
+        requests = [self.queue.get()]
+        rows = len(requests[0].inputs)
+        deadline = requests[0].created + self.max_latency
+        while rows < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except Empty:
+                break
+            requests.append(request)
+            rows += len(request.inputs)
+        return requests, rows
+
+    def _run(self):
+        while True:
+            requests, rows = self._collect()
+            try:
+                outputs = self.fn(np.concatenate([r.inputs for r in requests]))
+                start = 0
+                for request in requests:
+                    end = start + len(request.inputs)
+                    request.result = outputs[start:end]
+                    start = end
+            except Exception as e:
+                if len(requests) == 1:
+                    requests[0].error = e
+                else:
+                    # one bad request must not fail the others it was batched with
+                    for request in requests:
+                        try:
+                            request.result = self.fn(request.inputs)
+                        except Exception as e:
+                            request.error = e
+
+            now = time.time()
+            with self.lock:
+                self.num_batches += 1
+                self.num_requests += len(requests)
+                self.fill_ratios.append(min(1., float(rows) / self.max_batch_size))
+                for request in requests:
+                    self.latencies.append(now - request.created)
+            for request in requests:
+                request.done.set()
+
+    def metrics(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000.
+            return {
+                'queue_depth': self.queue.qsize(),
+                'requests': self.num_requests,
+                'batches': self.num_batches,
+                'rejected': self.num_rejected,
+                'batch_fill_ratio': float(np.mean(self.fill_ratios)) if self.fill_ratios else 0.,
+                'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.,
+                'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.,
+            }
+
+class ModelServer(object):
+    def __init__(self, model, max_batch_size=64, max_latency_ms=10, max_queue=256):
+        self.model = model
+        self.z_num = model.z_num
+        self.image_shape = list(model.image_shape)
+        # a single request never needs more than one full batch
+        self.max_rows = max_batch_size
+        options = dict(max_batch_size=max_batch_size, max_latency_ms=max_latency_ms,
+                       max_queue=max_queue)
+        self.batchers = {
+            'generate': MicroBatcher('generate', model.generate, **options),
+            'encode': MicroBatcher('encode', model.encode_codes, **options),
+            'decode': MicroBatcher('decode', model.decode_codes, **options),
+        }
+
+    def check_num_rows(self, num_rows):
+        if num_rows > self.max_rows:
+            raise TooLarge("[!] Request has {} rows, at most {} are allowed".format(
+                    num_rows, self.max_rows))
+
+    def check_rows(self, name, value, shape):
+        """`value` as a float32 [N] + `shape` array, checked before it joins a batch."""
+        try:
+            rows = np.asarray(value, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise BadRequest("[!] `{}` is not a numeric array".format(name))
+        if rows.ndim != len(shape) + 1 or list(rows.shape[1:]) != list(shape):
+            raise BadRequest("[!] `{}` has shape {}, expected [{}]".format(
+                    name, list(rows.shape), ', '.join(['N'] + [str(dim) for dim in shape])))
+        self.check_num_rows(len(rows))
+        return rows
+
+    def generate(self, body):
+        if 'z' in body:
+            z = self.check_rows('z', body['z'], [self.z_num])
+        else:
+            try:
+                n = int(body.get('n', 1))
+            except (TypeError, ValueError):
+                raise BadRequest("[!] `n` is not an integer")
+            if n < 1:
+                raise BadRequest("[!] `n` should be at least 1")
+            self.check_num_rows(n)
+            z = np.random.uniform(-1, 1, size=(n, self.z_num))
+        return {'images': self.batchers['generate'](z), 'z': z}
+
+    def encode(self, body):
+        images = self.check_rows('images', body.get('images'), self.image_shape)
+        return {'z': self.batchers['encode'](images)}
+
+    def decode(self, body):
+        z = self.check_rows('z', body.get('z'), [self.z_num])
+        return {'images': self.batchers['decode'](z)}
+
+    def interpolate(self, body):
+        ratios = self.check_rows('ratios', body.get('ratios', np.linspace(0, 1, 10)), [])
+        z1 = self.check_rows('z1', np.atleast_2d(body.get('z1')), [self.z_num])
+        z2 = self.check_rows('z2', np.atleast_2d(body.get('z2')), [self.z_num])
+        if len(z1) != len(z2) and 1 not in [len(z1), len(z2)]:
+            raise BadRequest("[!] `z1` and `z2` have {} and {} rows".format(len(z1), len(z2)))
+        # every pair and ratio is a row of the decode batch
+        self.check_num_rows(max(len(z1), len(z2)) * len(ratios))
+        z = slerp_batch(z1, z2, ratios)
+        # every ratio is a row of the shared decode batch
+        images = self.batchers['decode'](z.reshape([-1, self.z_num]))
+        return {'images': images.reshape(list(z.shape[:2]) + list(images.shape[1:]))}
+
+    def metrics(self):
+        return {name: batcher.metrics() for name, batcher in self.batchers.items()}
+
+def to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    return value
+
+def make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = json.dumps(to_json(body)).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/metrics':
+                self._reply(200, server.metrics())
+            else:
+                self._reply(404, {'error': 'unknown path {}'.format(self.path)})
+
+        def do_POST(self):
+            op = self.path.strip('/')
+            if op not in ['generate', 'encode', 'decode', 'interpolate']:
+                return self._reply(404, {'error': 'unknown op {}'.format(op)})
+            try:
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    body = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+                except ValueError:
+                    raise BadRequest("[!] Body is not valid json")
+                if not isinstance(body, dict):
+                    raise BadRequest("[!] Body should be a json object")
+                self._reply(200, getattr(server, op)(body))
+            except BadRequest as e:
+                self._reply(e.code, {'error': str(e)})
+            except Overloaded as e:
+                self._reply(503, {'error': str(e)})
+            except TimedOut as e:
+                self._reply(504, {'error': str(e)})
+            except Exception as e:
+                # failures of the model or the server, not of the request
+                self._reply(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def serve(model, host='127.0.0.1', port=8000, **options):
+    httpd = ThreadingHTTPServer((host, port), make_handler(ModelServer(model, **options)))
+    print("[*] Serving on http://{}:{}".format(host, httpd.server_address[1]))
+    return httpd
+
+class Client(object):
+    """Minimal client for tests and scripts."""
+
+    def __init__(self, host='127.0.0.1', port=8000):
+        self.url = 'http://{}:{}'.format(host, port)
+
+    def _call(self, op, body=None):
+        data = json.dumps(to_json(body)).encode('utf-8') if body is not None else None
+        request = Request('{}/{}'.format(self.url, op), data=data)
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        return json.loads(urlopen(request).read().decode('utf-8'))
+
+    def generate(self, z=None, n=1):
+        return self._call('generate', {'z': z} if z is not None else {'n': n})
+
+    def encode(self, images):
+        return self._call('encode', {'images': images})
+
+    def decode(self, z):
+        return self._call('decode', {'z': z})
+
+    def interpolate(self, z1, z2, ratios):
+        return self._call('interpolate', {'z1': z1, 'z2': z2, 'ratios': ratios})
+
+    def metrics(self):
+        return self._call('metrics')
+
+
+if __name__ == "__main__":
+    from config import get_config
+    from utils import prepare_dirs_and_logger
+
+    config, unparsed = get_config()
+    prepare_dirs_and_logger(config)
+
+    if config.engine == 'frozen':
+        from export import FrozenModel
+        model = FrozenModel(config, batch_size=config.max_batch_size)
+    else:
+        from inference import Inference
+        model = Inference(config, batch_size=config.max_batch_size)
+
+    httpd = serve(model, config.server_host, config.server_port,
+                  max_batch_size=config.max_batch_size, max_latency_ms=config.max_latency_ms,
+                  max_queue=config.max_queue)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        httpd.server_close()
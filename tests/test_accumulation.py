@@ -0,0 +1,69 @@
+"""--accum_steps K on batches of B must match one step on a batch of B * K.
+
+    $ python -m pytest tests/test_accumulation.py
+"""
+import numpy as np
+import tensorflow as tf
+
+from trainer import Trainer
+from benchmarks import get_bench_config
+
+BATCH_SIZE = 2
+ACCUM_STEPS = 4
+SCALE_SIZE = 16
+Z_NUM = 8
+
+def build(batch_size, accum_steps):
+    graph = tf.Graph()
+    with graph.as_default():
+        config = get_bench_config(
+                batch_size=batch_size, input_scale_size=SCALE_SIZE, conv_hidden_num=8,
+                z_num=Z_NUM, use_gpu=False, accum_steps=accum_steps)
+        images = tf.placeholder(tf.float32, [batch_size, SCALE_SIZE, SCALE_SIZE, 3])
+        trainer = Trainer(config, images)
+        # weights, k_t, step and the Adam slots, not the accumulators
+        variables = tf.global_variables()
+    return trainer, images, variables
+
+def get_values(trainer, variables):
+    return dict(zip([v.op.name for v in variables], trainer.sess.run(variables)))
+
+class AccumulationTest(tf.test.TestCase):
+    def test_matches_large_batch(self):
+        rng = np.random.RandomState(123)
+        big_batch = BATCH_SIZE * ACCUM_STEPS
+
+        large, large_images, large_vars = build(big_batch, 1)
+        small, small_images, small_vars = build(BATCH_SIZE, ACCUM_STEPS)
+
+        # same starting point, k_t away from 0 so both terms of the D loss count
+        weights = get_values(large, large.G_var + large.D_var)
+        for var in small.G_var + small.D_var:
+            var.load(weights[var.op.name], small.sess)
+        large.k_t.load(0.3, large.sess)
+        small.k_t.load(0.3, small.sess)
+
+        x = rng.uniform(0, 255, [big_batch, SCALE_SIZE, SCALE_SIZE, 3])
+        z = rng.uniform(-1, 1, [big_batch, Z_NUM])
+
+        measure_large = large.sess.run([large.k_update, large.measure],
+                                       {large_images: x, large.z: z})[1]
+        for idx in range(ACCUM_STEPS):
+            rows = slice(idx * BATCH_SIZE, (idx + 1) * BATCH_SIZE)
+            feed_dict = {small_images: x[rows], small.z: z[rows]}
+            if idx < ACCUM_STEPS - 1:
+                small.sess.run(small.accum_op, feed_dict)
+            else:
+                measure_small = small.sess.run([small.k_update, small.measure], feed_dict)[1]
+
+        self.assertTrue(np.allclose(measure_large, measure_small, rtol=1e-4, atol=1e-6))
+
+        # the Adam moments carry the gradient scale, a sum instead of a mean shows up there
+        expected, actual = get_values(large, large_vars), get_values(small, small_vars)
+        self.assertEqual(sorted(expected), sorted(actual))
+        for name in expected:
+            self.assertTrue(np.allclose(expected[name], actual[name], rtol=1e-3, atol=1e-6),
+                            "{} differs after the accumulated update".format(name))
+
+if __name__ == "__main__":
+    tf.test.main()
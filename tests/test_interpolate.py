@@ -0,0 +1,72 @@
+"""interpolate_folders against a Trainer graph, whose batch is static.
+
+Face detection is replaced by random crops so only the encode, slerp
+and decode batching is exercised.
+
+    $ python -m pytest tests/test_interpolate.py
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+import tensorflow as tf
+
+import pipeline
+from trainer import Trainer
+from benchmarks import get_bench_config
+
+BATCH_SIZE = 4
+SCALE_SIZE = 16
+Z_NUM = 8
+
+def no_detector():
+    pass
+
+def load_random_pair(args):
+    path1, path2, scale_size = args
+    rng = np.random.RandomState(int(pipeline.basename_of(path1)))
+    images = rng.uniform(0, 255, [2, scale_size, scale_size, 3]).astype(np.float32)
+    return path1, path2, (images[0], images[1]), (True, True), None
+
+class InterpolateFoldersTest(tf.test.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.detector, self.loader = pipeline.init_detector, pipeline.load_pair_worker
+        pipeline.init_detector, pipeline.load_pair_worker = no_detector, load_random_pair
+
+        with tf.Graph().as_default():
+            config = get_bench_config(
+                    batch_size=BATCH_SIZE, input_scale_size=SCALE_SIZE, conv_hidden_num=8,
+                    z_num=Z_NUM, use_gpu=False)
+            images = tf.placeholder(tf.float32, [BATCH_SIZE, SCALE_SIZE, SCALE_SIZE, 3])
+            self.trainer = Trainer(config, images)
+
+    def tearDown(self):
+        pipeline.init_detector, pipeline.load_pair_worker = self.detector, self.loader
+        self.trainer.sess.close()
+        shutil.rmtree(self.out_dir)
+
+    def test_decode_more_rows_than_the_batch(self):
+        z = np.random.uniform(-1, 1, [2 * BATCH_SIZE + 1, Z_NUM])
+        self.assertEqual(self.trainer.decode_codes(z).shape, (2 * BATCH_SIZE + 1, SCALE_SIZE, SCALE_SIZE, 3))
+        self.assertEqual(self.trainer.generate(z, save=False).shape, (2 * BATCH_SIZE + 1, SCALE_SIZE, SCALE_SIZE, 3))
+
+    def test_ratios_and_short_batches(self):
+        # 2 pairs per encode batch, so the last batch holds a single pair
+        paths1 = ['{}.jpg'.format(idx) for idx in range(5)]
+        paths2 = ['{}.jpg'.format(idx + 100) for idx in range(5)]
+        for ratios in [[0.5], [0.25, 0.5, 0.75]]:
+            out_dir = os.path.join(self.out_dir, str(len(ratios)))
+            failed, undetected = pipeline.interpolate_folders(
+                    self.trainer, paths1, paths2, SCALE_SIZE, out_dir, ratios, num_worker=2)
+            self.assertEqual((failed, undetected), ([], []))
+
+            for path in paths1:
+                basename = pipeline.basename_of(path)
+                self.assertTrue(os.path.exists(os.path.join(out_dir, '{}_interp.jpg'.format(basename))))
+                if len(ratios) > 1:
+                    for idx in range(len(ratios)):
+                        self.assertTrue(os.path.exists(os.path.join(out_dir, '{}_{}.jpg'.format(basename, idx))))
+
+if __name__ == "__main__":
+    tf.test.main()
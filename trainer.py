@@ -1,17 +1,18 @@
 from __future__ import print_function
 
 import os
-import dlib
-import cv2
+import time
 import numpy as np
-from PIL import Image
-from glob import glob
 from tqdm import trange
 from collections import deque
-from imutils.face_utils import rect_to_bb
 
 from models import *
-from utils import save_image, save_image_simple
+from pipeline import FolderEncoder, pad_batch
+from inversion import InversionEngine
+from profiling import StepProfiler
+from input_metrics import InputMonitor
+from distributed import VARIABLE_OPS, get_cluster, get_device_setter, get_worker_device, is_chief
+from utils import save_image, save_images, save_image_simple, slerp_batch, slerp, BackgroundWriter
 
 def next(loader):
     return loader.next()[0].data.numpy()
@@ -39,27 +40,89 @@ def norm_img(image, data_format=None):
 def denorm_img(norm, data_format):
     return tf.clip_by_value(to_nhwc((norm + 1)*127.5, data_format), 0, 255)
 
-def slerp(val, low, high):
-    """Code from https://github.com/soumith/dcgan.torch/issues/14"""
-    omega = np.arccos(np.clip(np.dot(low/np.linalg.norm(low), high/np.linalg.norm(high)), -1, 1))
-    so = np.sin(omega)
-    if so == 0:
-        return (1.0-val) * low + val * high # L'Hopital's rule/LERP
-    return np.sin((1.0-val)*omega) / so * low + np.sin(val*omega) / so * high
+def slerp_batch_tf(low, high, ratios, eps=1e-6):
+    """Same as `slerp_batch` for [N, z] tensors, returns a [N, R, z] tensor."""
+    ratios = tf.reshape(tf.convert_to_tensor(ratios, dtype=low.dtype), [1, -1, 1])
 
-def slerp_tf(val, low, high):
-    dot = tf.reduce_sum(tf.multiply(low/tf.norm(low), high/tf.norm(high)), 1, keep_dims=True)
-    omega = tf.acos(tf.clip_by_value(dot, -1, 1))
+    low_norm = low / tf.norm(low, axis=1, keep_dims=True)
+    high_norm = high / tf.norm(high, axis=1, keep_dims=True)
+    dot = tf.reduce_sum(low_norm * high_norm, 1)
+    omega = tf.reshape(tf.acos(tf.clip_by_value(dot, -1, 1)), [-1, 1, 1])
     so = tf.sin(omega)
-    if so == 0:
-        return (1.0-val) * low + val * high # L'Hopital's rule/LERP
-    return tf.sin((1.0-val)*omega) / so * low + tf.sin(val*omega) / so * high
 
+    parallel = tf.abs(so) < eps
+    safe_so = tf.where(parallel, tf.ones_like(so), so)
+
+    low, high = tf.expand_dims(low, 1), tf.expand_dims(high, 1)
+    lerp = (1.0-ratios) * low + ratios * high
+    slerp = tf.sin((1.0-ratios)*omega) / safe_so * low + tf.sin(ratios*omega) / safe_so * high
+
+    # tf.where needs a condition of the same shape as the branches
+    parallel = tf.logical_and(parallel, tf.ones_like(slerp, dtype=tf.bool))
+    return tf.where(parallel, lerp, slerp)
+
+def average_gradients(tower_grads):
+    """Average a list of per-tower `compute_gradients` results."""
+    if len(tower_grads) == 1:
+        return tower_grads[0]
+    averaged = []
+    for grads_and_vars in zip(*tower_grads):
+        grads = [g for g, _ in grads_and_vars if g is not None]
+        grad = tf.add_n(grads) / len(grads) if grads else None
+        averaged.append((grad, grads_and_vars[0][1]))
+    return averaged
+
+def compute_scaled_gradients(optimizer, loss, var_list, loss_scale=1.):
+    """`compute_gradients` of `loss * loss_scale`, unscaled again so the update is unchanged."""
+    if loss_scale == 1:
+        return optimizer.compute_gradients(loss, var_list=var_list)
+    grads_and_vars = optimizer.compute_gradients(loss * loss_scale, var_list=var_list)
+    return [(grad / loss_scale if grad is not None else None, var) for grad, var in grads_and_vars]
 
-class Trainer(object):
-    def __init__(self, config, data_loader):
+def slerp_tf(val, low, high):
+    return slerp_batch_tf(low, high, [val])[:, 0]
+
+
+class CheckpointCopy(object):
+    """Writes checkpoints from values fetched on the training thread.
+
+    The saved variables are mirrored in a separate CPU graph, so the
+    background writer never reads the training graph while it is updated.
+    The checkpoint keys and the meta graph are those of `saver`.
+    """
+
+    def __init__(self, graph, saver, variables):
+        self.train_graph = graph
+        self.saver_def = saver.saver_def
+        self.variables = variables
+
+        self.graph = tf.Graph()
+        with self.graph.as_default(), tf.device('/cpu:0'):
+            self.placeholders, copies = [], {}
+            for variable in variables:
+                placeholder = tf.placeholder(variable.dtype.base_dtype, variable.get_shape())
+                # the initializer assigns whatever is fed to the placeholder
+                copies[variable.op.name] = tf.Variable(placeholder, trainable=False, collections=[])
+                self.placeholders.append(placeholder)
+            self.assign_op = [copy.initializer for copy in copies.values()]
+            self.saver = tf.train.Saver(copies)
+        self.sess = tf.Session(graph=self.graph, config=tf.ConfigProto(device_count={'GPU': 0}))
+
+    def fetch(self, sess):
+        # one run, so every value is from the same step
+        return sess.run(self.variables)
+
+    def write(self, values, save_path, step):
+        self.sess.run(self.assign_op, dict(zip(self.placeholders, values)))
+        path = self.saver.save(self.sess, save_path, global_step=step, write_meta_graph=False)
+        tf.train.export_meta_graph(path + '.meta', graph=self.train_graph, saver_def=self.saver_def)
+        return path
+
+class Trainer(FolderEncoder):
+    def __init__(self, config, data_loader, triplet_loader=None):
         self.config = config
         self.data_loader = data_loader
+        self.triplet_loader = triplet_loader
         self.dataset = config.dataset
 
         self.beta1 = config.beta1
@@ -67,13 +130,20 @@ class Trainer(object):
         self.optimizer = config.optimizer
         self.batch_size = config.batch_size
 
-        self.step = tf.Variable(0, name='step', trainable=False)
+        # variables live on the ps tasks when running distributed
+        self.cluster = get_cluster(config)
+        self.is_chief = is_chief(config)
+        self.device_setter = get_device_setter(config, self.cluster)
+        self.worker_device = get_worker_device(config)
 
-        self.g_lr = tf.Variable(config.g_lr, name='g_lr')
-        self.d_lr = tf.Variable(config.d_lr, name='d_lr')
+        with tf.device(self.device_setter):
+            self.step = tf.Variable(0, name='step', trainable=False)
 
-        self.g_lr_update = tf.assign(self.g_lr, tf.maximum(self.g_lr * 0.5, config.lr_lower_boundary), name='g_lr_update')
-        self.d_lr_update = tf.assign(self.d_lr, tf.maximum(self.d_lr * 0.5, config.lr_lower_boundary), name='d_lr_update')
+            self.g_lr = tf.Variable(config.g_lr, name='g_lr')
+            self.d_lr = tf.Variable(config.d_lr, name='d_lr')
+
+            self.g_lr_update = tf.assign(self.g_lr, tf.maximum(self.g_lr * 0.5, config.lr_lower_boundary), name='g_lr_update')
+            self.d_lr_update = tf.assign(self.d_lr, tf.maximum(self.d_lr * 0.5, config.lr_lower_boundary), name='d_lr_update')
 
         self.gamma = config.gamma
         self.lambda_k = config.lambda_k
@@ -86,8 +156,28 @@ class Trainer(object):
         self.load_path = config.load_path
 
         self.use_gpu = config.use_gpu
+        self.num_towers = config.num_towers
         self.data_format = config.data_format
 
+        # G and D compute in `dtype`, the variables and losses stay float32
+        self.dtype = get_dtype(config.precision, config.use_gpu)
+        self.recompute = config.recompute
+        self.accum_steps = config.accum_steps
+        self.inversion_mode = config.inversion_mode
+        # traced runs on the scheduled steps only, plain sess.run otherwise
+        self.profiler = StepProfiler(os.path.join(self.model_dir, 'profile'),
+                                     config.profile_steps, config.profile_every)
+        # input wait, queue fill and images/sec of sampled steps, chief only
+        self.input_monitor = InputMonitor(
+                self.batch_size * self.accum_steps, os.path.join(self.model_dir, 'input_metrics.jsonl'),
+                config.input_metrics_every if self.is_chief else 0,
+                lambda summary, step: self.writer.put(self.write_summaries, [summary], step))
+        if config.loss_scale > 0:
+            self.loss_scale = config.loss_scale
+        else:
+            # float16 gradients underflow without scaling, bfloat16 has the float32 range
+            self.loss_scale = 128. if config.precision == 'float16' else 1.
+
         _, height, width, self.channel = \
                 get_conv_shape(self.data_loader, self.data_format)
         self.repeat_num = int(np.log2(height)) - 2
@@ -96,30 +186,46 @@ class Trainer(object):
         self.log_step = config.log_step
         self.max_step = config.max_step
         self.save_step = config.save_step
+        self.sample_mode = config.sample_mode
+        self.writer_queue_size = config.writer_queue_size
+        self.writer_policy = config.writer_policy
+        self.num_worker = config.num_worker
         self.lr_update_step = config.lr_update_step
 
         self.is_train = config.is_train
         self.is_posttrain = config.is_posttrain
+        self.posttrain_in_graph = config.posttrain_in_graph
 
-        self.build_model()
+        with tf.device(self.device_setter):
+            self.build_model()
+            self.saver = tf.train.Saver()
+            self.saved_variables = tf.global_variables()
+        self.checkpoint = None
 
-        self.saver = tf.train.Saver()
-        self.summary_writer = tf.summary.FileWriter(self.model_dir)
+        # only the chief writes summaries and checkpoints
+        self.summary_writer = tf.summary.FileWriter(self.model_dir) if self.is_chief else None
 
         sv = tf.train.Supervisor(logdir=self.model_dir,
-                                 is_chief=True,
+                                 is_chief=self.is_chief,
                                  saver=self.saver,
                                  summary_op=None,
                                  summary_writer=self.summary_writer,
-                                 save_model_secs=300,
+                                 save_model_secs=0,
                                  global_step=self.step,
                                  ready_for_local_init_op=None)
 
         gpu_options = tf.GPUOptions(allow_growth=True)
         sess_config = tf.ConfigProto(allow_soft_placement=True,
                                      gpu_options=gpu_options)
+        if not self.use_gpu and self.num_towers > 1:
+            # one CPU device per tower
+            sess_config.device_count['CPU'] = self.num_towers
+        if self.cluster is not None:
+            # ignore the other workers, only talk to the ps tasks
+            sess_config.device_filters.extend(['/job:ps', self.worker_device])
 
-        self.sess = sv.prepare_or_wait_for_session(config=sess_config)
+        # non-chief workers wait until the chief initialized the variables
+        self.sess = sv.prepare_or_wait_for_session(getattr(config, 'master', ''), config=sess_config)
 
         if not self.is_train:
             # dirty way to bypass graph finilization error
@@ -138,53 +244,142 @@ class Trainer(object):
         z_fixed = np.random.uniform(-1, 1, size=(self.batch_size, self.z_num))
         # save a fixed batch
         x_fixed = self.get_image_from_loader()
-        save_image(x_fixed, '{}/x_fixed.png'.format(self.model_dir))
+        if self.is_chief:
+            save_image(x_fixed, '{}/x_fixed.png'.format(self.model_dir))
 
         # use prev_measure to keep track of status during train loop
         prev_measure = 1
         # use queue for faster appending of measures for training history
         measure_history = deque([0]*self.lr_update_step, self.lr_update_step)
-
-        # loop through from initial step to final step
-        for step in trange(self.start_step, self.max_step):
-            # define base fetch dictionary to give to sess.run()
-            fetch_dict = {
-                "k_update": self.k_update,
-                "measure": self.measure,
+        # learning rate decays done so far, by the global step (distributed only)
+        lr_epoch = None
+        # wall time of the training runs and of the sampling done on top of them
+        step_times = deque(maxlen=self.log_step)
+        sample_times = deque(maxlen=10)
+        self.writer = BackgroundWriter(self.writer_queue_size, self.writer_policy)
+
+        try:
+            # loop through from initial step to final step
+            for step in trange(self.start_step, self.max_step):
+                # define base fetch dictionary to give to sess.run()
+                fetch_dict = {
+                    "k_update": self.k_update,
+                    "measure": self.measure,
+                }
+                if self.cluster is not None:
+                    fetch_dict["step"] = self.step
+                is_sample_step = step % (self.log_step * 10) == 0 and self.is_chief
+                # add to fetch dictionary if mod steps 
+                if step % self.log_step == 0 and self.is_chief:
+                    fetch_dict.update({
+                        "summary": self.summary_op if self.sample_mode == 'separate' else self.scalar_summary_op,
+                        "g_loss": self.g_loss,
+                        "d_loss": self.d_loss,
+                        "k_t": self.k_t,
+                    })
+                if is_sample_step and self.sample_mode != 'separate':
+                    # image summaries only when sampling, from the tensors of this step
+                    fetch_dict["image_summary"] = self.image_summary_op
+                    if self.sample_mode == 'reuse':
+                        fetch_dict.update({"G": self.G, "AE_G": self.AE_G, "AE_x": self.AE_x})
+                # run the training !!!!
+                start_time = time.time()
+                for _ in range(self.accum_steps - 1):
+                    self.sess.run(self.accum_op)
+                result = self.input_monitor.run(self.sess, fetch_dict, step, self.profiler)
+                step_times.append(time.time() - start_time)
+                # append the measure history
+                measure = result['measure']
+                measure_history.append(measure)
+
+                if self.cluster is not None:
+                    # workers share `step`, stop once the cluster as a whole is done
+                    global_step = result['step']
+                    if global_step >= self.max_step:
+                        break
+                    if lr_epoch is None:
+                        lr_epoch = global_step // self.lr_update_step
+                    if self.is_chief and global_step // self.lr_update_step > lr_epoch:
+                        lr_epoch = global_step // self.lr_update_step
+                        self.sess.run([self.g_lr_update, self.d_lr_update])
+                    if not self.is_chief:
+                        continue
+
+                # and then if every 10 * log_step mod, autoencode and generate an example
+                if is_sample_step:
+                    start_time = time.time()
+                    self.sample(step, z_fixed, x_fixed, result)
+                    sample_times.append(time.time() - start_time)
+
+                # if mod log_step, record the summary to terminal
+                if step % self.log_step == 0:
+                    step_time, sample_time = np.mean(step_times), np.mean(sample_times or [0])
+                    summaries = [result['summary'], tf.Summary(value=[
+                        tf.Summary.Value(tag='time/step', simple_value=step_time),
+                        tf.Summary.Value(tag='time/sample', simple_value=sample_time),
+                    ])]
+                    if 'image_summary' in result:
+                        summaries.append(result['image_summary'])
+                    self.writer.put(self.write_summaries, summaries, result.get('step', step))
+
+                    g_loss = result['g_loss']
+                    d_loss = result['d_loss']
+                    k_t = result['k_t']
+
+                    print("[{}/{}] Loss_D: {:.6f} Loss_G: {:.6f} measure: {:.4f}, k_t: {:.4f} step: {:.3f}s sample: {:.3f}s". \
+                          format(step, self.max_step, d_loss, g_loss, measure, k_t, step_time, sample_time))
+
+                # update the learning rate if necessary (decrease every X iterations)
+                if self.cluster is None and step % self.lr_update_step == self.lr_update_step - 1:
+                    self.sess.run([self.g_lr_update, self.d_lr_update])
+
+                if self.is_chief and step % self.save_step == self.save_step - 1:
+                    self.save_checkpoint()
+
+            if self.is_chief:
+                self.save_checkpoint()
+        finally:
+            # flush pending images, summaries and checkpoints
+            self.writer.close()
+
+    def write_summaries(self, summaries, step):
+        for summary in summaries:
+            self.summary_writer.add_summary(summary, step)
+        self.summary_writer.flush()
+
+    def save_checkpoint(self):
+        if self.checkpoint is None:
+            self.checkpoint = CheckpointCopy(self.sess.graph, self.saver, self.saved_variables)
+        # values and `step` are read here, between training runs, only the
+        # file write is left to the writer and it is never dropped
+        values = self.checkpoint.fetch(self.sess)
+        step = values[self.checkpoint.variables.index(self.step)]
+        self.writer.put_blocking(
+                self.checkpoint.write, values, os.path.join(self.model_dir, 'model.ckpt'), step)
+
+    def sample(self, step, z_fixed, x_fixed, result=None):
+        if self.sample_mode == 'separate':
+            x_fake = self.generate(z_fixed, save=False)
+            images = {
+                'G': x_fake,
+                'D_real': self.autoencode_nosave(x_fixed),
+                'D_fake': self.autoencode_nosave(x_fake),
             }
-            # add to fetch dictionary if mod steps 
-            if step % self.log_step == 0:
-                fetch_dict.update({
-                    "summary": self.summary_op,
-                    "g_loss": self.g_loss,
-                    "d_loss": self.d_loss,
-                    "k_t": self.k_t,
-                })
-            # run the training !!!!
-            result = self.sess.run(fetch_dict)
-            # append the measure history
-            measure = result['measure']
-            measure_history.append(measure)
-            # if mod log_step, record the summary to terminal
-            if step % self.log_step == 0:
-                self.summary_writer.add_summary(result['summary'], step)
-                self.summary_writer.flush()
-
-                g_loss = result['g_loss']
-                d_loss = result['d_loss']
-                k_t = result['k_t']
-
-                print("[{}/{}] Loss_D: {:.6f} Loss_G: {:.6f} measure: {:.4f}, k_t: {:.4f}". \
-                      format(step, self.max_step, d_loss, g_loss, measure, k_t))
-
-            # and then if every 10 * log_step mod, autoencode and generate an example
-            if step % (self.log_step * 10) == 0:
-                x_fake = self.generate(z_fixed, self.model_dir, idx=step)
-                self.autoencode(x_fixed, self.model_dir, idx=step, x_fake=x_fake)
-
-            # update the learning rate if necessary (decrease every X iterations)
-            if step % self.lr_update_step == self.lr_update_step - 1:
-                self.sess.run([self.g_lr_update, self.d_lr_update])
+        elif self.sample_mode == 'fused':
+            images = self.sess.run({
+                'G': self.sample_G,
+                'D_fake': self.sample_AE_G,
+                'D_real': self.sample_AE_x,
+            }, {self.sample_z: z_fixed, self.sample_x: x_fixed})
+        elif self.sample_mode == 'reuse':
+            # computed by the training step itself, on its own z and batch
+            images = {'G': result['G'], 'D_fake': result['AE_G'], 'D_real': result['AE_x']}
+        else:
+            raise Exception("[!] Unknown sample_mode: {}".format(self.sample_mode))
+
+        for key, x in images.items():
+            path = os.path.join(self.model_dir, '{}_{}.png'.format(step, key))
+            self.writer.put(save_image, x, path)
 
     def build_model(self):
         # get the next batch from the data loader
@@ -197,23 +392,6 @@ class Trainer(object):
         # set-up a non-trainable k_t variable
         # to maintain balance between D loss and G loss
         self.k_t = tf.Variable(0., trainable=False, name='k_t')
-        # G     --> output of the generator
-        # G_var --> generator variables 
-        G, self.G_var = GeneratorCNN(
-                self.z, self.conv_hidden_num, self.channel,
-                self.repeat_num, self.data_format, reuse=False)
-        # d_out --> output of discriminator
-        # D_z   --> encoded output (z)
-        # D_var --> discriminator variables
-        d_out, self.D_z, self.D_var = DiscriminatorCNN(
-                tf.concat([G, x], 0), self.channel, self.z_num, self.repeat_num,
-                self.conv_hidden_num, self.data_format, reuse=False)
-        # cut output into 2 --> G and X
-        AE_G, AE_x = tf.split(d_out, 2)
-
-        # convert back to image space (from [-1, 1] --> [0, 255])
-        self.G = denorm_img(G, self.data_format)
-        self.AE_G, self.AE_x = denorm_img(AE_G, self.data_format), denorm_img(AE_x, self.data_format)
 
         # Adam optimizer
         if self.optimizer == 'adam':
@@ -224,21 +402,57 @@ class Trainer(object):
         # initialize generator and discriminator optimizers
         g_optimizer, d_optimizer = optimizer(self.g_lr), optimizer(self.d_lr)
 
-        # losses to ensure auto-encoding works!
-        # d_loss_real --> mean(| AE_x - x |)
-        # d_loss_fake --> mean(| AE_G - G |)
-        self.d_loss_real = tf.reduce_mean(tf.abs(AE_x - x))
-        self.d_loss_fake = tf.reduce_mean(tf.abs(AE_G - G))
+        # split the batch across towers, every tower shares the G and D variables
+        if self.batch_size % self.num_towers != 0:
+            raise Exception("[!] batch_size {} is not divisible by num_towers {}".format(
+                    self.batch_size, self.num_towers))
+        towers = []
+        for idx, (tower_x, tower_z) in enumerate(zip(tf.split(x, self.num_towers),
+                                                     tf.split(self.z, self.num_towers))):
+            with tf.device(self.tower_device(idx)), tf.name_scope(self.tower_scope(idx)):
+                towers.append(self.build_tower(tower_x, tower_z, reuse=idx > 0))
+
+        self.G_var, self.D_var = towers[0]['G_var'], towers[0]['D_var']
+
+        # convert back to image space (from [-1, 1] --> [0, 255])
+        self.G = denorm_img(tf.concat([t['G'] for t in towers], 0), self.data_format)
+        self.AE_G = denorm_img(tf.concat([t['AE_G'] for t in towers], 0), self.data_format)
+        self.AE_x = denorm_img(tf.concat([t['AE_x'] for t in towers], 0), self.data_format)
+        # keep the codes ordered as [G, x] like a single tower
+        self.D_z = tf.concat([tf.split(t['D_z'], 2)[0] for t in towers] +
+                             [tf.split(t['D_z'], 2)[1] for t in towers], 0) \
+                if self.num_towers > 1 else towers[0]['D_z']
+
+        # towers see equally sized slices, so the mean of the
+        # tower losses equals the loss of the whole batch
+        d_loss_real = tf.add_n([t['d_loss_real'] for t in towers]) / self.num_towers
+        d_loss_fake = tf.add_n([t['d_loss_fake'] for t in towers]) / self.num_towers
+
+        d_grads, g_grads = [], []
+        for idx, tower in enumerate(towers):
+            with tf.device(self.tower_device(idx)), tf.name_scope(self.tower_scope(idx)):
+                d_grads.append(compute_scaled_gradients(
+                        d_optimizer, tower['d_loss'], self.D_var, self.loss_scale))
+                g_grads.append(compute_scaled_gradients(
+                        g_optimizer, tower['g_loss'], self.G_var, self.loss_scale))
+        d_grads, g_grads = average_gradients(d_grads), average_gradients(g_grads)
+
+        self.accum_op, reset = None, None
+        if self.accum_steps > 1:
+            # losses and gradients become means over the accumulated micro-batches
+            (d_grads, g_grads, (d_loss_real, d_loss_fake)), self.accum_op, reset = \
+                    self.build_accumulation([d_grads, g_grads], [d_loss_real, d_loss_fake])
+        self.d_loss_real, self.d_loss_fake = d_loss_real, d_loss_fake
 
         # weight discriminator loss!
         self.d_loss = self.d_loss_real - self.k_t * self.d_loss_fake
         # g_loss --> mean(| AE_G - G |)
-        self.g_loss = tf.reduce_mean(tf.abs(AE_G - G))
+        self.g_loss = self.d_loss_fake
 
         # d_optim --> optimize d_loss by update discriminator variables
-        d_optim = d_optimizer.minimize(self.d_loss, var_list=self.D_var)
+        d_optim = d_optimizer.apply_gradients(d_grads)
         # g_optim --> optimize g_loss by updating generator variables
-        g_optim = g_optimizer.minimize(self.g_loss, global_step=self.step, var_list=self.G_var)
+        g_optim = g_optimizer.apply_gradients(g_grads, global_step=self.step)
 
         # define a single balanced loss equation
         # balance --> gamma * d_loss_real - g_loss
@@ -253,12 +467,19 @@ class Trainer(object):
             self.k_update = tf.assign(
                 self.k_t, tf.clip_by_value(self.k_t + self.lambda_k * self.balance, 0, 1))
 
+        if reset is not None:
+            # clear the accumulators once everything fetched in this run read them
+            self.k_update = tf.group(self.k_update, reset([
+                    self.k_update, self.measure, self.d_loss, self.g_loss]))
+
         # define a summary so as to keep track
         # of the training progress
-        self.summary_op = tf.summary.merge([
+        self.image_summary_op = tf.summary.merge([
             tf.summary.image("G", self.G),
             tf.summary.image("AE_G", self.AE_G),
             tf.summary.image("AE_x", self.AE_x),
+        ])
+        self.scalar_summary_op = tf.summary.merge([
             tf.summary.scalar("loss/d_loss", self.d_loss),
             tf.summary.scalar("loss/d_loss_real", self.d_loss_real),
             tf.summary.scalar("loss/d_loss_fake", self.d_loss_fake),
@@ -269,7 +490,126 @@ class Trainer(object):
             tf.summary.scalar("misc/g_lr", self.g_lr),
             tf.summary.scalar("misc/balance", self.balance),
         ])
+        self.summary_op = tf.summary.merge([self.image_summary_op, self.scalar_summary_op])
+
+        if self.sample_mode == 'fused':
+            self.build_sample_model()
+
+    def build_sample_model(self):
+        # generate and autoencode the fixed samples in one pass,
+        # D sees [G(z), x] just like in the training step
+        x_shape = [None] + self.x.get_shape().as_list()[1:]
+        self.sample_z = tf.placeholder(tf.float32, [None, self.z_num], name='sample_z')
+        self.sample_x = tf.placeholder(tf.float32, x_shape, name='sample_x')
+
+        G, _ = GeneratorCNN(
+                self.sample_z, self.conv_hidden_num, self.channel,
+                self.repeat_num, self.data_format, reuse=True, dtype=self.dtype)
+        # `autoencode` feeds denorm_img(G) back through norm_img,
+        # which is the same as clipping G to [-1, 1]
+        d_out, _, _ = DiscriminatorCNN(
+                tf.concat([tf.clip_by_value(G, -1., 1.), norm_img(self.sample_x)], 0),
+                self.channel, self.z_num, self.repeat_num,
+                self.conv_hidden_num, self.data_format, reuse=True, dtype=self.dtype)
+        AE_G, AE_x = tf.split(d_out, 2)
+
+        self.sample_G = denorm_img(G, self.data_format)
+        self.sample_AE_G = denorm_img(AE_G, self.data_format)
+        self.sample_AE_x = denorm_img(AE_x, self.data_format)
+
+
+    def build_accumulation(self, grads_and_vars_list, losses):
+        """Sums gradients and losses of `accum_steps` runs.
+
+        `accum_op` adds the values of a micro-batch to the sums. The returned
+        gradients and losses are the means over the sums plus the current
+        micro-batch, so the run that applies them sees the large batch.
+        `reset` builds the op that clears the sums after its dependencies.
+        """
+        scale = 1. / self.accum_steps
+        # local to every worker, and kept out of the checkpoints
+        collections = [tf.GraphKeys.LOCAL_VARIABLES]
+
+        def slot(value, name):
+            return tf.Variable(tf.zeros(value.get_shape(), value.dtype.base_dtype),
+                               trainable=False, collections=collections, name=name)
+
+        slots, updates, means = [], [], []
+        with tf.device(self.worker_device or None), tf.name_scope('accumulate'):
+            for grads_and_vars in grads_and_vars_list:
+                mean_grads_and_vars = []
+                for grad, var in grads_and_vars:
+                    if grad is None:
+                        mean_grads_and_vars.append((grad, var))
+                        continue
+                    total = slot(var, var.op.name)
+                    slots.append(total)
+                    updates.append(tf.assign_add(total, grad))
+                    mean_grads_and_vars.append(((total + grad) * scale, var))
+                means.append(mean_grads_and_vars)
+
+            mean_losses = []
+            for idx, loss in enumerate(losses):
+                total = slot(loss, 'loss_{}'.format(idx))
+                slots.append(total)
+                updates.append(tf.assign_add(total, loss))
+                mean_losses.append((total + loss) * scale)
+            means.append(mean_losses)
+
+            accum_op = tf.group(*updates, name='accum_op')
+
+        def reset(dependencies):
+            with tf.control_dependencies(dependencies):
+                return tf.group(*[tf.assign(total, tf.zeros_like(total)) for total in slots])
+        return means, accum_op, reset
+
+    def build_tower(self, x, z, reuse):
+        # G     --> output of the generator
+        # G_var --> generator variables
+        G, G_var = GeneratorCNN(
+                z, self.conv_hidden_num, self.channel,
+                self.repeat_num, self.data_format, reuse=reuse, dtype=self.dtype,
+                recompute=self.recompute)
+        # d_out --> output of discriminator
+        # D_z   --> encoded output (z)
+        # D_var --> discriminator variables
+        d_out, D_z, D_var = DiscriminatorCNN(
+                tf.concat([G, x], 0), self.channel, self.z_num, self.repeat_num,
+                self.conv_hidden_num, self.data_format, reuse=reuse, dtype=self.dtype,
+                recompute=self.recompute)
+        # cut output into 2 --> G and X
+        AE_G, AE_x = tf.split(d_out, 2)
+
+        # losses to ensure auto-encoding works!
+        # d_loss_real --> mean(| AE_x - x |)
+        # d_loss_fake --> mean(| AE_G - G |)
+        d_loss_real = tf.reduce_mean(tf.abs(AE_x - x))
+        d_loss_fake = tf.reduce_mean(tf.abs(AE_G - G))
+
+        return {
+            'G': G, 'AE_G': AE_G, 'AE_x': AE_x, 'D_z': D_z,
+            'G_var': G_var, 'D_var': D_var,
+            'd_loss_real': d_loss_real,
+            'd_loss_fake': d_loss_fake,
+            'd_loss': d_loss_real - self.k_t * d_loss_fake,
+            'g_loss': d_loss_fake,
+        }
+
+    def tower_device(self, idx):
+        if self.num_towers == 1:
+            return self.device_setter
+        device = self.worker_device + ('/gpu:{}' if self.use_gpu else '/cpu:{}').format(idx)
 
+        def place(op):
+            # keep the shared variables on the host (or the ps tasks),
+            # compute on the tower device
+            if op.type in VARIABLE_OPS:
+                return self.device_setter(op) if self.device_setter else '/cpu:0'
+            return device
+        return place
+
+    def tower_scope(self, idx):
+        return 'tower_{}'.format(idx) if self.num_towers > 1 else None
 
     def build_test_model(self):
         # define a variable scope
@@ -284,7 +624,7 @@ class Trainer(object):
         # reuse the generator architecture
         # but accept z_r as the input
         G_z_r, _ = GeneratorCNN(
-                self.z_r, self.conv_hidden_num, self.channel, self.repeat_num, self.data_format, reuse=True)
+                self.z_r, self.conv_hidden_num, self.channel, self.repeat_num, self.data_format, reuse=True, dtype=self.dtype)
 
         # use previous variable scope
         with tf.variable_scope("test") as vs:
@@ -298,6 +638,17 @@ class Trainer(object):
         # initialize the variables
         self.sess.run(tf.variables_initializer(test_variables))
 
+        if self.inversion_mode == 'engine':
+            config = self.config
+            self.inversion = InversionEngine(
+                    lambda z: GeneratorCNN(
+                            z, self.conv_hidden_num, self.channel, self.repeat_num,
+                            self.data_format, reuse=True, dtype=self.dtype)[0],
+                    self.z_num, int_shape(self.G)[1:],
+                    self.data_format, num_restarts=config.inversion_restarts,
+                    max_iters=config.inversion_iters, lr=config.inversion_lr,
+                    patience=config.inversion_patience)
+
 
 
     # def build_post_train(self):
@@ -368,32 +719,40 @@ class Trainer(object):
     #     self.sess.run(tf.variables_initializer(variables))
 
     def build_post_train(self):
+        if self.posttrain_in_graph:
+            # encode the parents and slerp inside the graph
+            # so that each step is a single sess.run
+            dad, kid, mom = self.get_triplet_tensors()
+            self.kid_x = norm_img(kid)
+            # self.encode() feeds already normalized images into self.x, which
+            # build_model normalizes again; keep the same input for both modes
+            parents = norm_img(norm_img(tf.concat([dad, mom], 0)))
+            _, parents_z, _ = DiscriminatorCNN(
+                    parents, self.channel, self.z_num, self.repeat_num,
+                    self.conv_hidden_num, self.data_format, reuse=True, dtype=self.dtype)
+            dad_z, mom_z = tf.split(parents_z, 2)
+            # the fed z_parents never carried gradients back into D
+            self.z_parents = tf.stop_gradient(slerp_tf(0.5, dad_z, mom_z))
 
-        # THE PROBLEM: EVERYTHING HERE IS NUMPY BASED
-        # AND NEEDS TO MOVE TO TF
         with tf.variable_scope('post_train') as vs:
-            # initialize data
-            #self.kid_x = kid_x = tf.get_variable("kid_x", [self.batch_size,
-            #                             self.input_scale_size, self.input_scale_size, 3], tf.float32)
-            #self.z_parents = z_parents = tf.get_variable("z_parents", [self.batch_size, self.z_num], tf.float32)
-
-            self.kid_x = tf.placeholder('float', shape=(self.batch_size, self.input_scale_size,
-                                                   self.input_scale_size, 3), name='kid_x')
-            self.z_parents = tf.placeholder('float', shape=(self.batch_size, self.z_num), name='z_parents')
-            #self.kid_x = kid_x
-            #self.z_parents = z_parents
+            if not self.posttrain_in_graph:
+                self.kid_x = tf.placeholder('float', shape=(self.batch_size, self.input_scale_size,
+                                                       self.input_scale_size, 3), name='kid_x')
+                self.z_parents = tf.placeholder('float', shape=(self.batch_size, self.z_num), name='z_parents')
 
 
         # self.z has to be the interpolated
         G, G_var = GeneratorCNN(
                 self.z_parents, self.conv_hidden_num, self.channel,
-                self.repeat_num, self.data_format, reuse=True)
+                self.repeat_num, self.data_format, reuse=True, dtype=self.dtype,
+                recompute=self.recompute)
         # d_out --> output of discriminator
         # D_z   --> encoded output (z)
         # D_var --> discriminator variables
         d_out, D_z, D_var = DiscriminatorCNN(
                 tf.concat([G, self.kid_x], 0), self.channel, self.z_num, self.repeat_num,
-                self.conv_hidden_num, self.data_format, reuse=True)
+                self.conv_hidden_num, self.data_format, reuse=True, dtype=self.dtype,
+                recompute=self.recompute)
 
         with tf.variable_scope('post_train') as vs:
             # cut output into 2 --> G and X
@@ -423,9 +782,11 @@ class Trainer(object):
             self.g_loss_child = tf.reduce_mean(tf.abs(AE_G - G))
 
             # d_optim --> optimize d_loss by update discriminator variables
-            d_optim = d_optimizer.minimize(self.d_loss_child, var_list=D_var)
+            d_optim = d_optimizer.apply_gradients(compute_scaled_gradients(
+                    d_optimizer, self.d_loss_child, D_var, self.loss_scale))
             # g_optim --> optimize g_loss by updating generator variables
-            g_optim = g_optimizer.minimize(self.g_loss_child, global_step=self.step, var_list=G_var)
+            g_optim = g_optimizer.apply_gradients(compute_scaled_gradients(
+                    g_optimizer, self.g_loss_child, G_var, self.loss_scale), global_step=self.step)
 
             # define a single balanced loss equation
             # balance --> gamma * d_loss_real - g_loss
@@ -447,49 +808,65 @@ class Trainer(object):
         # create random vector
         z_fixed = np.random.uniform(-1, 1, size=(self.batch_size, self.z_num))
         # save a fixed batch
-        x_fixed = self.get_image_from_loader()
+        x_fixed = np.concatenate(self.get_triplet_from_loader(), 2)
         save_image(x_fixed, '{}/x_fixed_child.png'.format(self.model_dir))
 
-        for step in trange(epoch):
-            batch = self.get_image_from_loader()
-            batch = norm_img(batch)
-            dad_x = batch[:, :, :128, :]
-            kid_x = batch[:, :, 128:256, :]
-            mom_x = batch[:, :, 256:, :]
-
-            #dad_encode = self.encode(dad_x)
-            #mom_encode = self.encode(mom_x)
-
-            _, dad_encode = np.split(self.encode(dad_x), 2)
-            _, mom_encode = np.split(self.encode(mom_x), 2)
-            
-            z_parents = np.stack([slerp(0.5, r1, r2) for r1, r2 in zip(dad_encode, mom_encode)])
-
-            fetch_dict = {
-                "train_child_loss": self.train_child_loss,
-                "g_loss_child": self.g_loss_child,
-                "d_loss_child": self.d_loss_child
-            }
+        self.profiler.name = 'post_train'
+        self.writer = BackgroundWriter(self.writer_queue_size, self.writer_policy)
+        try:
+            for step in trange(epoch):
+                result = self.post_train_step(step)
+
+                if step % self.log_step == 0:
+                    g_loss = result['g_loss_child']
+                    d_loss = result['d_loss_child']
+                    total_loss = result['train_child_loss']
+                    print("[{}/{}] Loss_D: {:.6f} Loss_G: {:.6f} Combined: {:.6f}". \
+                          format(step, epoch, d_loss, g_loss, total_loss))
+
+                    x_fake = self.generate(z_fixed, self.model_dir, idx=step)
+                    self.autoencode(x_fixed[:, :, 128:256, :], self.model_dir, idx=step, x_fake=x_fake)
+
+                if step % self.save_step == self.save_step - 1:
+                    self.save_checkpoint()
+            self.save_checkpoint()
+        finally:
+            self.writer.close()
+
+    def post_train_step(self, step=None):
+        fetch_dict = {
+            "train_child_loss": self.train_child_loss,
+            "g_loss_child": self.g_loss_child,
+            "d_loss_child": self.d_loss_child
+        }
 
-            feed_dict = {
-                self.kid_x: kid_x,
-                self.z_parents: z_parents
-            }
+        if self.posttrain_in_graph:
+            return self.input_monitor.run(self.sess, fetch_dict, step, self.profiler)
+
+        dad_x, kid_x, mom_x = [norm_img(x) for x in self.get_triplet_from_loader()]
+
+        dad_encode = self.encode_codes(dad_x)
+        mom_encode = self.encode_codes(mom_x)
 
-            result = self.sess.run(fetch_dict, feed_dict=feed_dict)
+        z_parents = slerp_batch(dad_encode, mom_encode, [0.5])[:, 0]
 
-            if step % self.log_step == 0:
-                g_loss = result['g_loss_child']
-                d_loss = result['d_loss_child']
-                total_loss = result['train_child_loss']
-                print("[{}/{}] Loss_D: {:.6f} Loss_G: {:.6f} Combined: {:.6f}". \
-                      format(step, epoch, d_loss, g_loss, total_loss))
+        feed_dict = {
+            self.kid_x: kid_x,
+            self.z_parents: z_parents
+        }
+
+        return self.input_monitor.run(self.sess, fetch_dict, step, self.profiler, feed_dict)
 
-                x_fake = self.generate(z_fixed, self.model_dir, idx=step)
-                self.autoencode(x_fixed[:, :, 128:256, :], self.model_dir, idx=step, x_fake=x_fake)
+    def run_batches(self, fn, inputs):
+        """`fn` on `inputs` in chunks padded to the static batch size of the graph."""
+        outputs = []
+        for start in range(0, len(inputs), self.batch_size):
+            chunk = inputs[start:start + self.batch_size]
+            outputs.append(fn(pad_batch(chunk, self.batch_size))[:len(chunk)])
+        return np.concatenate(outputs)
 
     def generate(self, inputs, root_path=None, path=None, idx=None, save=True):
-        x = self.sess.run(self.G, {self.z: inputs})
+        x = self.run_batches(lambda z: self.sess.run(self.G, {self.z: z}), inputs)
         if path is None and save:
             path = os.path.join(root_path, '{}_G.png'.format(idx))
             save_image(x, path)
@@ -517,66 +894,75 @@ class Trainer(object):
         return self.sess.run(self.D_z, {self.x: inputs})
 
     def decode(self, z):
+        if self.num_towers > 1:
+            raise Exception("[!] Feeding codes is not supported with num_towers > 1, use --engine=inference")
         return self.sess.run(self.AE_x, {self.D_z: z})
 
+    def autoencode_codes(self, inputs):
+        # codes and reconstructions of the real images in a single run
+        z, x = self.sess.run([self.D_z, self.AE_x], {self.x: inputs})
+        return z[len(inputs):], x
+
+    def encode_codes(self, inputs):
+        # D_z holds the codes of [G, x], the real images are the second half
+        return self.run_batches(lambda x: self.encode(x)[len(x):], inputs)
+
+    def decode_codes(self, z):
+        # AE_x is the second half of the D batch, so pad the codes in front
+        return self.run_batches(lambda z: self.decode(np.concatenate([np.zeros_like(z), z])), z)
+
     def interpolate_G(self, real_batch, step=0, root_path='.', train_epoch=0):
         batch_size = len(real_batch)
         half_batch_size = int(batch_size/2)
 
-        self.sess.run(self.z_r_update)
-        tf_real_batch = to_nchw_numpy(real_batch)
-        for i in trange(train_epoch):
-            z_r_loss, _ = self.sess.run([self.z_r_loss, self.z_r_optim], {self.x: tf_real_batch})
-        z = self.sess.run(self.z_r)
+        if self.inversion_mode == 'engine':
+            # every image and restart in one in-graph optimization
+            z, loss, iterations = self.inversion.invert(self.sess, real_batch)
+            print("[*] Inverted {} images in {} iterations, loss: {:.4f}".format(
+                    batch_size, iterations, np.mean(loss)))
+        else:
+            self.sess.run(self.z_r_update)
+            tf_real_batch = to_nchw_numpy(real_batch)
+            for i in trange(train_epoch):
+                z_r_loss, _ = self.sess.run([self.z_r_loss, self.z_r_optim], {self.x: tf_real_batch})
+            z = self.sess.run(self.z_r)
 
         z1, z2 = z[:half_batch_size], z[half_batch_size:]
         real1_batch, real2_batch = real_batch[:half_batch_size], real_batch[half_batch_size:]
 
-        generated = []
-        for idx, ratio in enumerate(np.linspace(0, 1, 10)):
-            z = np.stack([slerp(ratio, r1, r2) for r1, r2 in zip(z1, z2)])
-            z_decode = self.generate(z, save=False)
-            generated.append(z_decode)
-
-        generated = np.stack(generated).transpose([1, 0, 2, 3, 4])
-        for idx, img in enumerate(generated):
-            save_image(img, os.path.join(root_path, 'test{}_interp_G_{}.png'.format(step, idx)), nrow=10)
+        z = slerp_batch(z1, z2, np.linspace(0, 1, 10))
+        generated = self.generate(z.reshape([-1, self.z_num]), save=False)
+        generated = generated.reshape(list(z.shape[:2]) + list(generated.shape[1:]))
+        items = [(img, os.path.join(root_path, 'test{}_interp_G_{}.png'.format(step, idx)))
+                 for idx, img in enumerate(generated)]
 
         all_img_num = np.prod(generated.shape[:2])
         batch_generated = np.reshape(generated, [all_img_num] + list(generated.shape[2:]))
-        save_image(batch_generated, os.path.join(root_path, 'test{}_interp_G.png'.format(step)), nrow=10)
+        items.append((batch_generated, os.path.join(root_path, 'test{}_interp_G.png'.format(step))))
+        save_images(items, self.num_worker, nrow=10)
 
     def interpolate_D(self, real1_batch, real2_batch, step=0, root_path="."):
-        real1_encode = self.encode(real1_batch)
-        real2_encode = self.encode(real2_batch)
-
-        decodes = []
-        for idx, ratio in enumerate(np.linspace(0, 1, 10)):
-            z = np.stack([slerp(ratio, r1, r2) for r1, r2 in zip(real1_encode, real2_encode)])
-            #z = np.stack([slerp(ratio, r1, r2) for r1, r2 in zip(real1_batch, real2_batch)])
-            z_decode = self.decode(z)
-            decodes.append(z_decode)
+        real1_encode = self.encode_codes(real1_batch)
+        real2_encode = self.encode_codes(real2_batch)
 
-        decodes = np.stack(decodes).transpose([1, 0, 2, 3, 4])
+        decodes = self.decode_interpolations(real1_encode, real2_encode, np.linspace(0, 1, 10))
+        items = []
         for idx, img in enumerate(decodes):
             img = np.concatenate([[real1_batch[idx]], img, [real2_batch[idx]]], 0)
-            save_image(img, os.path.join(root_path, 'test{}_interp_D_{}.png'.format(step, idx)), nrow=10 + 2)
+            items.append((img, os.path.join(root_path, 'test{}_interp_D_{}.png'.format(step, idx))))
+        save_images(items, self.num_worker, nrow=10 + 2)
 
     def interpolate_D_midpoint(self, real1_batch, real2_batch, ratio=0.5, step=0, root_path="."):
-        real1_encode = self.encode(real1_batch)
-        real2_encode = self.encode(real2_batch)
+        real1_encode = self.encode_codes(real1_batch)
+        real2_encode = self.encode_codes(real2_batch)
 
-        decodes = []
-        for idx, ratio in enumerate([ratio]):
-            z = np.stack([slerp(ratio, r1, r2) for r1, r2 in zip(real1_encode, real2_encode)])
-            z_decode = self.decode(z)
-            decodes.append(z_decode)
-
-        decodes = np.stack(decodes).transpose([1, 0, 2, 3, 4])
+        decodes = self.decode_interpolations(real1_encode, real2_encode, [ratio])
+        items = []
         for idx, img in enumerate(decodes):
             save_image_simple(img, 'test{}_interp_D_{}.png'.format(step, idx))
             img = np.concatenate([[real1_batch[idx]], img, [real2_batch[idx]]], 0)
-            save_image(img, os.path.join(root_path, 'test{}_interp_D_{}.png'.format(step, idx)), nrow=10 + 2)
+            items.append((img, os.path.join(root_path, 'test{}_interp_D_{}.png'.format(step, idx))))
+        save_images(items, self.num_worker, nrow=10 + 2)
 
     def test(self):
         root_path = "./"#self.model_dir
@@ -589,8 +975,10 @@ class Trainer(object):
             print('Real1batch shape:', real1_batch.shape)
             print('Max:', np.max(real1_batch), 'Min:', np.min(real1_batch))
 
-            save_image(real1_batch, os.path.join(root_path, 'test{}_real1.png'.format(step)))
-            save_image(real2_batch, os.path.join(root_path, 'test{}_real2.png'.format(step)))
+            save_images([
+                (real1_batch, os.path.join(root_path, 'test{}_real1.png'.format(step))),
+                (real2_batch, os.path.join(root_path, 'test{}_real2.png'.format(step))),
+            ], self.num_worker)
 
             self.autoencode(
                     real1_batch, self.model_dir, idx=os.path.join(root_path, "test{}_real1".format(step)))
@@ -611,118 +999,22 @@ class Trainer(object):
 
         save_image(all_G_z, '{}/all_G_z.png'.format(root_path), nrow=16)
 
-    def encode_save(self, data_path, scale_size):
-        DETECTOR = dlib.get_frontal_face_detector()
-        for ext in ["jpg", "png"]:
-            paths = glob("{}/*.{}".format(data_path, ext))      # paths is a list of pictures
-            if len(paths) != 0:                                 # break
-                break
-
-        if not os.path.isdir("./encode"):
-            os.mkdir('encode')
-
-        paths.sort()
-        for i, pic_path in enumerate(paths):
-            basename = os.path.basename(pic_path)[:-4]
-            try:
-                try:
-                    im_bgr = cv2.imread(pic_path)
-                    gray = cv2.cvtColor(im_bgr, cv2.COLOR_BGR2GRAY)
-                    im = cv2.cvtColor(im_bgr, cv2.COLOR_BGR2RGB)
-                    face_rect = DETECTOR(gray, 2)[0]
-                    (x, y, w, h) = rect_to_bb(face_rect)
-                    im = im[max(y-50, 0):(y+h-10), max(x-25, 0):(x+w+25)]
-                    im = Image.fromarray(im)
-                except Exception as e:
-                    im_bgr = cv2.imread(pic_path)
-                    im = cv2.cvtColor(im_bgr, cv2.COLOR_BGR2RGB)
-                    print('[!] Warning: face detection and cropping failed.')
-                    print(e)
-                im = im.resize((scale_size, scale_size), Image.NEAREST)
-                im = np.array(im, dtype=np.float32)
-                im = np.expand_dims(im, axis=0)
-                print(pic_path)
-                print('Type:', type(im))
-                print('Shape:', im.shape)
-                print('Max:', np.max(im), 'Min:', np.min(im))
-                encode = self.encode(im)
-
-                decode = self.decode(encode)
-                # save_image(decode, './encode/' + os.path.basename(pic_path)[:-4] + '_encode.jpg')
-                decode = decode.astype(dtype=np.uint8)
-                save_image_simple(decode[0, :, :, :], './encode/{}_encode.jpg'.format(basename))
-            except Exception as e:
-                print('[!] Encoding failed on {}.'.format(basename))
-                print(e)
-
-
-    def interpolate_encode_save(self, data_path1, data_path2, scale_size, ratio=0.5):
-        DETECTOR = dlib.get_frontal_face_detector()
-        for ext in ["jpg", "png"]:
-            paths1 = glob("{}/*.{}".format(data_path1, ext))      # paths is a list of pictures
-            paths2 = glob("{}/*.{}".format(data_path2, ext))      # paths is a list of pictures
-            if len(paths1) != 0:
-                break
-
-        if not os.path.isdir("./interpolate"):
-            os.mkdir('interpolate')
-
-        paths1.sort()
-        paths2.sort()
-
-        for i, pic_path in enumerate(paths1):
-            basename = os.path.basename(pic_path)[:-4]
-            try:
-                try:
-                    im_bgr1 = cv2.imread(pic_path)
-                    im_bgr2 = cv2.imread(paths2[i])
-                    gray1 = cv2.cvtColor(im_bgr1, cv2.COLOR_BGR2GRAY)
-                    gray2 = cv2.cvtColor(im_bgr2, cv2.COLOR_BGR2GRAY)
-                    im1 = cv2.cvtColor(im_bgr1, cv2.COLOR_BGR2RGB)
-                    im2 = cv2.cvtColor(im_bgr2, cv2.COLOR_BGR2RGB)
-                    face_rect1 = DETECTOR(gray1, 2)[0]
-                    face_rect2 = DETECTOR(gray2, 2)[0]
-                    (x1, y1, w1, h1) = rect_to_bb(face_rect1)
-                    (x2, y2, w2, h2) = rect_to_bb(face_rect2)
-                    im1 = im1[max(y1-50, 0):(y1+h1-10), max(x1-25, 0):(x1+w1+25)]
-                    im2 = im2[max(y2-50, 0):(y2+h2-10), max(x2-25, 0):(x2+w2+25)]
-                    im1 = Image.fromarray(im1)
-                    im2 = Image.fromarray(im2)
-                except Exception as e:
-                    im_bgr1 = cv2.imread(pic_path)
-                    im_bgr2 = cv2.imread(paths2[i])
-                    im1 = cv2.cvtColor(im_bgr1, cv2.COLOR_BGR2RGB)
-                    im2 = cv2.cvtColor(im_bgr2, cv2.COLOR_BGR2RGB)
-                    print('[!] Warning: face detection and cropping failed.')
-                    print(e)
-                im1 = im1.resize((scale_size, scale_size), Image.NEAREST)
-                im2 = im2.resize((scale_size, scale_size), Image.NEAREST)
-                im1 = np.array(im1, dtype=np.float32)
-                im2 = np.array(im2, dtype=np.float32)
-                im1 = np.expand_dims(im1, axis=0)
-                im2 = np.expand_dims(im2, axis=0)
-                encode1 = self.encode(im1)
-                encode2 = self.encode(im2)
-
-                decodes = []
-                for idx, ratio in enumerate([ratio]):
-                    z = np.stack([slerp(ratio, r1, r2) for r1, r2 in zip(encode1, encode2)])
-                    z_decode = self.decode(z)
-                    decodes.append(z_decode)
-
-                decodes = np.stack(decodes).transpose([1, 0, 2, 3, 4])
-                decodes = decodes.astype(dtype=np.uint8)
-                save_image_simple(decodes[0, 0, :, :, :], './interpolate/{}.jpg'.format(basename))
-                _im1 = (im1[0, :, :, :]).astype(dtype=np.uint8)
-                _im2 = (im2[0, :, :, :]).astype(dtype=np.uint8)
-                concat = np.concatenate([_im1, decodes[0, 0, :, :, :], _im2], axis=1)
-                save_image_simple(concat, './interpolate/{}_interp.jpg'.format(basename))
-            except KeyboardInterrupt:
-                raise
-            except Exception as e:
-                print('[!] Encoding failed on {}.'.format(basename))
-                print(e)
+    def get_triplet_tensors(self):
+        if self.triplet_loader is not None:
+            return self.triplet_loader
+        batch = self.data_loader
+        return batch[:, :, :128, :], batch[:, :, 128:256, :], batch[:, :, 256:, :]
+
+    def get_triplet_from_loader(self):
+        if self.triplet_loader is None:
+            # stitched [dad | kid | mom] images from the regular loader
+            batch = self.get_image_from_loader()
+            return batch[:, :, :128, :], batch[:, :, 128:256, :], batch[:, :, 256:, :]
 
+        triplet = self.sess.run(self.triplet_loader)
+        if self.data_format == 'NCHW':
+            triplet = [x.transpose([0, 2, 3, 1]) for x in triplet]
+        return tuple(triplet)
 
     def get_image_from_loader(self):
         x = self.data_loader.eval(session=self.sess)
@@ -0,0 +1,145 @@
+"""
+Sharded TFRecords for the stitched dad/kid/mom post-train dataset.
+
+Each stitched image is `[dad | kid | mom]` side by side. The exporter
+stores the three faces as separate raw uint8 features so the reader
+never decodes or slices the wide image again.
+
+    $ python triplet_records.py --posttrain_data_path=data/stitched --posttrain_records=data/stitched_records
+    $ python main.py --is_posttrain=True --posttrain_records=data/stitched_records --load_path=...
+"""
+from __future__ import print_function
+
+import os
+import json
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from glob import glob
+from multiprocessing import Pool
+
+from data_loader import get_paths
+from input_metrics import register_input
+
+FACES = ['dad', 'kid', 'mom']
+META_NAME = 'triplets.json'
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+def _int64_feature(value):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+
+def split_triplet(image):
+    width = image.shape[1] // 3
+    return [image[:, idx*width:(idx+1)*width] for idx in range(3)]
+
+def _write_shard(args):
+    shard_path, paths = args
+    shape = None
+    with tf.python_io.TFRecordWriter(shard_path) as writer:
+        for path in paths:
+            with Image.open(path) as img:
+                image = np.array(img.convert('RGB'), dtype=np.uint8)
+            faces = split_triplet(image)
+            shape = faces[0].shape
+
+            feature = {
+                'height': _int64_feature(shape[0]),
+                'width': _int64_feature(shape[1]),
+            }
+            for name, face in zip(FACES, faces):
+                feature[name] = _bytes_feature(np.ascontiguousarray(face).tobytes())
+
+            example = tf.train.Example(features=tf.train.Features(feature=feature))
+            writer.write(example.SerializeToString())
+    return shard_path, len(paths), shape
+
+def export_triplets(src_dir, out_dir, num_shards=16, num_worker=4):
+    _, paths = get_paths(src_dir)
+    if len(paths) == 0:
+        raise Exception("[!] No images found in {}".format(src_dir))
+    paths.sort()
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    num_shards = min(num_shards, len(paths))
+    args = [(os.path.join(out_dir, 'triplets-{:05d}-of-{:05d}.tfrecord'.format(idx, num_shards)),
+             paths[idx::num_shards]) for idx in range(num_shards)]
+
+    pool = Pool(num_worker)
+    try:
+        results = pool.map(_write_shard, args)
+    finally:
+        pool.close()
+        pool.join()
+
+    shapes = set(tuple(shape) for _, _, shape in results)
+    if len(shapes) != 1:
+        raise Exception("[!] Triplets have different face shapes: {}".format(shapes))
+
+    meta = {
+        'num_examples': len(paths),
+        'num_shards': num_shards,
+        'shape': list(shapes.pop()),
+    }
+    with open(os.path.join(out_dir, META_NAME), 'w') as fp:
+        json.dump(meta, fp, indent=4)
+
+    print("[*] Wrote {} triplets into {} shards in {}".format(len(paths), num_shards, out_dir))
+    return meta
+
+def get_triplet_loader(records_dir, batch_size, data_format, seed=None,
+                       num_worker=4, shuffle_buffer=5000, prefetch_size=2,
+                       shard_index=0, num_shards=1):
+    """Returns `(dad, kid, mom)` float tensors in [0, 255]."""
+    with open(os.path.join(records_dir, META_NAME)) as fp:
+        shape = json.load(fp)['shape']
+
+    def parse(serialized):
+        features = tf.parse_single_example(
+                serialized, {name: tf.FixedLenFeature([], tf.string) for name in FACES})
+        faces = []
+        for name in FACES:
+            face = tf.reshape(tf.decode_raw(features[name], tf.uint8), shape)
+            faces.append(face)
+        return tuple(faces)
+
+    pattern = os.path.join(records_dir, '*.tfrecord')
+    if num_shards > 1:
+        # every worker reads a disjoint subset of the record files
+        names = sorted(glob(pattern))[shard_index::num_shards]
+        if len(names) == 0:
+            raise Exception("[!] Shard {} of {} has no record files".format(shard_index, num_shards))
+        files = tf.data.Dataset.from_tensor_slices(names).shuffle(len(names), seed=seed)
+    else:
+        files = tf.data.Dataset.list_files(pattern, shuffle=True, seed=seed)
+    files = files.repeat()
+    # read from `num_worker` shards at once
+    dataset = files.apply(tf.contrib.data.parallel_interleave(
+            tf.data.TFRecordDataset, cycle_length=num_worker, sloppy=True))
+    dataset = dataset.shuffle(shuffle_buffer, seed=seed)
+    dataset = dataset.map(parse, num_parallel_calls=num_worker)
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    dataset = dataset.prefetch(prefetch_size)
+
+    faces = dataset.make_one_shot_iterator().get_next(name='triplet_inputs')
+    register_input(faces[0])
+
+    outputs = []
+    for face in faces:
+        if data_format == 'NCHW':
+            face = tf.transpose(face, [0, 3, 1, 2])
+        outputs.append(tf.to_float(face))
+    return tuple(outputs)
+
+
+if __name__ == "__main__":
+    from config import get_config
+
+    config, unparsed = get_config()
+    if not config.posttrain_data_path or not config.posttrain_records:
+        raise Exception("[!] Specify both `posttrain_data_path` and `posttrain_records`")
+    export_triplets(config.posttrain_data_path, config.posttrain_records,
+                    config.num_shards, config.num_worker)
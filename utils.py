@@ -4,9 +4,16 @@ import os
 import math
 import json
 import logging
+import threading
 import numpy as np
 from PIL import Image
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
 
 def prepare_dirs_and_logger(config):
     formatter = logging.Formatter("%(asctime)s:%(levelname)s::%(message)s")
@@ -49,6 +56,9 @@ def prepare_dirs_and_logger(config):
         if not os.path.exists(path):
             os.makedirs(path)
 
+    set_image_options(format=config.image_format or None,
+                      compress_level=config.compress_level)
+
 def get_time():
     return datetime.now().strftime("%m%d_%H%M%S")
 
@@ -61,36 +71,180 @@ def save_config(config):
     with open(param_path, 'w') as fp:
         json.dump(config.__dict__, fp, indent=4, sort_keys=True)
 
+def slerp_batch(low, high, ratios, eps=1e-6):
+    """Slerp between [N, z] endpoints for [R] ratios, returns [N, R, z].
+
+    Code based on https://github.com/soumith/dcgan.torch/issues/14
+    """
+    low, high = np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)
+    ratios = np.asarray(ratios, dtype=np.float64).reshape([1, -1, 1])
+
+    low_norm = low / np.linalg.norm(low, axis=1, keepdims=True)
+    high_norm = high / np.linalg.norm(high, axis=1, keepdims=True)
+    omega = np.arccos(np.clip(np.sum(low_norm * high_norm, 1), -1, 1))[:, None, None]
+    so = np.sin(omega)
+
+    # L'Hopital's rule/LERP for rows that are (nearly) parallel
+    parallel = np.abs(so) < eps
+    safe_so = np.where(parallel, 1., so)
+
+    low, high = low[:, None, :], high[:, None, :]
+    lerp = (1.0-ratios) * low + ratios * high
+    slerp = np.sin((1.0-ratios)*omega) / safe_so * low + np.sin(ratios*omega) / safe_so * high
+    return np.where(parallel, lerp, slerp)
+
+def slerp(val, low, high):
+    return slerp_batch(low[None], high[None], [val])[0, 0]
+
 def rank(array):
     return len(array.shape)
 
+# defaults of `save_image`, set once from the config with `set_image_options`
+IMAGE_OPTIONS = {
+    'format': None,         # None keeps the extension of the filename
+    'compress_level': 6,    # png zlib level, 0 (fastest) - 9 (smallest)
+    'quality': 95,          # jpeg quality
+}
+
+def set_image_options(**options):
+    for key, value in options.items():
+        if key not in IMAGE_OPTIONS:
+            raise Exception("[!] Unknown image option: {}".format(key))
+        if value is not None:
+            IMAGE_OPTIONS[key] = value
+
+def to_uint8(tensor, normalize=False, scale_each=False):
+    """Float or uint8 images in [0, 255] to clipped uint8.
+
+    `normalize` stretches the [min, max] of the batch, or of every image
+    with `scale_each`, to [0, 255].
+    """
+    tensor = np.asarray(tensor)
+    if normalize:
+        tensor = tensor.astype(np.float32)
+        axes = tuple(range(1, tensor.ndim)) if scale_each else None
+        low = tensor.min(axis=axes, keepdims=True)
+        high = tensor.max(axis=axes, keepdims=True)
+        tensor = (tensor - low) / np.maximum(high - low, 1e-5) * 255.
+    if tensor.dtype == np.uint8:
+        return tensor
+    return np.clip(tensor, 0, 255).astype(np.uint8)
+
 def make_grid(tensor, nrow=8, padding=2,
               normalize=False, scale_each=False):
     """Code based on https://github.com/pytorch/vision/blob/master/torchvision/utils.py"""
-    nmaps = tensor.shape[0]
+    tensor = to_uint8(tensor, normalize, scale_each)
+    if tensor.ndim == 3:
+        tensor = tensor[..., None]
+    if tensor.shape[3] == 1:
+        tensor = np.repeat(tensor, 3, 3)
+
+    nmaps, height, width, channel = tensor.shape
     xmaps = min(nrow, nmaps)
     ymaps = int(math.ceil(float(nmaps) / xmaps))
-    height, width = int(tensor.shape[1] + padding), int(tensor.shape[2] + padding)
-    grid = np.zeros([height * ymaps + 1 + padding // 2, width * xmaps + 1 + padding // 2, 3], dtype=np.uint8)
-    k = 0
-    for y in range(ymaps):
-        for x in range(xmaps):
-            if k >= nmaps:
-                break
-            h, h_width = y * height + 1 + padding // 2, height - padding
-            w, w_width = x * width + 1 + padding // 2, width - padding
-
-            grid[h:h+h_width, w:w+w_width] = tensor[k]
-            k = k + 1
-    return grid
+
+    # every cell is an image padded by `padding` on the bottom and right,
+    # the last row may have empty cells
+    cells = np.pad(tensor, [(0, xmaps * ymaps - nmaps), (0, padding), (0, padding), (0, 0)], 'constant')
+    grid = cells.reshape([ymaps, xmaps, height + padding, width + padding, channel])
+    grid = grid.transpose([0, 2, 1, 3, 4]).reshape(
+            [ymaps * (height + padding), xmaps * (width + padding), channel])
+
+    offset = 1 + padding // 2
+    return np.pad(grid, [(offset, 0), (offset, 0), (0, 0)], 'constant')
+
+def save_array(ndarr, filename, format=None, compress_level=None, quality=None):
+    format = format or IMAGE_OPTIONS['format']
+    if format:
+        filename = '{}.{}'.format(os.path.splitext(filename)[0], format)
+    im = Image.fromarray(to_uint8(ndarr))
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.png':
+        if compress_level is None:
+            compress_level = IMAGE_OPTIONS['compress_level']
+        im.save(filename, compress_level=compress_level)
+    elif ext in ['.jpg', '.jpeg']:
+        im.save(filename, quality=quality or IMAGE_OPTIONS['quality'])
+    else:
+        im.save(filename)
+    return filename
 
 def save_image(tensor, filename, nrow=8, padding=2,
-               normalize=False, scale_each=False):
+               normalize=False, scale_each=False, **options):
     ndarr = make_grid(tensor, nrow=nrow, padding=padding,
                             normalize=normalize, scale_each=scale_each)
-    im = Image.fromarray(ndarr)
-    im.save(filename)
+    return save_array(ndarr, filename, **options)
+
+def save_images(items, num_worker=4, **kwargs):
+    """`save_image` for a list of (tensor, filename), encoded on `num_worker` threads."""
+    if num_worker <= 1 or len(items) <= 1:
+        return [save_image(tensor, filename, **kwargs) for tensor, filename in items]
+    # PIL releases the GIL while encoding so threads are enough
+    pool = ThreadPool(min(num_worker, len(items)))
+    try:
+        return pool.map(lambda item: save_image(item[0], item[1], **kwargs), items)
+    finally:
+        pool.close()
 
 def save_image_simple(ndarr, filename):
-    im = Image.fromarray(ndarr)
-    im.save(filename)
+    return save_array(ndarr, filename)
+
+class BackgroundWriter(object):
+    """Runs write calls on a daemon thread fed by a bounded queue.
+
+    When the queue is full `put` blocks with policy 'block' and skips
+    the write with policy 'drop'. `put_blocking` always waits, for
+    writes that must not be lost such as checkpoints.
+    """
+
+    def __init__(self, maxsize=64, policy='block'):
+        if policy not in ['block', 'drop']:
+            raise Exception("[!] Unknown writer policy: {}".format(policy))
+        self.policy = policy
+        self.dropped = 0
+        self.failed = 0
+
+        self.queue = Queue(maxsize)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, fn, *args, **kwargs):
+        if self.policy == 'block':
+            # blocks when the queue is full so memory stays bounded
+            self.queue.put((fn, args, kwargs))
+            return True
+        try:
+            self.queue.put_nowait((fn, args, kwargs))
+            return True
+        except Full:
+            self.dropped += 1
+            return False
+
+    def put_blocking(self, fn, *args, **kwargs):
+        self.queue.put((fn, args, kwargs))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    break
+                fn, args, kwargs = item
+                fn(*args, **kwargs)
+            except Exception as e:
+                self.failed += 1
+                logging.getLogger().error("[!] Background write failed: {}".format(e))
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Wait until every queued write is done."""
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.dropped:
+            logging.getLogger().warning("[!] Dropped {} background writes".format(self.dropped))